@@ -1,36 +1,55 @@
-import requests
+import functools
+import inspect
 import logging
-from config import *
+
+import requests
+
+import metrics
+from config import settings
 
 logger = logging.getLogger(__name__)
 
+
 def time_request(remote):
     """Returns a decorator that measures execution time."""
-    return METRIC_OUTBOUND_LATENCY.labels(remote).time()
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with metrics.METRIC_OUTBOUND_LATENCY.labels(remote).time():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.METRIC_OUTBOUND_LATENCY.labels(remote).time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
 
 @time_request("telegram")
 def telegram(message):
-    if not telegram_token:
+    if not settings.telegram_token:
         return
 
     try:
         requests.post(
-            f"https://api.telegram.org/bot{telegram_token}/sendMessage",
-            json={'chat_id': telegram_chat_id, 'text': message},
-            timeout=alert_http_timeout
+            f"https://api.telegram.org/bot{settings.telegram_token}/sendMessage",
+            json={'chat_id': settings.telegram_chat_id, 'text': message},
+            timeout=settings.alert_http_timeout
         )
     except:
         logger.exception("Error while sending telegram alert")
-        METRIC_OUTBOUND_ERROR.labels('telegram').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('telegram').inc()
 @time_request("slack")
 def slack(message):
-    if not slackurl:
+    if not settings.slackurl:
         return
 
     try:
-        requests.post(slackurl, json={"text": message}, timeout=alert_http_timeout)
+        requests.post(settings.slackurl, json={"text": message}, timeout=settings.alert_http_timeout)
     except:
-        METRIC_OUTBOUND_ERROR.labels('slack').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('slack').inc()
         logger.exception("Error while sending Slack alert")
 
-# Add any other alert-related functions
\ No newline at end of file
+# Add any other alert-related functions
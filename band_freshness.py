@@ -0,0 +1,79 @@
+"""
+Staleness tracking for Band standard dataset quotes.
+
+Band's request_prices serves the result of the last oracle request for each symbol, however old. For every
+symbol the tracker keeps the last request_id and resolve_time seen, and when that request_id was first seen.
+A quote is stale once it is older than BAND_STALE_WINDOW seconds - by its resolve_time, or by how long the
+request_id hasn't advanced when Band doesn't report one. Stale quotes are dropped before they can reach a vote:
+the FX rate falls back to the other FX sources (or abstains), and the Osmosis base price, which needs the
+quote asset's Band price, is skipped.
+
+Consumers skip reprocessing unchanged quotes by keying what they derive from a quote on its request_id - the
+Band FX source keeps its rates until the symbol's request_id changes.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QuoteState:
+    request_id: Optional[str]
+    resolve_time: Optional[float]
+    first_seen: float  # local time this request_id was first seen
+
+    def age(self, now: float) -> float:
+        return now - (self.resolve_time if self.resolve_time else self.first_seen)
+
+
+class BandFreshness:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.quotes: Dict[str, QuoteState] = {}
+
+    def observe(self, symbol: str, request_id: Optional[str], resolve_time: Optional[float],
+                now: Optional[float] = None):
+        """Record the quote seen for symbol, a new one if its request_id changed."""
+        now = now or time.time()
+        with self._lock:
+            previous = self.quotes.get(symbol)
+            if previous is not None and previous.request_id == request_id:
+                return
+            self.quotes[symbol] = QuoteState(request_id, resolve_time, now)
+        if previous is not None:
+            metrics.METRIC_BAND_QUOTE_UPDATES.labels(symbol).inc()
+
+    def is_stale(self, symbol: str, now: Optional[float] = None) -> bool:
+        with self._lock:
+            state = self.quotes.get(symbol)
+        if state is None:
+            return False
+        age = state.age(now or time.time())
+        metrics.METRIC_BAND_QUOTE_AGE.labels(symbol).set(age)
+        return age > settings.band_stale_window
+
+    def fresh(self, result: dict) -> dict:
+        """The quotes of a get_band_standard_dataset result that aren't stale."""
+        now = time.time()
+        fresh = {}
+        for symbol, quote in result.items():
+            resolve_time = quote.get("resolve_time")
+            self.observe(symbol, quote.get("request_id"), float(resolve_time) if resolve_time else None, now)
+            stale = self.is_stale(symbol, now)
+            metrics.METRIC_BAND_QUOTE_STALE.labels(symbol).set(1 if stale else 0)
+            if stale:
+                logger.warning(f"Band quote for {symbol} is stale: request {quote.get('request_id')} is "
+                               f"{self.quotes[symbol].age(now):.0f}s old")
+                continue
+            fresh[symbol] = quote
+        return fresh
+
+
+freshness = BandFreshness()
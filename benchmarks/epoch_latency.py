@@ -0,0 +1,231 @@
+#!/usr/bin/python3 -u
+# -*- coding: utf-8 -*-
+"""
+End-to-end epoch latency benchmark - runs the real Orchestrator, price_feeder and vote_handler against local
+chain stubs (benchmarks/chain_stub.py: LCD, Tendermint RPC, Band, Osmosis and a fake symphonyd) and measures
+how long after each epoch boundary the vote is confirmed.
+
+    python benchmarks/epoch_latency.py                              # every configuration
+    python benchmarks/epoch_latency.py --config baseline --epochs 5
+    python benchmarks/epoch_latency.py --save-baseline epoch_baseline.json
+    python benchmarks/epoch_latency.py --baseline epoch_baseline.json --threshold 0.2
+    python benchmarks/epoch_latency.py --broadcast-mode sync
+    python benchmarks/epoch_latency.py --config large-blocks --grpc-queries latest_block,epochs,misses,prevote,tx
+
+Stages, per epoch, in seconds:
+    detect     epoch boundary -> the orchestrator starts fetching prices, or voting speculatively prepared ones
+    prices     price fetch (swap, fx, osmosis, params, validation)
+    broadcast  prices ready -> first tx received by the stub RPC
+    confirm    first tx received -> votes confirmed (block + indexing + tx check)
+    total      epoch boundary -> votes confirmed
+
+Exits non zero if a stage p95 regresses by more than --threshold against --baseline, or total p95 exceeds --budget.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from chain_stub import FEEDER_ADDRESS, REPO_ROOT, ChainStub, StubConfig
+
+import block_clock  # noqa: E402 - chain_stub puts the repo root on sys.path
+import config
+import http_client
+import orchestrator
+import tx_broadcast
+
+CONFIGS = {
+    "baseline": StubConfig(),
+    "slow-blocks": StubConfig(block_time=2.5, epoch_duration=16.0),
+    "lagging-indexer": StubConfig(indexing_lag=1.5),
+    "flaky-lcd": StubConfig(error_rate=0.1),
+    "large-blocks": StubConfig(block_size=512 * 1024),
+    "dropping-mempool": StubConfig(drop_rate=0.2),
+    "stalled-lcd": StubConfig(stalled_lcd=True),
+}
+STAGES = ["detect", "prices", "broadcast", "confirm", "total"]
+# stage regressions smaller than this are noise from the one second polling
+MIN_REGRESSION_S = 0.25
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarise(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+    }
+
+
+async def _run_epochs(orch: orchestrator.Orchestrator, finished: Dict[int, float], epochs: int, timeout: float):
+    task = asyncio.ensure_future(orch.run())
+    deadline = time.monotonic() + timeout
+    try:
+        while len(finished) < epochs and time.monotonic() < deadline and not task.done():
+            await asyncio.sleep(0.1)
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def run_config(name: str, stub_config: StubConfig, epochs: int, broadcast_mode: str = "cli",
+               grpc_queries: str = "") -> dict:
+    """Run the feeder against a fresh stub for epochs + 1 epochs; the first is a prevote only warm up."""
+    stub = ChainStub(stub_config).start(grpc=bool(grpc_queries))
+    saved_env = dict(os.environ)
+    saved = {attr: getattr(orchestrator, attr) for attr in ("get_prices", "process_votes_for_validators")}
+    prices_started, prices_done, finished = {}, {}, {}
+
+    def get_prices(epoch=None):
+        prices_started.setdefault(epoch, time.time())
+        try:
+            return saved["get_prices"](epoch)
+        finally:
+            prices_done[epoch] = time.time()
+
+    def process_votes_for_validators(prices, vote_states, epoch, identities=None, prepared=None):
+        prices_started.setdefault(epoch, time.time())
+        prices_done.setdefault(epoch, time.time())
+        try:
+            return saved["process_votes_for_validators"](prices, vote_states, epoch, identities, prepared)
+        finally:
+            finished[epoch] = time.time()
+
+    try:
+        os.environ.update(stub.env())
+        os.environ["BROADCAST_MODE"] = broadcast_mode
+        os.environ["GRPC_QUERIES"] = grpc_queries
+        for var in ("TELEGRAM_TOKEN", "SLACK_URL", "PRICE_FEED_MODE", "HA_LEASE_FILE", "RECORD_FILE"):
+            os.environ[var] = ""
+        config.get_settings.cache_clear()
+        block_clock.estimator.reset()  # every stub is a new chain starting at height 1
+        tx_broadcast.reset_sequence(FEEDER_ADDRESS)
+        http_client.pool.endpoints.clear()
+        orchestrator.get_prices = get_prices
+        orchestrator.process_votes_for_validators = process_votes_for_validators
+
+        orch = orchestrator.Orchestrator()
+        timeout = (epochs + 2) * stub_config.epoch_duration * 2
+        asyncio.run(_run_epochs(orch, finished, epochs + 1, timeout))
+    finally:
+        orchestrator.get_prices = saved["get_prices"]
+        orchestrator.process_votes_for_validators = saved["process_votes_for_validators"]
+        os.environ.clear()
+        os.environ.update(saved_env)
+        config.get_settings.cache_clear()
+        stub.stop()
+
+    samples = defaultdict(list)
+    for epoch in sorted(finished)[1:]:
+        boundary = stub.epoch_start(epoch)
+        if epoch not in prices_started or epoch not in prices_done:
+            continue
+        broadcasts = [tx.broadcast_at for tx in stub.broadcasts if tx.broadcast_at >= prices_done[epoch]]
+        samples["detect"].append(prices_started[epoch] - boundary)
+        samples["prices"].append(prices_done[epoch] - prices_started[epoch])
+        if broadcasts:
+            samples["broadcast"].append(min(broadcasts) - prices_done[epoch])
+            samples["confirm"].append(finished[epoch] - min(broadcasts))
+        samples["total"].append(finished[epoch] - boundary)
+
+    return {
+        "config": {field: getattr(stub_config, field) for field in
+                   ("block_time", "epoch_duration", "indexing_lag", "error_rate", "block_size", "latency",
+                    "drop_rate", "stalled_lcd")},
+        "epochs": max(len(finished) - 1, 0),
+        "requests_per_epoch": round(stub.requests / max(len(finished), 1), 1),
+        "stages": {stage: summarise(samples[stage]) for stage in STAGES if samples[stage]},
+    }
+
+
+def check_regressions(results: dict, baseline: dict, threshold: float, budget: float) -> List[str]:
+    failures = []
+    for name, result in results.items():
+        if result["epochs"] == 0:
+            failures.append(f"{name}: no epoch was voted")
+            continue
+        total = result["stages"].get("total")
+        if budget and total and total["p95"] > budget:
+            failures.append(f"{name}: total p95 {total['p95']:.3f}s over budget {budget:.3f}s")
+        for stage, stats in result["stages"].items():
+            previous = baseline.get(name, {}).get("stages", {}).get(stage)
+            if not previous:
+                continue
+            limit = max(previous["p95"] * (1 + threshold), previous["p95"] + MIN_REGRESSION_S)
+            if stats["p95"] > limit:
+                failures.append(f"{name}/{stage}: p95 {stats['p95']:.3f}s vs baseline {previous['p95']:.3f}s")
+    return failures
+
+
+def print_results(results: dict):
+    print(f"{'config':<18}{'stage':<11}{'count':>6}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for name, result in results.items():
+        for stage in STAGES:
+            stats = result["stages"].get(stage)
+            if stats:
+                print(f"{name:<18}{stage:<11}{stats['count']:>6}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}")
+        print(f"{name:<18}{'requests/epoch':<17}{result['requests_per_epoch']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end epoch latency benchmark against local chain stubs")
+    parser.add_argument("--config", action="append", choices=sorted(CONFIGS),
+                        help="configuration to run, repeatable (default: all)")
+    parser.add_argument("--epochs", type=int, default=3, help="measured epochs per configuration")
+    parser.add_argument("--epoch-seconds", type=float, help="override the epoch duration of every configuration")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--save-baseline", help="write the results as JSON to this file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 regression against the baseline")
+    parser.add_argument("--budget", type=float, default=0.0, help="fail if total p95 exceeds this many seconds")
+    parser.add_argument("--broadcast-mode", default="cli", choices=["cli", "sync", "async"],
+                        help="BROADCAST_MODE of the feeder")
+    parser.add_argument("--grpc-queries", default="",
+                        help="GRPC_QUERIES of the feeder, i.e latest_block,epochs,misses,prevote,tx (needs grpcio)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--log-level", default="CRITICAL")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    os.chdir(REPO_ROOT)
+
+    results = {}
+    for name in args.config or list(CONFIGS):
+        stub_config = CONFIGS[name]
+        if args.epoch_seconds:
+            stub_config = StubConfig(**dict(vars(stub_config), epoch_duration=args.epoch_seconds))
+        results[name] = run_config(name, stub_config, args.epochs, args.broadcast_mode, args.grpc_queries)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = check_regressions(results, baseline, args.threshold, args.budget)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
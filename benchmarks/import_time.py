@@ -0,0 +1,75 @@
+#!/usr/bin/python3 -u
+# -*- coding: utf-8 -*-
+"""
+Cold start benchmark - measures how long importing each entrypoint takes in a fresh interpreter
+using `python -X importtime`, so container restarts stay fast.
+
+    python benchmarks/import_time.py                     # main, pre_flight_check, telegram_tools
+    python benchmarks/import_time.py main --budget-ms 400 --runs 7
+
+Exits non zero if the median cumulative import time of any module exceeds --budget-ms.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["main", "pre_flight_check", "telegram_tools"]
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """Parse `-X importtime` output into {module: (self_us, cumulative_us)}."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            timings[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return timings
+
+
+def measure(module: str) -> Dict[str, Tuple[int, int]]:
+    # importing must not read .env or touch the network, so only the import itself is timed
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE="")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=REPO_ROOT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def run(modules: List[str], runs: int, budget_ms: float, top: int) -> bool:
+    ok = True
+    for module in modules:
+        samples = []
+        last = {}
+        for _ in range(runs):
+            last = measure(module)
+            samples.append(last[module][1] / 1000)
+        median_ms = statistics.median(samples)
+        status = "ok" if median_ms <= budget_ms else "OVER BUDGET"
+        ok = ok and median_ms <= budget_ms
+        print(f"{module}: median {median_ms:.1f} ms, min {min(samples):.1f} ms over {runs} runs "
+              f"(budget {budget_ms:.0f} ms) {status}")
+        heaviest = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (self_us, cumulative_us) in heaviest:
+            print(f"    {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "250")))
+    parser.add_argument("--top", type=int, default=8, help="show the N heaviest imports by self time")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.modules, args.runs, args.budget_ms, args.top) else 1)
@@ -0,0 +1,101 @@
+"""
+Block time estimation.
+
+Every block header seen by get_latest_block is fed to the process wide `estimator`, which keeps an EWMA and
+variance of the block interval from the header timestamps and the offset between header time and local time.
+Polls and sleeps that wait for the chain (the block tracker, tx indexing) are scheduled for the
+expected arrival of the next block plus a small guard instead of fixed intervals.
+"""
+import calendar
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_block_time(block_time: str) -> float:
+    """Unix timestamp of an RFC3339 block header time such as 2024-05-01T12:00:00.123456789Z."""
+    value = block_time.rstrip("Z")
+    value, _, fraction = value.partition(".")
+    seconds = calendar.timegm(time.strptime(value, "%Y-%m-%dT%H:%M:%S"))
+    return seconds + (float(f"0.{fraction}") if fraction else 0.0)
+
+
+class BlockTimeEstimator:
+    """EWMA of block intervals from observed headers, used to predict when the next block will be visible."""
+
+    def __init__(self, alpha: float = 0.2, offset_window: int = 20):
+        self.alpha = alpha
+        self.offset_window = offset_window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all observations, i.e when switching to a different chain."""
+        with self._lock:
+            self.interval: Optional[float] = None
+            self.variance = 0.0
+            self.height: Optional[int] = None
+            self.header_time: Optional[float] = None
+            # local arrival time - header time; the smallest recent value is the clock offset plus propagation delay
+            self._offsets = deque(maxlen=self.offset_window)
+
+    def observe(self, height: int, block_time: str, observed_at: Optional[float] = None):
+        observed_at = observed_at or time.time()
+        try:
+            header_time = parse_block_time(block_time)
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Unparseable block time {block_time}: {e}")
+            return
+
+        with self._lock:
+            if self.height is not None and height <= self.height:
+                return
+            if self.height is not None and header_time > self.header_time:
+                sample = (header_time - self.header_time) / (height - self.height)
+                if self.interval is None:
+                    self.interval = sample
+                else:
+                    delta = sample - self.interval
+                    self.interval += self.alpha * delta
+                    self.variance = (1 - self.alpha) * (self.variance + self.alpha * delta * delta)
+                metrics.METRIC_BLOCK_INTERVAL.set(self.interval)
+            self.height, self.header_time = height, header_time
+            self._offsets.append(observed_at - header_time)
+
+    @property
+    def stddev(self) -> float:
+        return self.variance ** 0.5
+
+    def next_block_at(self) -> Optional[float]:
+        """Local time at which the block after the last observed one should be visible, None until two blocks were seen."""
+        with self._lock:
+            if self.interval is None or not self._offsets:
+                return None
+            return self.header_time + min(self._offsets) + self.interval
+
+    def guard(self) -> float:
+        """Margin added after the expected block time, grows with the jitter of block intervals."""
+        return settings.block_poll_guard + self.stddev
+
+    def delay_until_next_block(self, default: float, minimum: float = 0.1, maximum: Optional[float] = None) -> float:
+        """Seconds to sleep before polling for a new block; default until an interval has been estimated."""
+        expected = self.next_block_at()
+        if expected is None:
+            return default
+        delay = expected + self.guard() - time.time()
+        if delay < minimum:
+            # the block is late - re-poll soon, backing off the longer it is overdue (i.e. a halted chain)
+            delay = max(self.guard(), min(-delay / 2, self.interval), minimum)
+        if maximum is not None:
+            delay = min(delay, maximum)
+        return delay
+
+
+estimator = BlockTimeEstimator()
@@ -0,0 +1,109 @@
+"""
+Header-only polling of the chain head.
+
+get_latest_block polls the latest block every second, more often while waiting for a block, but only reads
+the height and time of its header. BLOCK_SOURCE picks where they come from:
+
+    lcd   blocks/latest, streamed and closed as soon as the header object is complete - the block's txs are
+          neither downloaded in full nor parsed (default, same endpoint as before)
+    rpc   the Tendermint RPC /status, a small reply whatever the block size
+
+JSON is decoded with orjson when it is installed. Concurrent polls share one fetch (http_client single-flight).
+The bytes read and the CPU time spent per poll are exported per source.
+"""
+import json
+import logging
+import re
+import time
+from typing import Optional, Tuple
+
+import requests
+
+import metrics
+from config import settings
+from http_client import flights, lcd_get
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # optional, a faster drop in for json.loads
+    loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+LATEST_BLOCK = "/cosmos/base/tendermint/v1beta1/blocks/latest"
+CHUNK_SIZE = 8192
+HEADER_KEY = b'"header"'
+# the bytes that matter to find where a JSON object ends
+_STRUCTURE = re.compile(rb'[{}"\\]')
+
+
+def header_span(buffer: bytes) -> Optional[Tuple[int, int]]:
+    """Start and end of the first "header" object in buffer, None until all of it has been read."""
+    key = buffer.find(HEADER_KEY)
+    if key < 0:
+        return None
+    start = buffer.find(b"{", key + len(HEADER_KEY))
+    if start < 0:
+        return None
+    depth, in_string, escaped_at = 0, False, -1
+    for match in _STRUCTURE.finditer(buffer, start):
+        index, char = match.start(), match.group()
+        if in_string:
+            if char == b"\\" and escaped_at != index:
+                escaped_at = index + 1
+            elif char == b'"' and escaped_at != index:
+                in_string = False
+        elif char == b'"':
+            in_string = True
+        elif char == b"{":
+            depth += 1
+        elif char == b"}":
+            depth -= 1
+            if depth == 0:
+                return start, index + 1
+    return None
+
+
+def read_header(response: requests.Response) -> Tuple[dict, int]:
+    """The block header of a blocks/latest response and the bytes read to get it. Closes the response."""
+    buffer = b""
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            buffer += chunk
+            span = header_span(buffer)
+            if span is not None:
+                return loads(buffer[span[0]:span[1]]), len(buffer)
+    finally:
+        response.close()
+    raise ValueError(f"no block header in the response: {buffer[:200]!r}")
+
+
+def fetch_lcd_header() -> Tuple[int, str, int]:
+    response = lcd_get(LATEST_BLOCK, stream=True)
+    if response.status_code != 200:
+        response.close()
+        raise requests.HTTPError(f"HTTP error {response.status_code}", response=response)
+    header, read = read_header(response)
+    return int(header["height"]), header["time"], read
+
+
+def fetch_rpc_status() -> Tuple[int, str, int]:
+    response = requests.get(f"{settings.rpc_http_address}/status", timeout=settings.http_timeout)
+    response.raise_for_status()
+    sync_info = loads(response.content)["result"]["sync_info"]
+    return int(sync_info["latest_block_height"]), sync_info["latest_block_time"], len(response.content)
+
+
+def _fetch(source: str) -> Tuple[int, str]:
+    started = time.thread_time()
+    height, block_time, read = fetch_rpc_status() if source == "rpc" else fetch_lcd_header()
+    metrics.METRIC_BLOCK_POLL_BYTES.labels(source).inc(read)
+    metrics.METRIC_BLOCK_POLL_CPU.labels(source).observe(time.thread_time() - started)
+    return height, block_time
+
+
+def latest_header() -> Tuple[int, str]:
+    """(height, time) of the latest block from BLOCK_SOURCE. Raises on request or decoding errors."""
+    source = settings.block_source
+    return flights.do(f"latest_header:{source}", lambda: _fetch(source))
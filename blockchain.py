@@ -1,9 +1,21 @@
-import subprocess
+import concurrent.futures
 import json
-from typing import List, Optional
+import logging
+import subprocess
+from typing import Dict, List, Optional
+
 import requests
-from config import *
+
+import block_clock
+import grpc_client
+from block_header import latest_header
+import metrics
+from config import settings
 from alerts import time_request
+from fee_tuner import tuner as fee_tuner
+from http_client import lcd_get
+from prevote_tracker import tracker as prevote_tracker
+from tx_broadcast import broadcast_oracle_tx
 
 logger = logging.getLogger(__name__)
 
@@ -11,10 +23,10 @@ logger = logging.getLogger(__name__)
 @time_request('lcd')
 def get_oracle_params():
     err_flag = False
-    url = f"{lcd_address}/{module_name}/oracle/v1beta1/params"
+    url = f"/{settings.module_name}/oracle/v1beta1/params"
     try:
         logger.debug(f"Requesting oracle params from: {url}")
-        response = requests.get(url, timeout=http_timeout)
+        response = lcd_get(url)
         
         # Check if the response is successful
         if response.status_code != 200:
@@ -46,21 +58,21 @@ def get_oracle_params():
             return {}, err_flag
             
         params = result["params"]
-        logger.debug(f"Successfully retrieved oracle params: {params}")
+        logger.debug("Successfully retrieved oracle params: %s", params)
         return params, err_flag
         
     except requests.exceptions.Timeout:
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        logger.error(f"Timeout when requesting oracle params from {url} (timeout: {http_timeout}s)")
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        logger.error(f"Timeout when requesting oracle params from {url} (timeout: {settings.http_timeout}s)")
         err_flag = True
         return {}, err_flag
     except requests.exceptions.ConnectionError:
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         logger.error(f"Connection error when requesting oracle params from {url}")
         err_flag = True
         return {}, err_flag
     except Exception as e:
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         logger.exception(f"Unexpected error in get_oracle_params when requesting {url}: {e}")
         err_flag = True
         return {}, err_flag
@@ -68,51 +80,43 @@ def get_oracle_params():
 
 @time_request('lcd')
 def get_latest_block():
+    if grpc_client.serves("latest_block"):
+        err_flag, latest_block_height, latest_block_time = grpc_client.get_latest_block()
+        if not err_flag:
+            block_clock.estimator.observe(latest_block_height, latest_block_time)
+        return err_flag, latest_block_height, latest_block_time
+
     err_flag = False
-    url = f"{lcd_address}/cosmos/base/tendermint/v1beta1/blocks/latest"
+    # only the header is read, see block_header.py
+    url = "/status" if settings.block_source == "rpc" else "/cosmos/base/tendermint/v1beta1/blocks/latest"
     try:
-        session = requests.session()
-        response = session.get(url, timeout=http_timeout)
-        
-        # Check if the response is successful
-        if response.status_code != 200:
-            logger.error(f"HTTP error {response.status_code} when getting latest block from {url}")
-            logger.error(f"Response content: {response.text[:500]}...")
-            err_flag = True
-            return err_flag, None, None
-        
-        # Check if response has content
-        if not response.text.strip():
-            logger.error(f"Empty response when getting latest block from {url}")
+        try:
+            latest_block_height, latest_block_time = latest_header()
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"{e} when getting latest block from {url}")
             err_flag = True
             return err_flag, None, None
-        
-        # Try to parse JSON
-        try:
-            result = response.json()
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response from {url}: {e}")
-            logger.error(f"Response content: {response.text[:500]}...")
+        except ValueError as e:
+            logger.error(f"Failed to parse response from {url}: {e}")
             err_flag = True
             return err_flag, None, None
-        
-        latest_block_height = int(result["block"]["header"]["height"])
-        latest_block_time = result["block"]["header"]["time"]
-        
+
+        block_clock.estimator.observe(latest_block_height, latest_block_time)
+
     except requests.exceptions.Timeout:
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        logger.error(f"Timeout when requesting latest block from {url} (timeout: {http_timeout}s)")
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        logger.error(f"Timeout when requesting latest block from {url} (timeout: {settings.http_timeout}s)")
         err_flag = True
         latest_block_height = None
         latest_block_time = None
     except requests.exceptions.ConnectionError:
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         logger.error(f"Connection error when requesting latest block from {url}")
         err_flag = True
         latest_block_height = None
         latest_block_time = None
     except Exception as e:
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         logger.exception(f"Unexpected error in get_latest_block when requesting {url}: {e}")
         err_flag = True
         latest_block_height = None
@@ -123,10 +127,13 @@ def get_latest_block():
 
 @time_request('lcd')
 def get_current_epoch(epoch_identifier: str):
+    if grpc_client.serves("epochs"):
+        return grpc_client.get_current_epoch(epoch_identifier)
+
     err_flag = False
-    url = f"{lcd_address}/{module_name}/epochs/v1beta1/epochs"
+    url = f"/{settings.module_name}/epochs/v1beta1/epochs"
     try:
-        response = requests.get(url, timeout=http_timeout)
+        response = lcd_get(url)
         
         # Check if the response is successful
         if response.status_code != 200:
@@ -155,6 +162,8 @@ def get_current_epoch(epoch_identifier: str):
                 current_epoch = epoch.get("current_epoch")
                 logger.debug(current_epoch)
                 if current_epoch is not None:
+                    if epoch.get("current_epoch_start_height"):
+                        prevote_tracker.observe_epoch_start(int(current_epoch), int(epoch["current_epoch_start_height"]))
                     return err_flag, int(current_epoch)
                 else:
                     err_flag = True
@@ -165,7 +174,7 @@ def get_current_epoch(epoch_identifier: str):
         return err_flag, None
 
     except requests.exceptions.Timeout:
-        logger.error(f"Timeout when requesting current epoch from {url} (timeout: {http_timeout}s)")
+        logger.error(f"Timeout when requesting current epoch from {url} (timeout: {settings.http_timeout}s)")
         err_flag = True
         return err_flag, None
     except requests.exceptions.ConnectionError:
@@ -178,72 +187,28 @@ def get_current_epoch(epoch_identifier: str):
         return err_flag, None
 
 
-def get_tx_data(tx_hash):
-    try:
-        response = requests.get(f"{lcd_address}/cosmos/tx/v1beta1/txs/{tx_hash}", timeout=http_timeout)
-        response.raise_for_status()
-        result = response.json()
-        logger.debug(f"Got tx data for hash {tx_hash}")
-        return result
-    except Exception as e:
-        logger.error(f"Error getting tx data for hash {tx_hash}: {e}")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        return None
-
-
 @time_request('lcd')
-def wait_for_block():
-    [err_flag, initial_height, last_time] = get_latest_block()
-    max_wait_time = float(max_block_confirm_wait_time)
-    counter = 0
-    if err_flag:
-        logger.error(f"get_block_height error: waiting for {max_wait_time} seconds")
-        time.sleep(max_wait_time)
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        return False
+def get_current_misses(valoper: Optional[str] = None) -> Optional[int]:
+    """Oracle miss counter of valoper, None if the LCD query failed - never mistake an error for zero misses."""
+    valoper = valoper or settings.valoper
+    if grpc_client.serves("misses"):
+        return grpc_client.get_current_misses(valoper)
+    url = f"/{settings.module_name}/oracle/v1beta1/validators/{valoper}/miss"
     try:
-        while counter < max_wait_time * 2:
-            time.sleep(0.5)
-            [err_flag, current_height, current_time] = get_latest_block()
-            if err_flag or current_height is None:
-                logger.error("Error getting current block height")
-                counter += 1
-                continue
-
-            if current_height > initial_height:
-                logger.debug(f"New block found: {current_height}")
-                return True
-
-            counter = counter + 1
-
-        logger.error(f"Timeout waiting for new block after {max_wait_time} seconds")
-        return False
-
-    except Exception as e:
-        logger.error(f"Error in waiting for next block: {e}, waiting for {max_wait_time}")
-        time.sleep(max_wait_time)
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        return False
-
-
-@time_request('lcd')
-def get_current_misses():
-    url = f"{lcd_address}/{module_name}/oracle/v1beta1/validators/{valoper}/miss"
-    try:
-        response = requests.get(url, timeout=http_timeout)
+        response = lcd_get(url)
         
         # Check if the response is successful
         if response.status_code != 200:
             logger.error(f"HTTP error {response.status_code} when getting current misses from {url}")
             logger.error(f"Response content: {response.text[:500]}...")
-            METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-            return 0
+            metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+            return None
         
         # Check if response has content
         if not response.text.strip():
             logger.error(f"Empty response when getting current misses from {url}")
-            METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-            return 0
+            metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+            return None
         
         # Try to parse JSON
         try:
@@ -251,42 +216,54 @@ def get_current_misses():
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response from {url}: {e}")
             logger.error(f"Response content: {response.text[:500]}...")
-            METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-            return 0
+            metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+            return None
         
         misses = int(result["miss_counter"])
         return misses
         
     except requests.exceptions.Timeout:
-        logger.error(f"Timeout when requesting current misses from {url} (timeout: {http_timeout}s)")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        return 0
+        logger.error(f"Timeout when requesting current misses from {url} (timeout: {settings.http_timeout}s)")
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        return None
     except requests.exceptions.ConnectionError:
         logger.error(f"Connection error when requesting current misses from {url}")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        return 0
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        return None
     except Exception as e:
         logger.exception(f"Unexpected error in get_current_misses when requesting {url}: {e}")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-        return 0
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        return None
+
+
+def get_misses_for_validators(valopers: List[str]) -> Dict[str, Optional[int]]:
+    """Query the miss counter of every valoper concurrently, one batch per call. Failed queries are None."""
+    if len(valopers) == 1:
+        return {valopers[0]: get_current_misses(valopers[0])}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(valopers), 16)) as executor:
+        results = executor.map(get_current_misses, valopers)
+        return dict(zip(valopers, results))
 
 
 @time_request('lcd')
-def get_my_current_prevote_hash():
-    url = f"{lcd_address}/{module_name}/oracle/v1beta1/validators/{valoper}/aggregate_prevote"
+def get_my_current_prevote_hash(valoper: Optional[str] = None):
+    valoper = valoper or settings.valoper
+    if grpc_client.serves("prevote"):
+        return grpc_client.get_my_current_prevote_hash(valoper)
+    url = f"/{settings.module_name}/oracle/v1beta1/validators/{valoper}/aggregate_prevote"
     try:
-        response = requests.get(url, timeout=http_timeout)
+        response = lcd_get(url)
         
         # Check if the response is successful
         if response.status_code != 200:
             logger.info(f"HTTP error {response.status_code} when getting prevote hash from {url} - likely no prevotes found")
-            METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+            metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
             return []
         
         # Check if response has content
         if not response.text.strip():
             logger.info(f"Empty response when getting prevote hash from {url} - likely no prevotes found")
-            METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+            metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
             return []
         
         # Try to parse JSON
@@ -295,28 +272,28 @@ def get_my_current_prevote_hash():
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response from {url}: {e}")
             logger.error(f"Response content: {response.text[:500]}...")
-            METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+            metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
             return []
         
         return result["aggregate_prevote"]["hash"]
         
     except requests.exceptions.Timeout:
-        logger.error(f"Timeout when requesting prevote hash from {url} (timeout: {http_timeout}s)")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        logger.error(f"Timeout when requesting prevote hash from {url} (timeout: {settings.http_timeout}s)")
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         return []
     except requests.exceptions.ConnectionError:
         logger.error(f"Connection error when requesting prevote hash from {url}")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         return []
     except Exception as e:
         logger.info(f"Error getting prevote hash from {url} - likely no prevotes found: {e}")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         return []
 
 
 def run_symphonyd_command(command: List[str]) -> dict:
     try:
-        logger.debug(f"Executing command: {' '.join(command)}")
+        logger.debug("Executing command: %s", " ".join(command))
 
         # Start the command
         process = subprocess.Popen(
@@ -327,7 +304,7 @@ def run_symphonyd_command(command: List[str]) -> dict:
             text=True
         )
         try:
-            stdout, stderr = process.communicate(input=f"{key_password}\n", timeout=30)
+            stdout, stderr = process.communicate(input=f"{settings.key_password}\n", timeout=30)
         except subprocess.TimeoutExpired:
             process.kill()
             stdout, stderr = process.communicate()
@@ -337,10 +314,10 @@ def run_symphonyd_command(command: List[str]) -> dict:
         # Log gas estimate as info if present
         if "gas estimate:" in stderr:
             gas_estimate = stderr.split("gas estimate:")[1].strip()
-            logger.debug(f"Gas estimate: {gas_estimate}")
+            logger.debug("Gas estimate: %s", gas_estimate)
 
         if stdout:
-            logger.debug(f"Command stdout:\n{stdout}")
+            logger.debug("Command stdout:\n%s", stdout)
 
         if process.returncode != 0:
             logger.error(f"Command failed with return code {process.returncode}")
@@ -361,14 +338,17 @@ def run_symphonyd_command(command: List[str]) -> dict:
 
 
 def aggregate_exchange_rate_prevote(salt: str, exchange_rates: str, from_address: str,
-                                    validator: Optional[str] = None) -> dict:
+                                    validator: Optional[str] = None, presigned=None) -> dict:
+    """presigned, a tx_broadcast.SignedTx of this prevote, is broadcast as is when it is still valid (RPC modes)."""
+    if settings.broadcast_mode != "cli":
+        return broadcast_oracle_tx("aggregate-prevote", salt, exchange_rates, from_address, validator, presigned)
     command = [
-        symphonyd_path, "tx", "oracle", "aggregate-prevote", salt, exchange_rates,
+        settings.symphonyd_path, "tx", "oracle", "aggregate-prevote", salt, exchange_rates,
         "--from", from_address,
         "--output", "json",
         "-y",  # skip confirmation
     ]
-    command.extend(tx_config)
+    command.extend(fee_tuner.tx_flags())
     if validator:
         command.append(validator)
     return run_symphonyd_command(command)
@@ -376,15 +356,17 @@ def aggregate_exchange_rate_prevote(salt: str, exchange_rates: str, from_address
 
 def aggregate_exchange_rate_vote(salt: str, exchange_rates: str, from_address: str,
                                  validator: Optional[str] = None) -> dict:
+    if settings.broadcast_mode != "cli":
+        return broadcast_oracle_tx("aggregate-vote", salt, exchange_rates, from_address, validator)
     command = [
-        symphonyd_path, "tx", "oracle", "aggregate-vote", salt, exchange_rates,
+        settings.symphonyd_path, "tx", "oracle", "aggregate-vote", salt, exchange_rates,
         "--from", from_address,
         "--output", "json",
         "-y",  # skip confirmation
     ]
-    command.extend(tx_config)
+    command.extend(fee_tuner.tx_flags())
     if validator:
         command.append(validator)
     return run_symphonyd_command(command)
 
-# Add any other blockchain-related functions
\ No newline at end of file
+# Add any other blockchain-related functions
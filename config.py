@@ -1,185 +1,457 @@
 #!/usr/bin/python3 -u
 # -*- coding: utf-8 -*-
 import os
-import time
 import logging
-from prometheus_client import Summary, Counter, Gauge, Histogram
-from dotenv import load_dotenv
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Tuple
 
 
 """
-Create a .env with the environment variables below if required, otherwise set them in os environment or use the defaults. 
-"""
-if os.path.exists('.env'):
-    load_dotenv()
-    print("Environment variables loaded from .env file.")
-else:
-    print(".env file not found.")
-
-
-# Slack webhook
-slackurl = os.getenv("SLACK_URL", "")
-telegram_token = os.getenv("TELEGRAM_TOKEN", "")
-telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID", "") #can use telegram_tools to get chat-id
-
-
-"""
-Price Feeder API Configuration
-"""
-# https://www.alphavantage.co/
-alphavantage_key = os.getenv("ALPHAVANTAGE_KEY", "")
-# API option with Alphavantage removed - for testnet only
-fx_api_option = os.getenv("FX_API_OPTION", "band")
-##with alphavantage fx_api_option = os.getenv("FX_API_OPTION", "alphavantage,band")
-
-"""
-Validator Configuration
-"""
-# oracle feeder address - only if using - this is a symphony1... format address
-#needs to be set first if using via delegate_feeder, do not set if not using
-feeder = os.getenv("FEEDER_ADDRESS", "")
-# validator address - symphony1... format - not symphonyvaloper format 
-validator = os.getenv("VALIDATOR_ADDRESS", "")
-#validator_account_address this is the validators symphony1... format address
-valoper= os.getenv("VALIDATOR_VALOPER_ADDRESS")
-key_password = os.getenv("KEY_PASSWORD", "") #if using OS Backend this is the password for the key
-"""
-TX configuration
-"""
-fee_denom = os.getenv("FEE_DENOM", "note")
-fee_gas = os.getenv("FEE_GAS", "0.0025note")
-gas_adjustment = os.getenv("GAS_ADJUSTMENT","2")
-fee_amount = os.getenv("FEE_AMOUNT", "500000")
-keyring_back_end = os.getenv("KEY_BACKEND","test")
-symphonyd_path = os.getenv('SYMPHONYD_PATH', 'symphonyd') #ensure symphonyd properly on PATH
-rpc_node =  os.getenv("TENDERMINT_RPC", "tcp://localhost:26657") # this is what port you run your node tendermint RPC on
-
-"""
-Blockchain Config 
-"""
-# REST API TO USE
-lcd_address = os.getenv("SYMPHONY_LCD", "http://localhost:1317")
-#symphony custom module name for endpoints i.e module_name/oracle/
-module_name = os.getenv("MODULE_NAME", "symphony")
-# symphony chain ID
-chain_id = os.getenv("CHAIN_ID", "symphony-1")
-# set last update time
-last_height = 0
-# in tx_config - include all the flags that you need, don't include "from" as this is set in script
-#doesn't support --home flags, leads to keyring issues
-tx_config = [
-    "--chain-id",chain_id,
-    "--gas-prices",fee_gas,
-    "--gas-adjustment", gas_adjustment,
-    "--gas", "auto",
-    "--keyring-backend", keyring_back_end,
-    "--broadcast-mode", "sync",
-    "--node", rpc_node
-]
-max_block_confirm_wait_time= os.getenv("BLOCK_WAIT_TIME", "10") #define how long is the maximum we should wait for next block in seconds
-max_retry_per_epoch = int(os.getenv("MAX_RETRY_PER_EPOCH", "1"))
-
-"""
-Oracle Divergence - 
-None of the Oracle divergences are implemented
-"""
-
-# stop oracle when price change exceeds stop_oracle_trigger
-stop_oracle_trigger_recent_diverge = float(os.getenv("STOP_ORACLE_RECENT_DIVERGENCE", "999999999999"))
-# stop oracle when price change exceeds stop_oracle_trigger
-stop_oracle_trigger_exchange_diverge = float(os.getenv("STOP_ORACLE_EXCHANGE_DIVERGENCE", "0.1"))
-# vote negative price when bid-ask price is wider than bid_ask_spread_max
-bid_ask_spread_max = float(os.getenv("BID_ASK_SPREAD_MAX", "0.05"))
-
-if chain_id == "symphony-1":
-    osmosis_lcd = os.getenv("OSMOSIS_LCD", "https://lcd.osmosis.zone/")
-    osmosis_pool_id= os.getenv("OSMOSIS_POOL_ID", "3084")
-    osmosis_base_asset=os.getenv("OSMOSIS_BASE_ASSET", "ibc/41AD5D4AFA42104295D08E564ADC7B40FD9DAB4BCD3002ECFA8BDD1309B65F24")
-    osmosis_quote_asset=os.getenv("OSMOSIS_QUOTE_ASSET", "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4")
-    osmosis_quote_asset_ticker="USDC"
-
-    fx_map = {
-        "uusd": "USD",
-        "urub": "RUB",
-        "uinr": "INR",
-        "ucny": "CNY",
-        "uxau": "XAU",
-        }
-
-if chain_id == "symphony-testnet-4":
-    osmosis_lcd = os.getenv("OSMOSIS_LCD", "https://lcd.testnet.osmosis.zone/")
-    osmosis_pool_id= os.getenv("OSMOSIS_POOL_ID", "666")
-    osmosis_base_asset=os.getenv("OSMOSIS_BASE_ASSET", "ibc/C5B7196709BDFC3A312B06D7292892FA53F379CD3D556B65DB00E1531D471BBA")
-    osmosis_quote_asset=os.getenv("OSMOSIS_QUOTE_ASSET", "uosmo")
-    osmosis_quote_asset_ticker="OSMO"
-    # parameters
-    fx_map = {
-        "uusd": "USD",
-        "uhkd": "HKD",
-        "ubtc":"BTC",
-        "ueth":"ETH",
-        "ueur" :"EUR",
-        "uxau": "XAU"
-    }
-
-
-#band config
-band_endpoint = os.getenv("BAND_ENDPOINT", "https://laozi1.bandchain.org")
-band_standard_price_params = os.getenv("BAND_PRICE_PARAMS", "13,1_000_000_000,10,16")
-
-
-misses = int(os.getenv("MISSES", "0"))
-alertmisses = os.getenv("MISS_ALERTS", "true") == "true"
-debug = os.getenv("DEBUG", "false") == "true"
-metrics_port = os.getenv("METRICS_PORT", "19000")
-
-tx_indexer_wait=float(os.getenv("TX_WAIT", "2.0"))
-tx_indexer_retries=int(os.getenv("TX_RETRIES","10"))
+Create a .env with the environment variables below if required, otherwise set them in os environment or use the defaults.
 
+Importing this module has no side effects: the .env file is loaded and the settings are read from the
+environment the first time an attribute of `settings` (or `get_settings()`) is accessed.
+Logging is configured explicitly by entrypoints through `setup_logging()`.
 """
-Prometheus Metrics 
-"""
-
-METRIC_MISSES = Gauge("symphony_oracle_misses_total", "Total number of oracle misses")
-METRIC_HEIGHT = Gauge("symphony_oracle_height", "Block height of the LCD node")
-METRIC_VOTES = Counter("symphony_oracle_votes", "Counter of oracle votes")
-METRIC_EPOCHS = Gauge("symphony_oracle_epoch", "EPOCH reported by the LCD node")
-
 
-METRIC_MARKET_PRICE = Gauge("symphony_oracle_market_price", "Last market price", ['denom'])
-#METRIC_SWAP_PRICE = Gauge("terra_oracle_swap_price", "Last swap price", ['denom'])
-
-METRIC_OUTBOUND_ERROR = Counter("terra_oracle_request_errors", "Outbound HTTP request error count", ["remote"])
-METRIC_OUTBOUND_LATENCY = Histogram("terra_oracle_request_latency", "Outbound HTTP request latency", ["remote"])
+logger = logging.getLogger(__name__)
 
 default_base_fx = "uusd"
-default_base_fx_map="USD"
-
+default_base_fx_map = "USD"
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default) == "true"
+
+
+def _chain_defaults(chain_id: str) -> dict:
+    """Osmosis pool and fx_map defaults for each known chain id."""
+    if chain_id == "symphony-1":
+        return {
+            "osmosis_lcd": os.getenv("OSMOSIS_LCD", "https://lcd.osmosis.zone/"),
+            "osmosis_pool_id": os.getenv("OSMOSIS_POOL_ID", "3084"),
+            "osmosis_base_asset": os.getenv("OSMOSIS_BASE_ASSET", "ibc/41AD5D4AFA42104295D08E564ADC7B40FD9DAB4BCD3002ECFA8BDD1309B65F24"),
+            "osmosis_quote_asset": os.getenv("OSMOSIS_QUOTE_ASSET", "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"),
+            "osmosis_quote_asset_ticker": "USDC",
+            "fx_map": {
+                "uusd": "USD",
+                "urub": "RUB",
+                "uinr": "INR",
+                "ucny": "CNY",
+                "uxau": "XAU",
+            },
+        }
 
+    if chain_id == "symphony-testnet-4":
+        return {
+            "osmosis_lcd": os.getenv("OSMOSIS_LCD", "https://lcd.testnet.osmosis.zone/"),
+            "osmosis_pool_id": os.getenv("OSMOSIS_POOL_ID", "666"),
+            "osmosis_base_asset": os.getenv("OSMOSIS_BASE_ASSET", "ibc/C5B7196709BDFC3A312B06D7292892FA53F379CD3D556B65DB00E1531D471BBA"),
+            "osmosis_quote_asset": os.getenv("OSMOSIS_QUOTE_ASSET", "uosmo"),
+            "osmosis_quote_asset_ticker": "OSMO",
+            "fx_map": {
+                "uusd": "USD",
+                "uhkd": "HKD",
+                "ubtc": "BTC",
+                "ueth": "ETH",
+                "ueur": "EUR",
+                "uxau": "XAU",
+            },
+        }
 
-##custom config for testing chain - to be removed for mainnet.
-if chain_id == "testing":
-    fx_map = {
-        "uusd": "USD",
-        "ukhd": "HKD",  # there is a typo here, but it's onchain also
-        "uvnd": "INR",  ##this is so we can write USDINR to UVND, this should be removed before mainnet
+    defaults = {
+        "osmosis_lcd": os.getenv("OSMOSIS_LCD", ""),
+        "osmosis_pool_id": os.getenv("OSMOSIS_POOL_ID", ""),
+        "osmosis_base_asset": os.getenv("OSMOSIS_BASE_ASSET", ""),
+        "osmosis_quote_asset": os.getenv("OSMOSIS_QUOTE_ASSET", ""),
+        "osmosis_quote_asset_ticker": "",
+        "fx_map": {"uusd": "USD"},
     }
-
-fx_symbol_list = [symbol for symbol in set(fx_map.values()) if symbol != default_base_fx_map]
-
-# denoms for abstain votes. it will vote abstain for all denoms in this list.
-# this is deprecated for now
-abstain_set = [
-]
-
-
-
-logging.basicConfig(level=logging.DEBUG if debug else logging.INFO)
-logger = logging.root
-
-# By default, python-requests does not use a timeout. We need to specify
-# a timeout on each call to ensure we never get stuck in network IO.
-http_timeout = 4
-
-# Separate timeout for alerting calls
-alert_http_timeout = 4
+    ##custom config for testing chain - to be removed for mainnet.
+    if chain_id == "testing":
+        defaults["fx_map"] = {
+            "uusd": "USD",
+            "ukhd": "HKD",  # there is a typo here, but it's onchain also
+            "uvnd": "INR",  ##this is so we can write USDINR to UVND, this should be removed before mainnet
+        }
+    return defaults
+
+
+@dataclass(frozen=True)
+class ValidatorIdentity:
+    """One validator this process votes for.
+
+    valoper is the symphonyvaloper1... address the votes are for, feeder the delegated feeder account (if used),
+    key the keyring key name used to sign (falls back to the feeder / validator address), and validator the
+    validator's own symphony1... account address.
+    """
+    valoper: str
+    feeder: str = ""
+    key: str = ""
+    validator: str = ""
+
+    @property
+    def from_account(self) -> str:
+        return self.key or self.feeder or self.validator
+
+
+def parse_validators(spec: str) -> Tuple[ValidatorIdentity, ...]:
+    """Parse VALIDATORS - comma separated valoper:feeder:key[:validator] entries, empty fields allowed."""
+    identities = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        fields = [part.strip() for part in entry.split(":")]
+        if len(fields) > 4 or not fields[0]:
+            raise ValueError(f"Invalid VALIDATORS entry '{entry}', expected valoper:feeder:key[:validator]")
+        identities.append(ValidatorIdentity(*fields))
+    return tuple(identities)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Typed view of the feeder configuration, built once from the environment by `Settings.from_env()`."""
+
+    # Slack webhook
+    slackurl: str = ""
+    telegram_token: str = ""
+    telegram_chat_id: str = ""  # can use telegram_tools to get chat-id
+
+    # Price Feeder API Configuration
+    # https://www.alphavantage.co/
+    alphavantage_key: str = ""
+    # API option with Alphavantage removed - for testnet only
+    ##with alphavantage fx_api_option = "alphavantage,band"
+    fx_api_option: str = "band"
+
+    # Validator Configuration
+    # oracle feeder address - only if using - this is a symphony1... format address
+    # needs to be set first if using via delegate_feeder, do not set if not using
+    feeder: str = ""
+    # validator address - symphony1... format - not symphonyvaloper format
+    validator: str = ""
+    # validator_account_address this is the validators symphonyvaloper1... format address
+    valoper: str = ""
+    key_password: str = ""  # if using OS Backend this is the password for the key
+    # multi validator mode - every validator voted for by this process, see parse_validators
+    # when VALIDATORS is unset this is just the single validator configured above
+    validator_set: Tuple[ValidatorIdentity, ...] = ()
+
+    # TX configuration
+    fee_denom: str = "note"
+    fee_gas: str = "0.0025note"
+    gas_adjustment: str = "2"
+    fee_amount: str = "500000"
+    # --gas-prices auto-tuning (see fee_tuner.py) between fee_gas_min and fee_gas_max, in fee_gas' denom;
+    # disabled unless fee_gas_max is above the FEE_GAS price
+    fee_gas_min: float = 0.0
+    fee_gas_max: float = 0.0
+    fee_tune_step: float = 0.2  # relative change per adjustment
+    fee_target_blocks: int = 1  # inclusion delay to aim for, 1 = the block after broadcast
+    fee_congested_txs: int = 200  # mempool size treated as congestion
+    fee_sample_interval: float = 5.0  # seconds between mempool samples
+    keyring_back_end: str = "test"
+    symphonyd_path: str = "symphonyd"  # ensure symphonyd properly on PATH
+    rpc_node: str = "tcp://localhost:26657"  # this is what port you run your node tendermint RPC on
+    max_block_confirm_wait_time: float = 10.0  # define how long is the maximum we should wait for next block in seconds
+    max_retry_per_epoch: int = 1
+
+    # Blockchain Config
+    # REST API TO USE
+    lcd_address: str = "http://localhost:1317"  # comma separated for failover, see http_client.py
+    lcd_max_lag: int = 2  # blocks an LCD endpoint may be behind the others and still be used first
+    lcd_probe_interval: float = 10.0  # seconds between LCD health probes (with more than one endpoint)
+    block_source: str = "lcd"  # where the latest block header is polled from, lcd or rpc (block_header.py)
+    # chain queries sent over gRPC instead of the LCD (grpc_client.py), comma separated i.e latest_block,tx
+    grpc_queries: str = ""
+    grpc_address: str = "localhost:9090"
+    grpc_tls: bool = False
+    http_micro_cache: float = 0.05  # seconds a GET response answers identical GETs, 0 only merges concurrent ones
+    # symphony custom module name for endpoints i.e module_name/oracle/
+    module_name: str = "symphony"
+    # symphony chain ID
+    chain_id: str = "symphony-1"
+
+    # Oracle Divergence - None of the Oracle divergences are implemented
+    # stop oracle when price change exceeds stop_oracle_trigger
+    stop_oracle_trigger_recent_diverge: float = 999999999999.0
+    # stop oracle when price change exceeds stop_oracle_trigger
+    stop_oracle_trigger_exchange_diverge: float = 0.1
+    # vote negative price when bid-ask price is wider than bid_ask_spread_max
+    bid_ask_spread_max: float = 0.05
+
+    # Osmosis pool used for the base price - defaults depend on chain_id
+    osmosis_lcd: str = ""
+    osmosis_pool_id: str = ""
+    osmosis_base_asset: str = ""
+    osmosis_quote_asset: str = ""
+    osmosis_quote_asset_ticker: str = ""
+    # more pools pricing the same base / quote assets, comma separated - OSMOSIS_POOL_ID when empty
+    osmosis_pool_ids: str = ""
+    osmosis_twap_window: float = 120.0  # seconds of spot price samples averaged per pool, 0 uses the spot price
+    osmosis_twap_sample_interval: float = 10.0  # seconds between background spot price samples, 0 only samples on fetch
+    osmosis_pool_meta_ttl: float = 600.0  # seconds pool liquidity (the pool weights) is cached for
+    fx_map: Dict[str, str] = field(default_factory=dict)
+
+    # band config
+    band_endpoint: str = "https://laozi1.bandchain.org"
+    band_standard_price_params: str = "13,1_000_000_000,10,16"
+    band_stale_window: float = 600.0  # Band quotes resolved longer ago than this (seconds) are not voted
+
+    # request quotas per remote (rate_limiter.py), "remote=requests/seconds" comma separated
+    rate_limits: str = "alphavantage=5/60,band=60/60,osmolcd=120/60"
+    rate_limit_max_wait: float = 10.0  # seconds a call over its quota may wait for budget, within its source deadline
+
+    # price source scoring (source_scoring.py)
+    source_score_window: int = 50  # fetches per source the score is computed over
+    source_slow_latency: float = 3.0  # p95 fetch latency (seconds) above which a source is down-weighted
+    source_deviation_tolerance: float = 0.01  # relative deviation from consensus that halves a source's weight
+    source_min_score: float = 0.25  # sources scoring less are dropped from the fan-out
+    source_probe_interval: float = 300.0  # seconds between fetches of a dropped source
+
+    misses: int = 0
+    alertmisses: bool = True
+    miss_check_interval: float = 30.0  # seconds between miss counter samples
+    miss_history: int = 120  # (epoch, miss_counter) samples kept per validator for the miss rate
+    debug: bool = False
+    log_format: str = "text"  # text or json (one object per line with epoch / tx correlation IDs)
+    log_sample_burst: int = 20  # INFO / DEBUG records per call site per window, 0 disables sampling
+    log_sample_window: float = 60.0
+    metrics_port: int = 19000
+
+    # "cli" broadcasts oracle txs with symphonyd, "sync" / "async" post signed tx bytes to the Tendermint RPC
+    # broadcast_tx_sync / broadcast_tx_async endpoint (see tx_broadcast.py)
+    broadcast_mode: str = "cli"
+    tx_indexer_wait: float = 2.0
+    # check pending txs against the RPC mempool to fail fast on dropped txs (see mempool_watcher.py)
+    mempool_watch: bool = True
+    mempool_drop_min_age: float = 3.0  # seconds after broadcast a tx may be declared dropped without a new block
+    tx_indexer_retries: int = 10
+    # polls waiting for the chain are scheduled at the estimated next block time plus this margin (seconds)
+    block_poll_guard: float = 0.15
+
+    # shared price feed - "publish" runs get_prices once and serves snapshots over a unix socket,
+    # "subscribe" makes get_prices read the latest snapshot instead of calling the price APIs
+    price_feed_mode: str = ""
+    price_feed_socket: str = "/tmp/symphony-oracle-prices.sock"
+    price_feed_max_age: float = 30.0  # snapshots older than this (seconds) are treated as missing
+    price_feed_wait: float = 5.0  # how long a subscriber waits for the current epoch's snapshot
+
+    # prepare the next prevote this many seconds before the predicted epoch boundary, 0 disables speculation
+    speculative_lead: float = 5.0
+    # relative price move after which a prepared prevote is rebuilt
+    speculative_tolerance: float = 0.001
+
+    # active/standby HA - only the holder of the lease file votes, empty disables HA
+    ha_lease_file: str = ""
+    ha_lease_ttl: float = 10.0  # seconds, renewed every poll by the leader
+    ha_state_file: str = ""  # replicated vote state, defaults to <ha_lease_file>.state.json
+    ha_node_id: str = ""  # defaults to hostname-pid
+
+    # record every HTTP response and symphonyd command to this file for replay.py, empty disables recording
+    record_file: str = ""
+
+    # denoms for abstain votes. it will vote abstain for all denoms in this list.
+    # this is deprecated for now
+    abstain_set: List[str] = field(default_factory=list)
+
+    # By default, python-requests does not use a timeout. We need to specify
+    # a timeout on each call to ensure we never get stuck in network IO.
+    http_timeout: float = 4
+    # Separate timeout for alerting calls
+    alert_http_timeout: float = 4
+
+    default_base_fx: str = default_base_fx
+    default_base_fx_map: str = default_base_fx_map
+
+    env_file_loaded: bool = False
+
+    @classmethod
+    def from_env(cls, env_file_loaded: bool = False) -> "Settings":
+        chain_id = os.getenv("CHAIN_ID", "symphony-1")
+        return cls(
+            slackurl=os.getenv("SLACK_URL", ""),
+            telegram_token=os.getenv("TELEGRAM_TOKEN", ""),
+            telegram_chat_id=os.getenv("TELEGRAM_CHAT_ID", ""),
+            alphavantage_key=os.getenv("ALPHAVANTAGE_KEY", ""),
+            fx_api_option=os.getenv("FX_API_OPTION", "band"),
+            feeder=os.getenv("FEEDER_ADDRESS", ""),
+            validator=os.getenv("VALIDATOR_ADDRESS", ""),
+            valoper=os.getenv("VALIDATOR_VALOPER_ADDRESS", ""),
+            key_password=os.getenv("KEY_PASSWORD", ""),
+            validator_set=parse_validators(os.getenv("VALIDATORS", "")),
+            fee_denom=os.getenv("FEE_DENOM", "note"),
+            fee_gas=os.getenv("FEE_GAS", "0.0025note"),
+            gas_adjustment=os.getenv("GAS_ADJUSTMENT", "2"),
+            fee_amount=os.getenv("FEE_AMOUNT", "500000"),
+            fee_gas_min=float(os.getenv("FEE_GAS_MIN", "0")),
+            fee_gas_max=float(os.getenv("FEE_GAS_MAX", "0")),
+            fee_tune_step=float(os.getenv("FEE_TUNE_STEP", "0.2")),
+            fee_target_blocks=int(os.getenv("FEE_TARGET_BLOCKS", "1")),
+            fee_congested_txs=int(os.getenv("FEE_CONGESTED_TXS", "200")),
+            fee_sample_interval=float(os.getenv("FEE_SAMPLE_INTERVAL", "5")),
+            keyring_back_end=os.getenv("KEY_BACKEND", "test"),
+            symphonyd_path=os.getenv("SYMPHONYD_PATH", "symphonyd"),
+            rpc_node=os.getenv("TENDERMINT_RPC", "tcp://localhost:26657"),
+            max_block_confirm_wait_time=float(os.getenv("BLOCK_WAIT_TIME", "10")),
+            max_retry_per_epoch=int(os.getenv("MAX_RETRY_PER_EPOCH", "1")),
+            lcd_address=os.getenv("SYMPHONY_LCD", "http://localhost:1317"),
+            lcd_max_lag=int(os.getenv("LCD_MAX_LAG", "2")),
+            lcd_probe_interval=float(os.getenv("LCD_PROBE_INTERVAL", "10")),
+            block_source=os.getenv("BLOCK_SOURCE", "lcd").lower(),
+            grpc_queries=os.getenv("GRPC_QUERIES", ""),
+            grpc_address=os.getenv("GRPC_ADDRESS", "localhost:9090"),
+            grpc_tls=_env_bool("GRPC_TLS", "false"),
+            http_micro_cache=float(os.getenv("HTTP_MICRO_CACHE", "0.05")),
+            module_name=os.getenv("MODULE_NAME", "symphony"),
+            chain_id=chain_id,
+            stop_oracle_trigger_recent_diverge=float(os.getenv("STOP_ORACLE_RECENT_DIVERGENCE", "999999999999")),
+            stop_oracle_trigger_exchange_diverge=float(os.getenv("STOP_ORACLE_EXCHANGE_DIVERGENCE", "0.1")),
+            bid_ask_spread_max=float(os.getenv("BID_ASK_SPREAD_MAX", "0.05")),
+            osmosis_pool_ids=os.getenv("OSMOSIS_POOL_IDS", ""),
+            osmosis_twap_window=float(os.getenv("OSMOSIS_TWAP_WINDOW", "120")),
+            osmosis_twap_sample_interval=float(os.getenv("OSMOSIS_TWAP_SAMPLE_INTERVAL", "10")),
+            osmosis_pool_meta_ttl=float(os.getenv("OSMOSIS_POOL_META_TTL", "600")),
+            band_endpoint=os.getenv("BAND_ENDPOINT", "https://laozi1.bandchain.org"),
+            band_standard_price_params=os.getenv("BAND_PRICE_PARAMS", "13,1_000_000_000,10,16"),
+            band_stale_window=float(os.getenv("BAND_STALE_WINDOW", "600")),
+            rate_limits=os.getenv("RATE_LIMITS", "alphavantage=5/60,band=60/60,osmolcd=120/60"),
+            rate_limit_max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT", "10")),
+            source_score_window=int(os.getenv("SOURCE_SCORE_WINDOW", "50")),
+            source_slow_latency=float(os.getenv("SOURCE_SLOW_LATENCY", "3")),
+            source_deviation_tolerance=float(os.getenv("SOURCE_DEVIATION_TOLERANCE", "0.01")),
+            source_min_score=float(os.getenv("SOURCE_MIN_SCORE", "0.25")),
+            source_probe_interval=float(os.getenv("SOURCE_PROBE_INTERVAL", "300")),
+            misses=int(os.getenv("MISSES", "0")),
+            alertmisses=_env_bool("MISS_ALERTS", "true"),
+            miss_check_interval=float(os.getenv("MISS_CHECK_INTERVAL", "30")),
+            miss_history=int(os.getenv("MISS_HISTORY", "120")),
+            debug=_env_bool("DEBUG", "false"),
+            log_format=os.getenv("LOG_FORMAT", "text").lower(),
+            log_sample_burst=int(os.getenv("LOG_SAMPLE_BURST", "20")),
+            log_sample_window=float(os.getenv("LOG_SAMPLE_WINDOW", "60")),
+            metrics_port=int(os.getenv("METRICS_PORT", "19000")),
+            broadcast_mode=os.getenv("BROADCAST_MODE", "cli").lower(),
+            tx_indexer_wait=float(os.getenv("TX_WAIT", "2.0")),
+            mempool_watch=_env_bool("MEMPOOL_WATCH", "true"),
+            mempool_drop_min_age=float(os.getenv("MEMPOOL_DROP_MIN_AGE", "3")),
+            tx_indexer_retries=int(os.getenv("TX_RETRIES", "10")),
+            block_poll_guard=float(os.getenv("BLOCK_POLL_GUARD", "0.15")),
+            price_feed_mode=os.getenv("PRICE_FEED_MODE", ""),
+            price_feed_socket=os.getenv("PRICE_FEED_SOCKET", "/tmp/symphony-oracle-prices.sock"),
+            price_feed_max_age=float(os.getenv("PRICE_FEED_MAX_AGE", "30")),
+            price_feed_wait=float(os.getenv("PRICE_FEED_WAIT", "5")),
+            speculative_lead=float(os.getenv("SPECULATIVE_LEAD", "5")),
+            speculative_tolerance=float(os.getenv("SPECULATIVE_TOLERANCE", "0.001")),
+            ha_lease_file=os.getenv("HA_LEASE_FILE", ""),
+            ha_lease_ttl=float(os.getenv("HA_LEASE_TTL", "10")),
+            ha_state_file=os.getenv("HA_STATE_FILE", ""),
+            ha_node_id=os.getenv("HA_NODE_ID", ""),
+            record_file=os.getenv("RECORD_FILE", ""),
+            env_file_loaded=env_file_loaded,
+            **_chain_defaults(chain_id),
+        )
+
+    @property
+    def tx_config(self) -> List[str]:
+        # in tx_config - include all the flags that you need, don't include "from" as this is set in script
+        # doesn't support --home flags, leads to keyring issues
+        return [
+            "--chain-id", self.chain_id,
+            "--gas-prices", self.fee_gas,
+            "--gas-adjustment", self.gas_adjustment,
+            "--gas", "auto",
+            "--keyring-backend", self.keyring_back_end,
+            "--broadcast-mode", "sync",
+            "--node", self.rpc_node
+        ]
+
+    @property
+    def lcd_address_list(self) -> List[str]:
+        return [address.strip().rstrip("/") for address in self.lcd_address.split(",") if address.strip()]
+
+    @property
+    def grpc_query_list(self) -> List[str]:
+        return [query.strip() for query in self.grpc_queries.split(",") if query.strip()]
+
+    @property
+    def rpc_http_address(self) -> str:
+        return self.rpc_node.replace("tcp://", "http://", 1)
+
+    @property
+    def validators(self) -> Tuple[ValidatorIdentity, ...]:
+        if self.validator_set:
+            return self.validator_set
+        return (ValidatorIdentity(valoper=self.valoper, feeder=self.feeder, validator=self.validator),)
+
+    @property
+    def multi_validator(self) -> bool:
+        return len(self.validators) > 1
+
+    @property
+    def osmosis_pool_id_list(self) -> List[str]:
+        pool_ids = [pool_id.strip() for pool_id in self.osmosis_pool_ids.split(",") if pool_id.strip()]
+        return pool_ids or [self.osmosis_pool_id]
+
+    @property
+    def rate_limit_quotas(self) -> Dict[str, Tuple[float, float]]:
+        """remote -> (requests, per seconds)"""
+        quotas = {}
+        for quota in self.rate_limits.split(","):
+            if "=" not in quota:
+                continue
+            remote, budget = quota.split("=", 1)
+            requests, _, seconds = budget.partition("/")
+            quotas[remote.strip()] = (float(requests), float(seconds or 1))
+        return quotas
+
+    @property
+    def fx_symbol_list(self) -> List[str]:
+        return [symbol for symbol in set(self.fx_map.values()) if symbol != self.default_base_fx_map]
+
+
+def load_env_file(path: str = ".env") -> bool:
+    """Load the .env file into os.environ if it exists. Returns True if it was loaded."""
+    if not os.path.exists(path):
+        return False
+    from dotenv import load_dotenv
+    load_dotenv(path)
+    return True
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Build the process wide settings on first call, loading the .env file first."""
+    return Settings.from_env(env_file_loaded=load_env_file())
+
+
+class _LazySettings:
+    """Attribute proxy for the process wide Settings, i.e settings.lcd_address, built on first access."""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+    def __repr__(self):
+        return repr(get_settings())
+
+
+settings = _LazySettings()
+
+
+def setup_logging():
+    """Configure the root logger - called once by entrypoints, never on import. Records are written by a
+    background thread, see log_pipeline.py."""
+    import log_pipeline
+    log_pipeline.setup(
+        level=logging.DEBUG if settings.debug else logging.INFO,
+        fmt=settings.log_format,
+        sample_burst=settings.log_sample_burst,
+        sample_window=settings.log_sample_window,
+    )
+    if settings.env_file_loaded:
+        logger.info("Environment variables loaded from .env file.")
+    else:
+        logger.info(".env file not found.")
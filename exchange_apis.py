@@ -1,55 +1,58 @@
-import requests
 import asyncio
-import aiohttp
-from config import *
+import logging
+import requests
 from urllib.parse import urlencode
+
+import metrics
+from band_freshness import freshness
+from config import settings
 from alerts import time_request
+import http_client
+from price_sources import FX, PriceSource, blocking, register
+from rate_limiter import call_key, limiter, rate_limited
 
 logger = logging.getLogger(__name__)
 
-@time_request('lcd')
-def get_swap_price():
-    err_flag=False
-    try:
-        result = requests.get(f"{lcd_address}/{module_name}/oracle/v1beta1/denoms/exchange_rates", timeout=http_timeout).json()
-    except:
-        logger.exception("Error in get_swap_price")
-        result = {"result": []}
-        err_flag=True
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
-    return err_flag,result
-
+@rate_limited('alphavantage')
 @time_request('alphavantage')
 async def get_alphavantage_fx_for(symbol_to):
+    import aiohttp  # optional source - only imported when alphavantage is enabled
     try:
         async with aiohttp.ClientSession() as async_session:
             async with async_session.get(
                     "https://www.alphavantage.co/query",
-                    timeout=http_timeout,
+                    timeout=settings.http_timeout,
                     params={
                         'function': 'CURRENCY_EXCHANGE_RATE',
                         'from_currency': 'USD',
                         'to_currency': symbol_to,
-                        'apikey': alphavantage_key
+                        'apikey': settings.alphavantage_key
                     }
             ) as response:
-                return await response.json(content_type=None)
+                result = await response.json(content_type=None)
+                if "Realtime Currency Exchange Rate" not in result:
+                    # quota notes and errors come back as 200s
+                    logger.error(f"No {symbol_to} rate from alphavantage (HTTP {response.status}): {result}")
+                    metrics.METRIC_OUTBOUND_ERROR.labels('alphavantage').inc()
+                    return None
+                return result
     except Exception as e:
         logger.exception(f"Error in fx_for {e}")
-        METRIC_OUTBOUND_ERROR.labels('alphavantage').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('alphavantage').inc()
 
 
-def get_alphavantage_fx_rate():
+async def get_alphavantage_fx_rate():
     err_flag = False
     result_real_fx={}
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        futures = [get_alphavantage_fx_for(symbol) for symbol in fx_symbol_list]
-        api_result = loop.run_until_complete(asyncio.gather(*futures))
-    
+        # least recently fetched first, the symbols over the quota are served from cache
+        symbols = sorted(settings.fx_symbol_list, key=lambda symbol: limiter.age('alphavantage', call_key((symbol,), {})),
+                         reverse=True)
+        futures = [get_alphavantage_fx_for(symbol) for symbol in symbols]
+        api_result = await asyncio.gather(*futures)
+
         result_real_fx = {"USD": 1.0}
-        for symbol, result in zip(fx_symbol_list, api_result):
+        for symbol, result in zip(symbols, api_result):
             if symbol == "XDR":
                 symbol = "SDR"
             try:
@@ -66,34 +69,53 @@ def get_alphavantage_fx_rate():
         
 
 
-def get_fx_rate_free():
-    # Implementation similar to get_fx_rate but using a free API
-    pass
+# symbol -> (request_id, FX rate derived from that quote), so unchanged quotes aren't reprocessed
+_band_fx_rates = {}
+
+
+def band_fx_rate(symbol: str, quote: dict) -> float:
+    request_id = quote.get("request_id")
+    cached = _band_fx_rates.get(symbol)
+    if request_id is None or cached is None or cached[0] != request_id:
+        cached = _band_fx_rates[symbol] = (request_id, round(1/float(quote["price"]),6))
+    return cached[1]
 
 
 ## this is updated, but there's no VND supported
 
 def get_fx_rate_from_band():
     try:
-    #TODO update so that error flag is for EACH asset rather than all assets - handle voting abstain on assets that don't work
-        error_flag, result = get_band_standard_dataset(fx_symbol_list)
+        error_flag, result = get_fresh_band_dataset(settings.fx_symbol_list)
         if error_flag:
-            logger.error(f"error with Band fx data")
+            logger.error("error with Band fx data")
             return True, []
 
+        # symbols missing or stale are left out, combine_fx falls back to the other sources or abstains
         result_real_fx = {"USD": 1.0}
-        for symbol in fx_symbol_list:
-            result_real_fx[f"{symbol}"] = round(1/float(result[symbol]["price"]),6)
+        for symbol in settings.fx_symbol_list:
+            if symbol in result and result[symbol]["price"]:
+                result_real_fx[f"{symbol}"] = band_fx_rate(symbol, result[symbol])
         return False, result_real_fx
     except Exception as e:
         logger.error(f"error with Band fx data: {e}")
         return True, []
+
+
+def get_fresh_band_dataset(symbols: list):
+    """get_band_standard_dataset without the stale quotes (see band_freshness.py)."""
+    error_flag, result = get_band_standard_dataset(symbols)
+    if error_flag:
+        return True, []
+    return False, freshness.fresh(result)
+
+
+@rate_limited('band', fallback=(True, []))
 @time_request('band')
 def get_band_standard_dataset(symbols : list):
-    ##TODO- do not use this on mainnet, it can serve very stale prices
+    # serves the last result for each symbol however old it is - prices voted go through get_fresh_band_dataset
     try:
-        base_url = "https://laozi1.bandchain.org/api/oracle/v1"
-        oracle_script_id, multiplier, min_count, ask_count = map(int, band_standard_price_params.split(","))
+        base_url = f"{settings.band_endpoint}/api/oracle/v1"
+        oracle_script_id, multiplier, min_count, ask_count = map(int, settings.band_standard_price_params.split(","))
         params= {
             "ask_count": ask_count,
             "min_count": min_count,
@@ -101,7 +123,7 @@ def get_band_standard_dataset(symbols : list):
         }
         # Fetch the latest request ID for the standard dataset
         url = f"{base_url}/request_prices?{urlencode(params, doseq=True)}"
-        response = requests.get(url, timeout=http_timeout)
+        response = http_client.get(url, timeout=settings.http_timeout)
         response.raise_for_status()  # Raise an exception for bad status codes
 
         data = response.json()
@@ -120,99 +142,18 @@ def get_band_standard_dataset(symbols : list):
                     "multiplier": multiplier,
                     "px": px,
                     "request_id": symbol_data.get("request_id"),
+                    "resolve_time": symbol_data.get("resolve_time"),
                 }
         return False, result
     except requests.RequestException as e:
         logger.error(f"Error fetching data from API: {str(e)}")
-        METRIC_OUTBOUND_ERROR.labels('band').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('band').inc()
         return True, []
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        METRIC_OUTBOUND_ERROR.labels('band').inc()
-        return True, []
-
-
-def get_coinone_luna_price():
-    """
-    To be refactored or re-used as appropriate for Symphony
-    try:
-        if vwma_period > 1:
-            url = "https://api.coinone.co.kr/trades/?currency=luna"
-            luna_result = requests.get(url, timeout=http_timeout).json()["completeOrders"]
-
-            sum_price_volume = sum(float(row["price"]) * float(row["qty"]) for row in luna_result
-                                   if float(time.time()) - float(row['timestamp']) < vwma_period)
-            sum_volume = sum(float(row["qty"]) for row in luna_result
-                             if float(time.time()) - float(row['timestamp']) < vwma_period)
-
-            askprice = bidprice = sum_price_volume / sum_volume
-        else:
-            url = "https://api.coinone.co.kr/orderbook/?currency=luna&format=json"
-            luna_result = requests.get(url, timeout=http_timeout).json()
-            askprice = float(luna_result["ask"][0]["price"])
-            bidprice = float(luna_result["bid"][0]["price"])
-
-        midprice = (askprice + bidprice) / 2.0
-        luna_price = {
-            "base_currency": "ukrw",
-            "exchange": "coinone",
-            "askprice": askprice,
-            "bidprice": bidprice,
-            "midprice": midprice
-        }
-        return False, luna_price, "USDKRW", midprice
-    except:
-        logger.exception("Error in get_coinone_luna_price")
-        return True, None, None, None
-    """
-
-def get_binance_luna_price():
-    """
-    To be refactored for Symphony
-    try:
-        client = binance.client.Client(binance_key, binance_secret)
-        avg_price = client.get_avg_price(symbol='LUNAUSDT')
-        luna_price = float(avg_price["price"])
-        return False, luna_price
-    except:
-        logger.exception("Error in get_binance_luna_price")
-        return True, None
-    """
-# Add any other exchange API functions as needed
-
-@time_request('osmolcd')
-def get_osmosis_symphony_price():
-
-    ##TODO- do not use this on mainnet, it can serve very stale prices because of band
-    try:
-        url_extension=f"/osmosis/gamm/v1beta1/pools/{osmosis_pool_id}/prices?base_asset_denom={osmosis_base_asset}&quote_asset_denom={osmosis_quote_asset}"
-        url=osmosis_lcd+url_extension
-        response = requests.get(url, timeout=http_timeout)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        data = response.json()
-        quote_asset_per = data["spot_price"] #this is a price in uOsmo or quote asset - i.e x uOsmo/note or Osmo/MLD
-
-        symbol=osmosis_quote_asset_ticker
-
-        error_flag, result = get_band_standard_dataset([symbol])
-
-        if error_flag:
-            return True, []
-
-        quote_asset_price=result[symbol]["price"]
-        base_asset_dollar_price= float(float(quote_asset_price)*(float(1)/float(quote_asset_per)))  # ($/Osmo)*1/(MLD/Osmo)
-
-        return False, base_asset_dollar_price
-
-    except requests.RequestException as e:
-        logger.error(f"Error fetching Osmosis Symphony Price: {str(e)}")
-        METRIC_OUTBOUND_ERROR.labels('osmolcd').inc()
-        return True, []
-
-
-    except Exception as e:
-        logger.error(f"Unexpected error with Osmosis Symphony Price: {str(e)}")
-        METRIC_OUTBOUND_ERROR.labels('osmolcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('band').inc()
         return True, []
 
 
+register(PriceSource("band", FX, blocking(get_fx_rate_from_band)))
+register(PriceSource("alphavantage", FX, get_alphavantage_fx_rate))
@@ -0,0 +1,131 @@
+"""
+Gas price auto-tuning for next block inclusion.
+
+A static FEE_GAS lets votes slip a block or more behind other txs when the mempool is congested. The tuner
+keeps the --gas-prices of oracle txs between FEE_GAS_MIN and FEE_GAS_MAX from two signals:
+
+- the mempool size, sampled from the RPC num_unconfirmed_txs every FEE_SAMPLE_INTERVAL by the orchestrator
+- the inclusion delay of our own txs - committed height minus the height at broadcast, from the tx tracker
+
+The price goes up by FEE_TUNE_STEP when a tx misses FEE_TARGET_BLOCKS or the mempool holds FEE_CONGESTED_TXS,
+and back down a step after a run of on-time inclusions in an uncongested mempool. Tuning is off unless
+FEE_GAS_MAX is above the FEE_GAS price.
+"""
+import logging
+import re
+import threading
+from typing import List, Optional, Tuple
+
+import requests
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_GAS_PRICE_PATTERN = re.compile(r"^\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z][a-zA-Z0-9/:._-]*)\s*$")
+# on-time inclusions in a row before the price is lowered a step
+RELAX_AFTER = 5
+
+
+def parse_gas_price(gas_price: str) -> Tuple[float, str]:
+    """(amount, denom) of a gas price such as 0.0025note."""
+    match = _GAS_PRICE_PATTERN.match(gas_price)
+    if not match:
+        raise ValueError(f"Invalid gas price {gas_price}")
+    return float(match.group(1)), match.group(2)
+
+
+def with_gas_price(flags: List[str], gas_price: str) -> List[str]:
+    """Copy of tx flags with the --gas-prices value replaced."""
+    flags = list(flags)
+    if "--gas-prices" in flags:
+        flags[flags.index("--gas-prices") + 1] = gas_price
+    return flags
+
+
+class FeeTuner:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.price: Optional[float] = None
+        self.denom: Optional[str] = None
+        self.mempool_txs = 0
+        self.on_time = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.fee_gas_max > parse_gas_price(settings.fee_gas)[0]
+
+    def bounds(self) -> Tuple[float, float]:
+        base = parse_gas_price(settings.fee_gas)[0]
+        return (settings.fee_gas_min or base), max(settings.fee_gas_max, base)
+
+    def _current(self) -> Tuple[float, str]:
+        if self.price is None:
+            self.price, self.denom = parse_gas_price(settings.fee_gas)
+        return self.price, self.denom
+
+    def gas_price(self) -> str:
+        """The --gas-prices value to broadcast with."""
+        if not self.enabled:
+            return settings.fee_gas
+        with self._lock:
+            price, denom = self._current()
+        return f"{price:.10f}".rstrip("0").rstrip(".") + denom
+
+    def tx_flags(self) -> List[str]:
+        """settings.tx_config with the tuned gas price."""
+        return with_gas_price(settings.tx_config, self.gas_price())
+
+    def _step(self, up: bool, reason: str):
+        low, high = self.bounds()
+        price, _ = self._current()
+        if up:
+            new_price = min(high, price * (1 + settings.fee_tune_step))
+        else:
+            new_price = max(low, price / (1 + settings.fee_tune_step))
+        if new_price != price:
+            logger.info(f"Gas price {price:g} -> {new_price:g} {self.denom} ({reason})")
+            self.price = new_price
+        metrics.METRIC_GAS_PRICE.set(self.price)
+
+    def observe_mempool(self, n_txs: int):
+        metrics.METRIC_MEMPOOL_TXS.set(n_txs)
+        if not self.enabled:
+            return
+        with self._lock:
+            self.mempool_txs = n_txs
+            if n_txs >= settings.fee_congested_txs:
+                self.on_time = 0
+                self._step(True, f"{n_txs} txs in the mempool")
+
+    def observe_inclusion(self, delay_blocks: int):
+        """Record the inclusion delay of one of our txs, in blocks (1 = the block after broadcast)."""
+        metrics.METRIC_TX_INCLUSION_DELAY.set(delay_blocks)
+        if not self.enabled:
+            return
+        with self._lock:
+            if delay_blocks > settings.fee_target_blocks:
+                self.on_time = 0
+                self._step(True, f"tx included after {delay_blocks} blocks")
+                return
+            self.on_time += 1
+            if self.on_time >= RELAX_AFTER and self.mempool_txs < settings.fee_congested_txs:
+                self.on_time = 0
+                self._step(False, f"{RELAX_AFTER} txs included on time")
+
+    def sample_mempool(self) -> Optional[int]:
+        """Sample the mempool size from the RPC, None on error."""
+        try:
+            response = requests.get(f"{settings.rpc_http_address}/num_unconfirmed_txs", timeout=settings.http_timeout)
+            response.raise_for_status()
+            n_txs = int(response.json()["result"]["n_txs"])
+        except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to sample the mempool: {e}")
+            metrics.METRIC_OUTBOUND_ERROR.labels('rpc').inc()
+            return None
+        self.observe_mempool(n_txs)
+        return n_txs
+
+
+tuner = FeeTuner()
@@ -0,0 +1,229 @@
+"""
+Optional gRPC transport for chain queries.
+
+The LCD REST gateway is a hop inside the node that re-encodes every response as JSON, whole block bodies of
+blocks/latest included. Queries named in GRPC_QUERIES are sent to the node's gRPC server (GRPC_ADDRESS) instead,
+over one persistent HTTP/2 channel, and only the fields the feeder needs are decoded from the protobuf reply:
+
+    latest_block   cosmos.base.tendermint.v1beta1.Service/GetLatestBlock
+    epochs         <module>.epochs.v1beta1.Query/EpochInfos
+    misses         <module>.oracle.v1beta1.Query/MissCounter
+    prevote        <module>.oracle.v1beta1.Query/AggregatePrevote
+    tx             cosmos.tx.v1beta1.Service/GetTx
+
+Needs grpcio (in requirements.txt), imported on first use. Messages are encoded and decoded here from their
+field numbers, so no generated protobuf code is needed. Every function returns what its REST counterpart in
+blockchain.py returns.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from config import settings
+from prevote_tracker import tracker as prevote_tracker
+
+logger = logging.getLogger(__name__)
+
+QUERIES = ("latest_block", "epochs", "misses", "prevote", "tx")
+
+# protobuf wire types
+VARINT, FIXED64, LENGTH, FIXED32 = 0, 1, 2, 5
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_field(field: int, value) -> bytes:
+    """A varint (int) or length delimited (str / bytes) field."""
+    if isinstance(value, int):
+        return encode_varint(field << 3 | VARINT) + encode_varint(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return encode_varint(field << 3 | LENGTH) + encode_varint(len(value)) + value
+
+
+def iter_fields(data: bytes) -> Iterator[Tuple[int, int, object]]:
+    """(field number, wire type, value) of a message, value is an int or the raw bytes of length delimited fields."""
+    pos = 0
+    while pos < len(data):
+        key, pos = decode_varint(data, pos)
+        field, wire = key >> 3, key & 7
+        if wire == VARINT:
+            value, pos = decode_varint(data, pos)
+        elif wire == LENGTH:
+            length, pos = decode_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire == FIXED64:
+            value, pos = int.from_bytes(data[pos:pos + 8], "little"), pos + 8
+        elif wire == FIXED32:
+            value, pos = int.from_bytes(data[pos:pos + 4], "little"), pos + 4
+        else:
+            raise ValueError(f"unsupported wire type {wire}")
+        yield field, wire, value
+
+
+def decode(data: bytes) -> Dict[int, List[object]]:
+    """Fields of a message by number - nested messages stay bytes, decode them on demand."""
+    message: Dict[int, List[object]] = {}
+    for field, _, value in iter_fields(data):
+        message.setdefault(field, []).append(value)
+    return message
+
+
+def first(message: Dict[int, List[object]], field: int, default=None):
+    values = message.get(field)
+    return values[0] if values else default
+
+
+def timestamp(data: bytes) -> str:
+    """google.protobuf.Timestamp as the RFC3339 time the REST gateway returns."""
+    message = decode(data)
+    seconds, nanos = first(message, 1, 0), first(message, 2, 0)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{nanos:09d}Z"
+
+
+# (address, tls) -> the channel, rebuilt when the settings change
+_channels: Dict[Tuple[str, bool], object] = {}
+_lock = threading.Lock()
+
+
+def serves(query: str) -> bool:
+    return query in settings.grpc_query_list
+
+
+def channel():
+    key = (settings.grpc_address, settings.grpc_tls)
+    with _lock:
+        if key not in _channels:
+            import grpc  # optional - only needed when GRPC_QUERIES is set
+            for stale in _channels.values():
+                stale.close()
+            _channels.clear()
+            if settings.grpc_tls:
+                _channels[key] = grpc.secure_channel(settings.grpc_address, grpc.ssl_channel_credentials())
+            else:
+                _channels[key] = grpc.insecure_channel(settings.grpc_address)
+        return _channels[key]
+
+
+def call(method: str, request: bytes = b"") -> bytes:
+    """Unary call of method (i.e /cosmos.tx.v1beta1.Service/GetTx) with an encoded request, the raw reply."""
+    with metrics.METRIC_OUTBOUND_LATENCY.labels('grpc').time():
+        return channel().unary_unary(method)(request, timeout=settings.http_timeout)
+
+
+def is_not_found(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    return callable(code) and getattr(code(), "name", "") == "NOT_FOUND"
+
+
+def get_latest_block():
+    """(err_flag, height, block time) of the latest block, only its header is decoded."""
+    try:
+        reply = decode(call("/cosmos.base.tendermint.v1beta1.Service/GetLatestBlock"))
+        # block (2) or, on newer nodes, sdk_block (3) -> header (1) -> height (3), time (4)
+        block = first(reply, 3) or first(reply, 2)
+        header = decode(first(decode(block), 1))
+        return False, first(header, 3), timestamp(first(header, 4, b""))
+    except Exception as e:
+        logger.error(f"gRPC error getting the latest block: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('grpc').inc()
+        return True, None, None
+
+
+def get_current_epoch(epoch_identifier: str):
+    """(err_flag, current epoch of epoch_identifier)"""
+    try:
+        reply = decode(call(f"/{settings.module_name}.epochs.v1beta1.Query/EpochInfos"))
+        for epoch in reply.get(1, []):
+            info = decode(epoch)
+            # identifier (1), current_epoch (4), current_epoch_start_height (8)
+            if first(info, 1, b"").decode() == epoch_identifier:
+                if first(info, 8, 0):
+                    prevote_tracker.observe_epoch_start(first(info, 4, 0), first(info, 8, 0))
+                return False, first(info, 4, 0)
+        logger.warning(f"No epoch found with identifier '{epoch_identifier}' over gRPC")
+        return True, None
+    except Exception as e:
+        logger.error(f"gRPC error getting the current epoch: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('grpc').inc()
+        return True, None
+
+
+def get_current_misses(valoper: str) -> Optional[int]:
+    try:
+        reply = decode(call(f"/{settings.module_name}.oracle.v1beta1.Query/MissCounter", encode_field(1, valoper)))
+        return first(reply, 1, 0)
+    except Exception as e:
+        logger.error(f"gRPC error getting the misses of {valoper}: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('grpc').inc()
+        return None
+
+
+def get_my_current_prevote_hash(valoper: str):
+    """Hash of valoper's aggregate prevote, [] if there is none or the query failed."""
+    try:
+        reply = decode(call(f"/{settings.module_name}.oracle.v1beta1.Query/AggregatePrevote", encode_field(1, valoper)))
+        # aggregate_prevote (1) -> hash (1)
+        return first(decode(first(reply, 1, b"")), 1, b"").decode() or []
+    except Exception as e:
+        if is_not_found(e):
+            return []  # no prevote, like the LCD's 404
+        logger.error(f"gRPC error getting the prevote hash of {valoper}: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('grpc').inc()
+        return []
+
+
+def get_tx(txhash: str) -> Optional[dict]:
+    """The tx as the REST gateway returns it ({"tx": {"body": {"messages": [...]}}, "tx_response": {...}} with the
+    fields the feeder reads, prevote messages decoded), None if it isn't indexed. Other errors are raised."""
+    try:
+        reply = decode(call("/cosmos.tx.v1beta1.Service/GetTx", encode_field(1, txhash)))
+    except Exception as e:
+        if is_not_found(e):
+            return None
+        raise
+    # tx (1): body (1): messages (1) as Any: type_url (1), value (2)
+    messages = []
+    for message in decode(first(decode(first(reply, 1, b"")), 1, b"")).get(1, []):
+        message = decode(message)
+        type_url = first(message, 1, b"").decode()
+        if type_url.endswith(".MsgAggregateExchangeRatePrevote"):
+            # hash (1), feeder (2), validator (3)
+            value = decode(first(message, 2, b""))
+            messages.append({"@type": type_url, "hash": first(value, 1, b"").decode(),
+                             "feeder": first(value, 2, b"").decode(), "validator": first(value, 3, b"").decode()})
+        else:
+            messages.append({"@type": type_url})
+    # tx_response (2): height (1), txhash (2), code (4), raw_log (6), gas_wanted (9), gas_used (10)
+    tx_response = decode(first(reply, 2, b""))
+    return {"tx": {"body": {"messages": messages}}, "tx_response": {
+        "height": str(first(tx_response, 1, 0)),
+        "txhash": first(tx_response, 2, b"").decode(),
+        "code": first(tx_response, 4, 0),
+        "raw_log": first(tx_response, 6, b"").decode(),
+        "gas_wanted": str(first(tx_response, 9, 0)),
+        "gas_used": str(first(tx_response, 10, 0)),
+    }}
@@ -0,0 +1,182 @@
+"""
+Active/standby high availability.
+
+Instances share a lease file (HA_LEASE_FILE, on storage every instance can reach). Whoever holds an unexpired
+lease is the leader and is the only instance that votes; standbys keep tracking blocks and fetching prices so
+they are warm, and try to take the lease every poll so they take over within a block of it expiring.
+After every vote the leader replicates its voting state (last price, salt and hash per validator) to
+HA_STATE_FILE, so a new leader can reveal the prevote made by the previous one.
+
+The lease is checked once per poll, so a leader stalled past its lease (i.e a long GC pause or a hung LCD call)
+could still broadcast after a standby took over. vote_handler re-reads the lease file right before every
+broadcast (`lease_lost()`): if another holder or term took it over, or it expired, nothing is sent.
+"""
+import json
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _write_json_atomic(path: str, data: dict):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read {path}: {e}")
+        return None
+
+
+class FileLease:
+    """Time based leader lease stored as JSON {holder, term, expires_at} in a file on shared storage."""
+
+    def __init__(self, path: str, holder: str, ttl: float):
+        self.path = path
+        self.holder = holder
+        self.ttl = ttl
+        # stop acting as leader a little before the lease actually expires, to tolerate clock skew between hosts
+        self.guard = ttl / 5
+        self.term = 0
+        self.expires_at = 0.0
+
+    @property
+    def held(self) -> bool:
+        return time.time() < self.expires_at - self.guard
+
+    @contextmanager
+    def _mutex(self):
+        """Exclusive create of a lock file serialises the read-modify-write of the lease between instances."""
+        lock_path = f"{self.path}.lock"
+        deadline = time.monotonic() + 1.0
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > self.ttl:
+                        os.unlink(lock_path)  # left behind by a crashed instance
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"lease lock {lock_path} busy")
+                time.sleep(0.05)
+        try:
+            os.close(fd)
+            yield
+        finally:
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+
+    def try_acquire(self) -> bool:
+        """Acquire or renew the lease. Returns True if this instance is the leader afterwards."""
+        try:
+            with self._mutex():
+                now = time.time()
+                current = _read_json(self.path)
+                if current and current.get("holder") != self.holder and current.get("expires_at", 0) > now:
+                    self.expires_at = 0.0
+                    return False
+
+                renewing = bool(current) and current.get("holder") == self.holder
+                term = current.get("term", 0) if current else 0
+                self.term = term if renewing else term + 1
+                self.expires_at = now + self.ttl
+                _write_json_atomic(self.path, {"holder": self.holder, "term": self.term, "expires_at": self.expires_at})
+                return True
+        except (OSError, TimeoutError) as e:
+            logger.error(f"Failed to acquire lease {self.path}: {e}")
+            self.expires_at = 0.0
+            return False
+
+    def verify(self) -> bool:
+        """Re-read the lease file: True if this instance still holds the lease, in the same term, unexpired."""
+        if not self.held:
+            return False
+        current = _read_json(self.path)
+        if (current and current.get("holder") == self.holder and current.get("term") == self.term
+                and current.get("expires_at", 0) - self.guard > time.time()):
+            return True
+        logger.error(f"Lease {self.path} no longer held by {self.holder} (term {self.term}): {current}")
+        self.expires_at = 0.0
+        return False
+
+    def release(self):
+        if not self.held:
+            return
+        try:
+            with self._mutex():
+                current = _read_json(self.path)
+                if current and current.get("holder") == self.holder:
+                    os.unlink(self.path)
+        except (OSError, TimeoutError) as e:
+            logger.error(f"Failed to release lease {self.path}: {e}")
+        self.expires_at = 0.0
+
+
+class VoteStateStore:
+    """Replicates the leader's voting state so a new leader can reveal the last prevote."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def save(self, vote_states: Dict[str, Tuple], last_prevoted_epoch: int, term: int):
+        try:
+            _write_json_atomic(self.path, {
+                "term": term,
+                "last_prevoted_epoch": last_prevoted_epoch,
+                "vote_states": {valoper: list(state) for valoper, state in vote_states.items()},
+                "saved_at": time.time(),
+            })
+        except OSError as e:
+            logger.error(f"Failed to replicate vote state to {self.path}: {e}")
+
+    def load(self) -> Tuple[Dict[str, Tuple], int]:
+        data = _read_json(self.path)
+        if not data:
+            return {}, 0
+        vote_states = {valoper: tuple(state) for valoper, state in data.get("vote_states", {}).items()}
+        return vote_states, int(data.get("last_prevoted_epoch", 0))
+
+
+def default_node_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+# the lease this process competes for, None without HA
+current_lease: Optional[FileLease] = None
+
+
+def lease_lost() -> bool:
+    """True if HA is on and this instance doesn't hold the lease (anymore) - it must not broadcast."""
+    return current_lease is not None and not current_lease.verify()
+
+
+def get_ha_components() -> Tuple[Optional[FileLease], Optional[VoteStateStore]]:
+    """Lease and state store from settings, or (None, None) when HA_LEASE_FILE is not set."""
+    global current_lease
+    if not settings.ha_lease_file:
+        return None, None
+    current_lease = FileLease(settings.ha_lease_file, settings.ha_node_id or default_node_id(), settings.ha_lease_ttl)
+    store = VoteStateStore(settings.ha_state_file or f"{settings.ha_lease_file}.state.json")
+    return current_lease, store
@@ -0,0 +1,243 @@
+"""
+Shared HTTP GET client: single-flight requests and the LCD endpoint pool.
+
+`get(url)` merges identical GETs: a request for a URL (with its query) already in flight waits for that one
+instead of sending its own, and a response finished less than HTTP_MICRO_CACHE seconds ago is returned as is.
+Callers share the response object, so they must not modify it - streamed GETs, whose body can only be read
+once, aren't merged. `flights.do(key, func)` does the same for any fetch. The share of calls answered without
+a request of their own is exported.
+
+SYMPHONY_LCD takes a comma separated list of LCD endpoints. `lcd_get(path)` sends a GET to the best endpoint
+and fails over to the next one on the first connection error, timeout or 5xx, so one stalled node doesn't
+cost the epoch. Endpoints are ranked by:
+
+1. healthy - answered its last probe / request, isn't syncing and is at most LCD_MAX_LAG blocks behind the
+   highest height seen across the pool
+2. latency - moving average of its probe and request latencies
+
+Unhealthy endpoints are still tried, last. With more than one endpoint the orchestrator probes every endpoint
+(`/syncing` and the latest block height) every LCD_PROBE_INTERVAL seconds; pre-flight reports the same health.
+Probes bypass the single-flight layer, their latency must be their own.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# weight of the newest sample in the latency moving average
+LATENCY_ALPHA = 0.3
+
+
+@dataclass
+class _Flight:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: Optional[Exception] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.flights: Dict[str, _Flight] = {}
+        # key -> (result, finished at)
+        self.recent: Dict[str, Tuple[Any, float]] = {}
+        self.counts = {"upstream": 0, "joined": 0, "cached": 0}
+
+    def _count(self, outcome: str):
+        # called under the lock
+        self.counts[outcome] += 1
+        metrics.METRIC_HTTP_GETS.labels(outcome).inc()
+        metrics.METRIC_HTTP_COALESCING_RATIO.set(1 - self.counts["upstream"] / sum(self.counts.values()))
+
+    def do(self, key: str, func: Callable[[], Any], cacheable: Callable[[Any], bool] = lambda result: True) -> Any:
+        """func(), or the result of the call of the same key in flight or finished within HTTP_MICRO_CACHE."""
+        with self._lock:
+            now = time.monotonic()
+            recent = self.recent.get(key)
+            if recent is not None and now - recent[1] <= settings.http_micro_cache:
+                self._count("cached")
+                return recent[0]
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+            self._count("upstream" if leader else "joined")
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self.flights[key]
+                now = time.monotonic()
+                self.recent = {cached: entry for cached, entry in self.recent.items()
+                               if now - entry[1] <= settings.http_micro_cache}
+                if flight.error is None and settings.http_micro_cache > 0 and cacheable(flight.result):
+                    self.recent[key] = (flight.result, now)
+            flight.done.set()
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        if kwargs.get("stream"):
+            return requests.get(url, params=params, **kwargs)
+        key = f"{url}?{urlencode(params, doseq=True)}" if params else url
+        return self.do(key, lambda: requests.get(url, params=params, **kwargs),
+                       cacheable=lambda response: response.status_code < 500)
+
+
+flights = SingleFlight()
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """requests.get, merged with identical GETs in flight or finished within HTTP_MICRO_CACHE seconds."""
+    return flights.get(url, **kwargs)
+
+
+@dataclass
+class EndpointHealth:
+    url: str
+    latency: Optional[float] = None
+    height: Optional[int] = None
+    syncing: bool = False
+    error: Optional[str] = None
+    probed_at: float = 0.0
+
+    def observe_latency(self, latency: float):
+        self.latency = latency if self.latency is None else (1 - LATENCY_ALPHA) * self.latency + LATENCY_ALPHA * latency
+
+
+class LcdPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointHealth] = {}
+
+    @property
+    def urls(self) -> List[str]:
+        return settings.lcd_address_list
+
+    def _health(self, url: str) -> EndpointHealth:
+        if url not in self.endpoints:
+            self.endpoints[url] = EndpointHealth(url)
+        return self.endpoints[url]
+
+    def max_height(self) -> Optional[int]:
+        heights = [health.height for health in self.endpoints.values() if health.height is not None]
+        return max(heights) if heights else None
+
+    def is_healthy(self, health: EndpointHealth, max_height: Optional[int] = None) -> bool:
+        if health.error or health.syncing:
+            return False
+        if health.height is None or max_height is None:
+            return True
+        return max_height - health.height <= settings.lcd_max_lag
+
+    def ranked(self) -> List[str]:
+        urls = self.urls
+        if len(urls) == 1:
+            return urls
+        with self._lock:
+            max_height = self.max_height()
+            healths = [self._health(url) for url in urls]
+            return [health.url for health in sorted(healths, key=lambda health: (
+                not self.is_healthy(health, max_height),
+                health.latency if health.latency is not None else settings.http_timeout))]
+
+    def succeeded(self, url: str, latency: float):
+        with self._lock:
+            health = self._health(url)
+            health.observe_latency(latency)
+            health.error = None
+
+    def failed(self, url: str, error: str):
+        with self._lock:
+            self._health(url).error = error
+        metrics.METRIC_LCD_HEALTHY.labels(url).set(0)
+
+    def probe(self, url: str) -> EndpointHealth:
+        """Refresh the health of one endpoint: sync status, latest height and latency."""
+        started = time.monotonic()
+        try:
+            response = requests.get(f"{url}/cosmos/base/tendermint/v1beta1/syncing", timeout=settings.http_timeout)
+            response.raise_for_status()
+            syncing = response.json().get("syncing", True)
+            latency = time.monotonic() - started
+            from block_header import read_header  # block_header builds on this module
+            response = requests.get(f"{url}/cosmos/base/tendermint/v1beta1/blocks/latest",
+                                    timeout=settings.http_timeout, stream=True)
+            response.raise_for_status()
+            height = int(read_header(response)[0]["height"])
+        except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"LCD {url} failed its health probe: {e}")
+            self.failed(url, str(e))
+        else:
+            with self._lock:
+                health = self._health(url)
+                health.observe_latency(latency)
+                health.syncing, health.height, health.error = syncing, height, None
+        with self._lock:
+            health = self._health(url)
+            health.probed_at = time.time()
+            max_height = self.max_height()
+            healthy = self.is_healthy(health, max_height)
+        metrics.METRIC_LCD_HEALTHY.labels(url).set(1 if healthy else 0)
+        if health.latency is not None:
+            metrics.METRIC_LCD_LATENCY.labels(url).set(health.latency)
+        return health
+
+    def probe_all(self) -> List[EndpointHealth]:
+        return [self.probe(url) for url in self.urls]
+
+    def healthy(self) -> List[EndpointHealth]:
+        with self._lock:
+            max_height = self.max_height()
+            return [self._health(url) for url in self.urls if self.is_healthy(self._health(url), max_height)]
+
+
+pool = LcdPool()
+
+
+def lcd_get(path: str, **kwargs) -> requests.Response:
+    """GET path (i.e /cosmos/tx/v1beta1/txs/HASH) from the best LCD endpoint, failing over on error.
+
+    Raises the last error if no endpoint answered; a 5xx from every endpoint returns the last response."""
+    kwargs.setdefault("timeout", settings.http_timeout)
+    urls = pool.ranked()
+    error: Optional[Exception] = None
+    response = None
+    for index, url in enumerate(urls):
+        started = time.monotonic()
+        try:
+            response = get(f"{url}{path}", **kwargs)
+        except requests.RequestException as e:
+            error = e
+            pool.failed(url, str(e))
+        else:
+            if response.status_code < 500:
+                pool.succeeded(url, time.monotonic() - started)
+                return response
+            pool.failed(url, f"HTTP {response.status_code}")
+            if index + 1 < len(urls):
+                response.close()
+        if index + 1 < len(urls):
+            logger.warning(f"LCD {url} failed on {path}, failing over to {urls[index + 1]}")
+            metrics.METRIC_LCD_FAILOVER.inc()
+    if response is not None:
+        return response
+    raise error
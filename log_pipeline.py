@@ -0,0 +1,159 @@
+"""
+Logging off the hot path.
+
+setup_logging() routes every record through a QueueHandler: the logging call only runs the filters below and
+enqueues the record, and a QueueListener thread formats and writes it. Records are enqueued unformatted, so
+lazy %-style arguments (logger.debug("...%s", value)) are only rendered by the writer thread, and only for
+records that pass the level - arguments must not be modified after the call.
+
+Filters, run in the thread that logs:
+- correlation: the epoch, tx and validator bound with `log_context(epoch=..., tx=..., validator=...)` are attached
+  to each record. They are contextvars, so they follow asyncio tasks and asyncio.to_thread
+- sampling: INFO and DEBUG records beyond LOG_SAMPLE_BURST per call site (and validator, so one validator's vote
+  lines never crowd out another's) per LOG_SAMPLE_WINDOW seconds are dropped; the next record written from that
+  site carries the number suppressed
+
+LOG_FORMAT=json writes one JSON object per line (ts, level, logger, msg, epoch, tx, validator, suppressed, exc),
+text keeps the classic format with the correlation IDs appended.
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+epoch_id: contextvars.ContextVar = contextvars.ContextVar("epoch_id", default=None)
+tx_id: contextvars.ContextVar = contextvars.ContextVar("tx_id", default=None)
+validator_id: contextvars.ContextVar = contextvars.ContextVar("validator_id", default=None)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message).1000s%(correlation)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@contextlib.contextmanager
+def log_context(epoch: Optional[int] = None, tx: Optional[str] = None, validator: Optional[str] = None):
+    """Tag the records logged in this block (and the threads it hands work to) with epoch / tx / validator."""
+    tokens = []
+    if epoch is not None:
+        tokens.append((epoch_id, epoch_id.set(epoch)))
+    if tx is not None:
+        tokens.append((tx_id, tx_id.set(tx)))
+    if validator is not None:
+        tokens.append((validator_id, validator_id.set(validator)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.epoch = epoch_id.get()
+        record.tx = tx_id.get()
+        record.validator = validator_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Let through at most burst INFO / DEBUG records per call site and validator per window seconds."""
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        # (pathname, lineno, validator) -> [window start, records let through, records suppressed]
+        self._sites: Dict[Tuple[str, int, Optional[str]], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.suppressed = 0
+        if record.levelno >= logging.WARNING or self.burst <= 0:
+            return True
+        now = record.created
+        with self._lock:
+            key = (record.pathname, record.lineno, getattr(record, "validator", None))
+            site = self._sites.setdefault(key, [now, 0, 0])
+            if now - site[0] >= self.window:
+                site[0], site[1] = now, 0
+            if site[1] >= self.burst:
+                site[2] += 1
+                return False
+            site[1] += 1
+            record.suppressed, site[2] = site[2], 0
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records as they are - QueueHandler would format them in the thread that logs."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        correlation = [f"{name}={value}" for name, value in
+                       (("epoch", getattr(record, "epoch", None)), ("tx", getattr(record, "tx", None)),
+                        ("validator", getattr(record, "validator", None)))
+                       if value is not None]
+        if getattr(record, "suppressed", 0):
+            correlation.append(f"suppressed={record.suppressed}")
+        record.correlation = f" [{' '.join(correlation)}]" if correlation else ""
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("epoch", "tx", "validator", "suppressed"):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup(level: int, fmt: str = "text", sample_burst: int = 20, sample_window: float = 60.0):
+    """Install the queue handler on the root logger and start the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    else:
+        atexit.register(stop)
+
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(CorrelationFilter())
+    handler.addFilter(SamplingFilter(sample_burst, sample_window))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, writer, respect_handler_level=True)
+    _listener.start()
+
+
+def stop():
+    """Flush the queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,84 +1,52 @@
 #!/usr/bin/python3 -u
 # -*- coding: utf-8 -*-
-import time
+import asyncio
 import logging
-from prometheus_client import start_http_server
 
-from config import *
+import metrics
+from config import settings, setup_logging
+from ha import get_ha_components
+from orchestrator import Orchestrator
 from pre_flight_check import wait_for_ready
-from price_feeder import get_prices, format_prices
-from vote_handler import process_votes
-from blockchain import get_latest_block, get_current_misses, get_oracle_params, get_current_epoch
-from alerts import telegram, slack
+from price_publisher import run_publisher
+from alerts import telegram
 
-logging.basicConfig(
-    level=logging.DEBUG if debug else logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message).1000s'  # Increase message length
-)
 logger = logging.getLogger(__name__)
-logger.debug("logging test")
 
 def main():
     logger.debug("main")
     telegram("Starting Feeder")
-    start_http_server(int(metrics_port))
+    metrics.start_metrics_server(settings.metrics_port)
     logger.debug("starting http server")
-    last_prevoted_round = 0
-    last_prevoted_epoch=0
-    last_price = {}
-    last_salt = {}
-    last_hash = []
-    misses = 0
+    identities = settings.validators
+    if settings.multi_validator:
+        logger.info(f"Multi validator mode: voting for {len(identities)} validators: {[i.valoper for i in identities]}")
 
     ##perform our pre-flight checks
     if not wait_for_ready():
         logger.error("preflight checks failed")
         exit(1)
 
+    if settings.record_file:
+        from replay import Recorder
+        Recorder(settings.record_file).start()
 
-    while True:
-        latest_block_err_flag, height, latest_block_time = get_latest_block()
-        current_epoch_err_flag, current_epoch = get_current_epoch("minute")
-        if (not current_epoch_err_flag
-                and not latest_block_err_flag
-                and current_epoch > last_prevoted_epoch):
+    lease, state_store = get_ha_components()
+    if lease is not None:
+        logger.info(f"HA mode: {lease.holder} competing for lease {lease.path}")
 
-                prices = get_prices()
-                prices = format_prices(prices)
-
-                if prices:
-                    last_price, last_salt, last_hash = process_votes(prices, last_price, last_salt,
-                                                                                  last_hash,  current_epoch)
-                    last_prevoted_epoch = current_epoch
-
-                currentmisses = get_current_misses()
-                currentheight = height
-                METRIC_HEIGHT.set(currentheight)
-                METRIC_MISSES.set(currentmisses)
-                METRIC_EPOCHS.set(current_epoch)
-                # turned off the misses height and misses alerting until can work out if the height is current height or something from the old miss API
-                #if its nothing special, can use current block height?
-                """if currentheight > 0:
-                    misspercentage = round(float(currentmisses) / float(currentheight) * 100, 2)
-                    logger.info(f"Current miss percentage: {misspercentage}%")
-                """
-                if currentmisses > misses:
-                    alarm_content = f"Symphony Oracle misses went from {misses} to {currentmisses} )"
-                    logger.error(alarm_content)
-                    if alertmisses:
-                        telegram(alarm_content)
-                        slack(alarm_content)
-                    misses = currentmisses
-
-        else:
-            logger.debug(f"current epoch: {current_epoch} last prevote : {last_prevoted_epoch} current height: {height} waiting for next epoch")
-
-        time.sleep(1)
+    # block tracking, price refresh, voting, miss monitoring and alerting run as independent tasks
+    asyncio.run(Orchestrator(identities, lease=lease, state_store=state_store).run())
 
 
 if __name__ == "__main__":
+    setup_logging()
     try:
-        main()
+        if settings.price_feed_mode == "publish":
+            metrics.start_metrics_server(settings.metrics_port)
+            run_publisher()
+        else:
+            main()
     except KeyboardInterrupt:
         logger.exception("Keyboard Interrupted")
         raise
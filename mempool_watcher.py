@@ -0,0 +1,95 @@
+"""
+Mempool presence checks for broadcast txs.
+
+A tx accepted at broadcast can still be lost before it is committed: async broadcasts skip CheckTx, and a tx
+that fails the recheck after a block (i.e a sequence mismatch) or is evicted from a full mempool simply
+disappears. Waiting for the indexer to time out costs BLOCK_WAIT_TIME plus the indexer retries. Once a block
+was produced after a tx's broadcast (or MEMPOOL_DROP_MIN_AGE seconds passed) and its indexer lookup came back
+empty, the tx tracker asks the MempoolWatcher about it: a tx that is neither in the RPC node's unconfirmed_txs
+nor committed (RPC /tx) on two consecutive checks is reported dropped, so the vote can be retried straight away. When the node is unreachable or its mempool is larger than one unconfirmed_txs page,
+nothing is concluded.
+"""
+import base64
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional, Set
+
+import requests
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# unconfirmed_txs page size (the RPC maximum)
+MEMPOOL_PAGE = 100
+
+
+def tx_hash(tx_base64: str) -> str:
+    """Tx hash (uppercase hex sha256 of the tx bytes) of a base64 tx as listed by unconfirmed_txs."""
+    return hashlib.sha256(base64.b64decode(tx_base64)).hexdigest().upper()
+
+
+def mempool_hashes() -> Optional[Set[str]]:
+    """Hashes of every tx in the RPC node's mempool, None if unavailable or too large to list in one page."""
+    try:
+        response = requests.get(f"{settings.rpc_http_address}/unconfirmed_txs", params={"limit": MEMPOOL_PAGE},
+                                timeout=settings.http_timeout)
+        response.raise_for_status()
+        result = response.json()["result"]
+        txs = result.get("txs") or []
+        if int(result.get("total", len(txs))) > len(txs):
+            return None
+        return {tx_hash(tx) for tx in txs}
+    except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+        logger.debug(f"Failed to list the mempool: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('rpc').inc()
+        return None
+
+
+def committed_on_rpc(txhash: str) -> Optional[bool]:
+    """Whether the RPC node has txhash in a block, None if the node couldn't be asked."""
+    try:
+        response = requests.get(f"{settings.rpc_http_address}/tx", params={"hash": f"0x{txhash}"},
+                                timeout=settings.http_timeout)
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.debug(f"Failed to query tx {txhash} on the RPC: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('rpc').inc()
+        return None
+    if "result" in data:
+        return True
+    if "not found" in str(data.get("error", "")):
+        return False
+    return None
+
+
+class MempoolWatcher:
+    def __init__(self, checks_to_drop: int = 2):
+        self.checks_to_drop = checks_to_drop
+        # txhash -> consecutive checks it was neither in the mempool nor committed
+        self._absent: Dict[str, int] = {}
+
+    def check(self, txhashes: Iterable[str]) -> Dict[str, str]:
+        """Check pending txs, returning txhash -> reason for those that were dropped."""
+        txhashes = list(txhashes)
+        if not txhashes:
+            return {}
+        in_mempool = mempool_hashes()
+        if in_mempool is None:
+            return {}
+
+        dropped = {}
+        for txhash in txhashes:
+            if txhash in in_mempool or committed_on_rpc(txhash) is not False:
+                # the tx indexer lags the mempool, so a committed tx can briefly be in neither
+                self._absent.pop(txhash, None)
+                continue
+            self._absent[txhash] = self._absent.get(txhash, 0) + 1
+            if self._absent[txhash] >= self.checks_to_drop:
+                del self._absent[txhash]
+                dropped[txhash] = "dropped from the mempool without being committed"
+        return dropped
+
+    def forget(self, txhash: str):
+        self._absent.pop(txhash, None)
@@ -0,0 +1,91 @@
+"""
+Prometheus Metrics
+
+Metrics are declared here and only created (and registered with prometheus_client) the first time they are
+used, so importing this module is free of side effects - use them as module attributes, i.e metrics.METRIC_VOTES.inc()
+"""
+import threading
+
+_METRICS = {
+    "METRIC_MISSES": ("Gauge", "symphony_oracle_misses_total", "Total number of oracle misses", ()),
+    "METRIC_HEIGHT": ("Gauge", "symphony_oracle_height", "Block height of the LCD node", ()),
+    "METRIC_VOTES": ("Counter", "symphony_oracle_votes", "Counter of oracle votes", ()),
+    "METRIC_EPOCHS": ("Gauge", "symphony_oracle_epoch", "EPOCH reported by the LCD node", ()),
+    "METRIC_VALIDATOR_MISSES": ("Gauge", "symphony_oracle_validator_misses", "Oracle miss counter per validator", ("valoper",)),
+    "METRIC_MISS_QUERY_OK": ("Gauge", "symphony_oracle_miss_query_ok", "1 if the last miss counter query succeeded, 0 on LCD error", ("valoper",)),
+    "METRIC_MISS_RATE": ("Gauge", "symphony_oracle_miss_rate", "Misses per vote period over the sampled history", ("valoper",)),
+    "METRIC_PROJECTED_WINDOW_MISSES": ("Gauge", "symphony_oracle_projected_window_misses", "Misses per slash window at the current miss rate", ("valoper",)),
+    "METRIC_ALLOWED_WINDOW_MISSES": ("Gauge", "symphony_oracle_allowed_window_misses", "Misses per slash window allowed before slashing", ()),
+
+    "METRIC_MARKET_PRICE": ("Gauge", "symphony_oracle_market_price", "Last market price", ("denom",)),
+    #"METRIC_SWAP_PRICE": ("Gauge", "terra_oracle_swap_price", "Last swap price", ("denom",)),
+
+    "METRIC_SOURCE_LATENCY": ("Histogram", "symphony_oracle_source_latency_seconds", "Fetch latency per price source", ("source",)),
+    "METRIC_SOURCE_ERRORS": ("Counter", "symphony_oracle_source_errors", "Failed or timed out fetches per price source", ("source",)),
+    "METRIC_SOURCE_SCORE": ("Gauge", "symphony_oracle_source_score", "Quality score (0 to 1) weighting each price source", ("source",)),
+    "METRIC_SOURCE_DEVIATION": ("Gauge", "symphony_oracle_source_deviation", "Last median relative deviation of a price source from the aggregated price", ("source",)),
+    "METRIC_SOURCE_DROPPED": ("Gauge", "symphony_oracle_source_dropped", "1 if a price source is dropped from the fan-out for its score", ("source",)),
+    "METRIC_SOURCE_AGE": ("Gauge", "symphony_oracle_source_age_seconds", "Age of the data served by each price source", ("source",)),
+
+    "METRIC_RATE_LIMIT_BUDGET": ("Gauge", "symphony_oracle_rate_limit_budget", "Share of the request quota left per remote", ("remote",)),
+    "METRIC_RATE_LIMITED": ("Counter", "symphony_oracle_rate_limited", "Calls over the quota served from cache per remote", ("remote",)),
+    "METRIC_RATE_LIMIT_WAIT": ("Histogram", "symphony_oracle_rate_limit_wait_seconds", "Time calls over the quota waited for their turn per remote", ("remote",)),
+
+    "METRIC_BLOCK_POLL_BYTES": ("Counter", "symphony_oracle_block_poll_bytes", "Bytes read polling the latest block header", ("source",)),
+    "METRIC_BLOCK_POLL_CPU": ("Histogram", "symphony_oracle_block_poll_cpu_seconds", "CPU time per latest block header poll", ("source",)),
+    "METRIC_HTTP_GETS": ("Counter", "symphony_oracle_http_gets", "GETs sent upstream, joined to one in flight or served from the micro cache", ("outcome",)),
+    "METRIC_HTTP_COALESCING_RATIO": ("Gauge", "symphony_oracle_http_coalescing_ratio", "Share of GETs answered without an upstream request of their own", ()),
+    "METRIC_LCD_HEALTHY": ("Gauge", "symphony_oracle_lcd_healthy", "1 if an LCD endpoint is synced, up to date and answering", ("endpoint",)),
+    "METRIC_LCD_LATENCY": ("Gauge", "symphony_oracle_lcd_latency_seconds", "Moving average latency of an LCD endpoint", ("endpoint",)),
+    "METRIC_LCD_FAILOVER": ("Counter", "symphony_oracle_lcd_failovers", "LCD requests retried on the next endpoint", ()),
+
+    "METRIC_BAND_QUOTE_AGE": ("Gauge", "symphony_oracle_band_quote_age_seconds", "Age of the last Band quote per symbol", ("symbol",)),
+    "METRIC_BAND_QUOTE_STALE": ("Gauge", "symphony_oracle_band_quote_stale", "1 if the Band quote of a symbol is stale and not voted", ("symbol",)),
+    "METRIC_BAND_QUOTE_UPDATES": ("Counter", "symphony_oracle_band_quote_updates", "New Band requests seen per symbol", ("symbol",)),
+    "METRIC_OSMOSIS_POOL_PRICE": ("Gauge", "symphony_oracle_osmosis_pool_price", "Time weighted base asset per quote asset price of an Osmosis pool", ("pool",)),
+
+    "METRIC_PRICE_FEED_VERSION": ("Gauge", "symphony_oracle_price_feed_version", "Version of the last published price snapshot", ()),
+    "METRIC_PRICE_FEED_AGE": ("Gauge", "symphony_oracle_price_feed_age_seconds", "Age of the price snapshot used by this voter", ()),
+
+    "METRIC_HA_LEADER": ("Gauge", "symphony_oracle_ha_leader", "1 if this instance holds the HA lease and votes", ()),
+
+    "METRIC_PREVOTE_LOOKUPS": ("Counter", "symphony_oracle_prevote_hash_lookups", "Prevote hash lookups answered locally or from the chain", ("source",)),
+
+    "METRIC_SPECULATION": ("Counter", "symphony_oracle_speculation", "Speculative prevotes used (hit), unavailable at the boundary (miss), rebuilt, or broadcast pre-signed (presigned) / signed again (resigned)", ("outcome",)),
+    "METRIC_SPECULATION_HIT_RATE": ("Gauge", "symphony_oracle_speculation_hit_rate", "Share of epochs voted with a speculatively prepared prevote", ()),
+
+    "METRIC_TX_CONFIRM_TIME": ("Histogram", "symphony_oracle_tx_confirm_seconds", "Broadcast to indexed tx result", ("kind",)),
+    "METRIC_TX_GAS_USED": ("Gauge", "symphony_oracle_tx_gas_used", "Gas used by the last confirmed tx", ("kind",)),
+
+    "METRIC_TX_DROPPED": ("Counter", "symphony_oracle_tx_dropped", "Txs that left the mempool without being committed", ("kind",)),
+    "METRIC_TX_INCLUSION_DELAY": ("Gauge", "symphony_oracle_tx_inclusion_delay_blocks", "Blocks between broadcast and inclusion of the last confirmed tx", ()),
+    "METRIC_GAS_PRICE": ("Gauge", "symphony_oracle_gas_price", "Gas price chosen by the fee tuner", ()),
+    "METRIC_MEMPOOL_TXS": ("Gauge", "symphony_oracle_mempool_txs", "Unconfirmed txs in the RPC node mempool", ()),
+
+    "METRIC_BLOCK_INTERVAL": ("Gauge", "symphony_oracle_block_interval_seconds", "Estimated block interval (EWMA)", ()),
+
+    "METRIC_OUTBOUND_ERROR": ("Counter", "terra_oracle_request_errors", "Outbound HTTP request error count", ("remote",)),
+    "METRIC_OUTBOUND_LATENCY": ("Histogram", "terra_oracle_request_latency", "Outbound HTTP request latency", ("remote",)),
+}
+
+_lock = threading.Lock()
+
+
+def __getattr__(name):
+    try:
+        kind, metric_name, documentation, labels = _METRICS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    with _lock:
+        metric = globals().get(name)
+        if metric is None:
+            import prometheus_client
+            metric = getattr(prometheus_client, kind)(metric_name, documentation, list(labels))
+            globals()[name] = metric
+    return metric
+
+
+def start_metrics_server(port: int):
+    from prometheus_client import start_http_server
+    start_http_server(port)
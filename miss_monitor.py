@@ -0,0 +1,99 @@
+"""
+Oracle miss tracking.
+
+The orchestrator samples every validator's miss counter on its own cadence (MISS_CHECK_INTERVAL) and feeds
+the samples to MissMonitor, which keeps the last MISS_HISTORY (epoch, miss_counter) samples per validator and
+derives the miss rate per vote period and, with the oracle params, the misses projected over a slash window
+against the misses allowed before slashing (slash_window * (1 - min_valid_per_window)).
+
+A failed LCD query is reported as such (symphony_oracle_miss_query_ok = 0) and never treated as zero misses.
+"""
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MissSample:
+    epoch: int
+    miss_counter: int
+
+
+def allowed_window_misses(params: dict) -> Optional[float]:
+    """Misses a validator can have in a slash window before it is slashed, None if params are missing."""
+    try:
+        return float(params["slash_window"]) * (1 - float(params["min_valid_per_window"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class MissMonitor:
+    def __init__(self, valopers: List[str], history: Optional[int] = None, initial_misses: Optional[int] = None):
+        history = history or settings.miss_history
+        self.samples: Dict[str, deque] = {valoper: deque(maxlen=history) for valoper in valopers}
+        # last counter seen per validator, misses alerts fire when it goes up
+        start = settings.misses if initial_misses is None else initial_misses
+        self.misses = {valoper: start for valoper in valopers}
+        self.at_risk = set()
+
+    def record(self, valoper: str, epoch: int, miss_counter: int):
+        samples = self.samples[valoper]
+        if samples and samples[-1].epoch == epoch:
+            samples.pop()
+        samples.append(MissSample(epoch, miss_counter))
+
+    def miss_rate(self, valoper: str) -> Optional[float]:
+        """Misses per vote period over the sampled epochs, None until two epochs have been sampled."""
+        samples = self.samples[valoper]
+        if len(samples) < 2 or samples[-1].epoch <= samples[0].epoch:
+            return None
+        missed = 0
+        for previous, current in zip(samples, list(samples)[1:]):
+            delta = current.miss_counter - previous.miss_counter
+            # the counter is reset at the end of every slash window
+            missed += delta if delta >= 0 else current.miss_counter
+        return missed / (samples[-1].epoch - samples[0].epoch)
+
+    def update(self, epoch: int, validator_misses: Dict[str, Optional[int]], params: Optional[dict]) -> List[str]:
+        """Record one round of miss counters, update the gauges and return alert messages."""
+        alerts = []
+        allowed = allowed_window_misses(params) if params else None
+        if allowed is not None:
+            metrics.METRIC_ALLOWED_WINDOW_MISSES.set(allowed)
+
+        for valoper, miss_counter in validator_misses.items():
+            if miss_counter is None:
+                logger.warning(f"Miss counter of {valoper} unavailable (LCD error), keeping the last sample")
+                metrics.METRIC_MISS_QUERY_OK.labels(valoper).set(0)
+                continue
+            metrics.METRIC_MISS_QUERY_OK.labels(valoper).set(1)
+            metrics.METRIC_VALIDATOR_MISSES.labels(valoper).set(miss_counter)
+            self.record(valoper, epoch, miss_counter)
+
+            if miss_counter > self.misses[valoper]:
+                alerts.append(f"Symphony Oracle misses went from {self.misses[valoper]} to {miss_counter} ({valoper})")
+            self.misses[valoper] = miss_counter
+
+            rate = self.miss_rate(valoper)
+            if rate is None:
+                continue
+            metrics.METRIC_MISS_RATE.labels(valoper).set(rate)
+            if allowed is None:
+                continue
+            projected = rate * float(params["slash_window"])
+            metrics.METRIC_PROJECTED_WINDOW_MISSES.labels(valoper).set(projected)
+            if projected > allowed and valoper not in self.at_risk:
+                self.at_risk.add(valoper)
+                alerts.append(f"Symphony Oracle miss rate {rate:.3f} per vote period projects {projected:.0f} misses "
+                              f"per slash window, over the {allowed:.0f} allowed ({valoper})")
+            elif projected <= allowed:
+                self.at_risk.discard(valoper)
+
+        metrics.METRIC_MISSES.set(sum(self.misses.values()))
+        return alerts
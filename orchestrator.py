@@ -0,0 +1,296 @@
+"""
+Asyncio orchestration of the feeder main loop.
+
+Every concern runs as its own task and they talk through queues:
+
+    track_blocks -> epochs -> refresh_prices -> votes -> submit_votes
+    speculate_prices -> (prepared prevotes, taken by refresh_prices at the boundary)
+    monitor_misses -> alerts -> send_alerts
+    sample_mempool -> (fee tuner, when FEE_GAS_MAX enables it)
+    probe_lcds -> (LCD endpoint ranking, with more than one SYMPHONY_LCD)
+    sample_pools -> (Osmosis pool TWAP samples, with OSMOSIS_TWAP_WINDOW and OSMOSIS_TWAP_SAMPLE_INTERVAL)
+
+Only submit_votes is on the critical path - miss checks run on their own cadence and alerting never delays a vote. The deadline of every
+stage is the next epoch boundary: price fetches still running when a newer epoch is seen are abandoned, and
+queued work for a superseded epoch is skipped. Blocking chain / API calls run in worker threads.
+
+With HA enabled (see ha.py) a maintain_lease task runs too, and only the lease holder submits votes.
+"""
+import asyncio
+import logging
+import time
+
+import block_clock
+import metrics
+from alerts import telegram, slack
+from blockchain import get_latest_block, get_current_epoch, get_misses_for_validators, get_oracle_params
+from config import settings
+from fee_tuner import tuner as fee_tuner
+from http_client import pool as lcd_pool
+from log_pipeline import log_context
+from miss_monitor import MissMonitor
+from osmosis_pricing import pricer as osmosis_pricer
+from price_feeder import get_prices, format_prices
+from speculation import Speculator
+from vote_handler import process_votes_for_validators
+
+logger = logging.getLogger(__name__)
+
+
+class EpochSuperseded(Exception):
+    """Raised when work for an epoch is abandoned because a newer epoch has started."""
+
+
+def put_latest(queue: asyncio.Queue, item):
+    """Replace anything still queued with item - consumers only ever care about the newest epoch."""
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+class Orchestrator:
+    def __init__(self, identities=None, epoch_identifier: str = "minute", poll_interval: float = 1.0,
+                 lease=None, state_store=None):
+        self.identities = identities or settings.validators
+        self.valopers = [identity.valoper for identity in self.identities]
+        self.epoch_identifier = epoch_identifier
+        self.poll_interval = poll_interval
+
+        # valoper -> (last_price, last_salt, last_hash)
+        self.vote_states = {valoper: ({}, {}, []) for valoper in self.valopers}
+        self.miss_monitor = MissMonitor(self.valopers)
+
+        self.height = None
+        self.latest_block_time = None
+        self.current_epoch = 0
+        self.last_prevoted_epoch = 0
+        self.pending_epoch = None  # epoch queued or in progress, so the tracker doesn't queue it twice
+        # local time the current epoch was seen to start and the observed epoch length, to predict the next boundary
+        self.epoch_started_at = None
+        self.epoch_duration = None
+        self.speculator = Speculator()
+
+        self.lease = lease
+        self.state_store = state_store
+        self.leader = lease is None
+
+        self.epochs = asyncio.Queue()
+        self.votes = asyncio.Queue()
+        self.alerts = asyncio.Queue()
+        self._epoch_started = asyncio.Event()
+
+    async def run(self):
+        tasks = [
+            self._supervise("block tracker", self.track_blocks),
+            self._supervise("price refresh", self.refresh_prices),
+            self._supervise("vote submission", self.submit_votes),
+            self._supervise("miss monitor", self.monitor_misses),
+            self._supervise("alerting", self.send_alerts),
+        ]
+        # a subscriber only gets the epoch's snapshot after the boundary, there is nothing to speculate on
+        if settings.speculative_lead > 0 and settings.price_feed_mode != "subscribe":
+            tasks.append(self._supervise("speculation", self.speculate_prices))
+        if fee_tuner.enabled:
+            tasks.append(self._supervise("fee tuning", self.sample_mempool))
+        if len(settings.lcd_address_list) > 1:
+            tasks.append(self._supervise("LCD health", self.probe_lcds))
+        if settings.osmosis_twap_window > 0 and settings.osmosis_twap_sample_interval > 0:
+            tasks.append(self._supervise("pool sampling", self.sample_pools))
+        if self.lease is not None:
+            tasks.append(self._supervise("lease", self.maintain_lease))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            if self.lease is not None:
+                self.lease.release()
+
+    async def _supervise(self, name, task):
+        """Keep a task running - an unexpected error is logged and the task restarted."""
+        while True:
+            try:
+                await task()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Error in %s task, restarting: %s", name, e)
+                await asyncio.sleep(self.poll_interval)
+
+    def _new_epoch(self, epoch: int):
+        if self.current_epoch and epoch == self.current_epoch + 1:
+            now = time.time()
+            if self.epoch_started_at is not None:
+                self.epoch_duration = now - self.epoch_started_at
+            self.epoch_started_at = now
+        self.current_epoch = epoch
+        metrics.METRIC_EPOCHS.set(epoch)
+        # wake anything waiting on the old epoch's deadline
+        self._epoch_started.set()
+        self._epoch_started = asyncio.Event()
+
+    async def run_before_next_epoch(self, epoch: int, func, *args):
+        """Run a blocking func in a thread, abandoning it if a newer epoch starts first."""
+        work = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        while epoch >= self.current_epoch:
+            next_epoch = asyncio.ensure_future(self._epoch_started.wait())
+            done, _ = await asyncio.wait({work, next_epoch}, return_when=asyncio.FIRST_COMPLETED)
+            next_epoch.cancel()
+            if work in done:
+                return work.result()
+        work.cancel()
+        raise EpochSuperseded(f"epoch {epoch} superseded by {self.current_epoch}")
+
+    async def track_blocks(self):
+        while True:
+            (block_err, height, block_time), (epoch_err, epoch) = await asyncio.gather(
+                asyncio.to_thread(get_latest_block),
+                asyncio.to_thread(get_current_epoch, self.epoch_identifier),
+            )
+            if not block_err:
+                self.height, self.latest_block_time = height, block_time
+                metrics.METRIC_HEIGHT.set(height)
+
+            if not epoch_err and epoch > self.current_epoch:
+                self._new_epoch(epoch)
+
+            if (not epoch_err and not block_err
+                    and self.current_epoch > self.last_prevoted_epoch
+                    and self.pending_epoch != self.current_epoch):
+                self.pending_epoch = self.current_epoch
+                put_latest(self.epochs, self.current_epoch)
+            else:
+                logger.debug("current epoch: %s last prevote : %s current height: %s waiting for next epoch",
+                             self.current_epoch, self.last_prevoted_epoch, self.height)
+
+            # epochs start on a block, so poll when the next block is expected
+            await asyncio.sleep(block_clock.estimator.delay_until_next_block(
+                default=self.poll_interval, maximum=5 * self.poll_interval))
+
+    def _fetch_prices(self, epoch):
+        return format_prices(get_prices(epoch))
+
+    def next_epoch_at(self):
+        """Predicted local time of the next epoch boundary, None until two boundaries have been seen."""
+        if self.epoch_started_at is None or self.epoch_duration is None:
+            return None
+        return self.epoch_started_at + self.epoch_duration
+
+    async def speculate_prices(self):
+        """Fetch prices and prepare the next epoch's prevotes from SPECULATIVE_LEAD seconds before the boundary."""
+        while True:
+            boundary = self.next_epoch_at()
+            now = time.time()
+            if boundary is None or now >= boundary or not self.is_leader:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if now < boundary - settings.speculative_lead:
+                await asyncio.sleep(boundary - settings.speculative_lead - now)
+                continue
+
+            epoch = self.current_epoch + 1
+            with log_context(epoch=epoch):
+                prices = await asyncio.to_thread(get_prices)
+                if prices and self.current_epoch < epoch:
+                    await asyncio.to_thread(self.speculator.offer, epoch, prices, self.identities, self.vote_states)
+            await asyncio.sleep(settings.speculative_lead / 2)
+
+    async def refresh_prices(self):
+        while True:
+            epoch = await self.epochs.get()
+            prepared = self.speculator.take(epoch) if settings.speculative_lead > 0 else None
+            if prepared is not None:
+                put_latest(self.votes, (epoch, prepared.formatted, prepared.prevotes))
+                continue
+
+            with log_context(epoch=epoch):
+                try:
+                    prices = await self.run_before_next_epoch(epoch, self._fetch_prices, epoch)
+                except EpochSuperseded as e:
+                    logger.error("Price fetch abandoned: %s", e)
+                    prices = None
+
+            if prices:
+                put_latest(self.votes, (epoch, prices, None))
+            elif self.pending_epoch == epoch:
+                self.pending_epoch = None  # let the tracker retry this epoch
+
+    async def submit_votes(self):
+        while True:
+            epoch, prices, prepared = await self.votes.get()
+            if epoch < self.current_epoch:
+                logger.error("Skipping votes for epoch %s, epoch %s has already started", epoch, self.current_epoch)
+                if self.pending_epoch == epoch:
+                    self.pending_epoch = None
+                continue
+
+            if not self.is_leader:
+                logger.debug("Standby: prices ready for epoch %s, not voting", epoch)
+                continue
+
+            with log_context(epoch=epoch):
+                self.vote_states = await asyncio.to_thread(
+                    process_votes_for_validators, prices, self.vote_states, epoch, self.identities, prepared)
+            self.last_prevoted_epoch = epoch
+            # a leader that lost the lease while voting must not overwrite its successor's state
+            if self.state_store is not None and await asyncio.to_thread(self.lease.verify):
+                await asyncio.to_thread(self.state_store.save, self.vote_states, epoch, self.lease.term)
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lease is None or self.lease.held
+
+    async def maintain_lease(self):
+        """Acquire or renew the HA lease every poll; on takeover resume from the replicated vote state."""
+        while True:
+            leader = await asyncio.to_thread(self.lease.try_acquire)
+            if leader and not self.leader:
+                vote_states, last_prevoted_epoch = await asyncio.to_thread(self.state_store.load)
+                self.vote_states.update({valoper: state for valoper, state in vote_states.items()
+                                         if valoper in self.vote_states})
+                self.last_prevoted_epoch = max(self.last_prevoted_epoch, last_prevoted_epoch)
+                self.pending_epoch = None  # vote in the current epoch even if prices were already fetched as standby
+                message = f"Oracle feeder {self.lease.holder} is now leader (term {self.lease.term})"
+                logger.warning(message)
+                self.alerts.put_nowait(message)
+            elif self.leader and not leader:
+                logger.error("Oracle feeder %s lost the lease, now standby", self.lease.holder)
+            self.leader = leader
+            metrics.METRIC_HA_LEADER.set(1 if leader else 0)
+            await asyncio.sleep(self.poll_interval)
+
+    async def monitor_misses(self):
+        """Sample the miss counters every MISS_CHECK_INTERVAL, independent of voting."""
+        while True:
+            validator_misses, (params, params_err) = await asyncio.gather(
+                asyncio.to_thread(get_misses_for_validators, self.valopers),
+                asyncio.to_thread(get_oracle_params),
+            )
+            # turned off the misses height and misses alerting until can work out if the height is current height or something from the old miss API
+            for alarm_content in self.miss_monitor.update(self.current_epoch, validator_misses,
+                                                          None if params_err else params):
+                logger.error(alarm_content)
+                if settings.alertmisses:
+                    self.alerts.put_nowait(alarm_content)
+            await asyncio.sleep(settings.miss_check_interval)
+
+    async def sample_mempool(self):
+        """Feed the mempool size to the fee tuner every FEE_SAMPLE_INTERVAL."""
+        while True:
+            await asyncio.to_thread(fee_tuner.sample_mempool)
+            await asyncio.sleep(settings.fee_sample_interval)
+
+    async def probe_lcds(self):
+        """Health check every LCD endpoint every LCD_PROBE_INTERVAL, concurrently."""
+        while True:
+            await asyncio.gather(*(asyncio.to_thread(lcd_pool.probe, url) for url in lcd_pool.urls))
+            await asyncio.sleep(settings.lcd_probe_interval)
+
+    async def sample_pools(self):
+        """Sample the Osmosis pool spot prices every OSMOSIS_TWAP_SAMPLE_INTERVAL, between the price fetches."""
+        while True:
+            await osmosis_pricer.sample(settings.osmosis_pool_id_list)
+            await asyncio.sleep(settings.osmosis_twap_sample_interval)
+
+    async def send_alerts(self):
+        while True:
+            message = await self.alerts.get()
+            await asyncio.gather(asyncio.to_thread(telegram, message), asyncio.to_thread(slack, message))
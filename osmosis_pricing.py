@@ -0,0 +1,211 @@
+"""
+Base asset pricing from Osmosis pools.
+
+The base asset USD price is the quote asset's Band price divided by the base asset per quote asset spot price
+of the Osmosis pools in OSMOSIS_POOL_IDS (OSMOSIS_POOL_ID when unset). The pools and the Band quote are
+queried concurrently. So that a single swap can't move the vote:
+
+- every spot price fetched is kept as a sample, and each pool is priced by the time weighted average of its
+  samples over the last OSMOSIS_TWAP_WINDOW seconds. Besides the price fetches, the orchestrator samples the
+  pools every OSMOSIS_TWAP_SAMPLE_INTERVAL seconds so the window is covered evenly. Older samples are dropped,
+  and a pool without samples in the window isn't priced
+- pools are weighted by their quote asset liquidity, fetched at most every OSMOSIS_POOL_META_TTL seconds;
+  pools without liquidity data share the average weight
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import http_client
+import metrics
+from alerts import time_request
+from config import settings
+from exchange_apis import get_fresh_band_dataset
+from price_sources import BASE, PriceSource, register
+from rate_limiter import RATE_LIMITED, rate_limited
+
+logger = logging.getLogger(__name__)
+
+# samples kept per pool, whatever the window
+MAX_SAMPLES = 256
+
+
+def twap(samples: List[Tuple[float, float]], now: float) -> float:
+    """Time weighted average of (timestamp, price) samples, each weighted until the next one (the last until now)."""
+    if len(samples) == 1:
+        return samples[0][1]
+    weighted = total = 0.0
+    for (at, price), end in zip(samples, [at for at, _ in samples[1:]] + [now]):
+        duration = max(end - at, 1e-3)
+        weighted += price * duration
+        total += duration
+    return weighted / total
+
+
+def weighted_average(values: List[float], weights: List[Optional[float]]) -> float:
+    known = [weight for weight in weights if weight]
+    default = sum(known) / len(known) if known else 1.0
+    weights = [weight if weight else default for weight in weights]
+    return sum(value * weight for value, weight in zip(values, weights)) / sum(weights)
+
+
+@rate_limited('osmolcd', cached=False)
+@time_request('osmolcd')
+def get_pool_spot_price(pool_id: str) -> Optional[float]:
+    """Base asset per quote asset spot price of a pool, None on error, RATE_LIMITED over the osmolcd quota."""
+    try:
+        url = (f"{settings.osmosis_lcd}/osmosis/gamm/v1beta1/pools/{pool_id}/prices"
+               f"?base_asset_denom={settings.osmosis_base_asset}&quote_asset_denom={settings.osmosis_quote_asset}")
+        response = http_client.get(url, timeout=settings.http_timeout)
+        response.raise_for_status()
+        return float(response.json()["spot_price"])
+    except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+        logger.error(f"Error fetching the spot price of Osmosis pool {pool_id}: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('osmolcd').inc()
+        return None
+
+
+@rate_limited('osmolcd', cached=False)
+@time_request('osmolcd')
+def get_pool_liquidity(pool_id: str) -> Optional[float]:
+    """Quote asset amount in a pool, None on error, RATE_LIMITED over the osmolcd quota."""
+    try:
+        url = f"{settings.osmosis_lcd}/osmosis/poolmanager/v1beta1/pools/{pool_id}/total_pool_liquidity"
+        response = http_client.get(url, timeout=settings.http_timeout)
+        response.raise_for_status()
+        for coin in response.json()["liquidity"]:
+            if coin["denom"] == settings.osmosis_quote_asset:
+                return float(coin["amount"])
+        return None
+    except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Error fetching the liquidity of Osmosis pool {pool_id}: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('osmolcd').inc()
+        return None
+
+
+class OsmosisPricer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, deque] = {}
+        # pool id -> (quote asset liquidity, fetched at)
+        self.liquidity: Dict[str, Tuple[Optional[float], float]] = {}
+
+    def record(self, pool_id: str, price: float, at: Optional[float] = None):
+        at = at or time.time()
+        with self._lock:
+            samples = self.samples.setdefault(pool_id, deque(maxlen=MAX_SAMPLES))
+            samples.append((at, price))
+            if settings.osmosis_twap_window > 0:
+                while samples[0][0] < at - settings.osmosis_twap_window:
+                    samples.popleft()
+
+    def pool_price(self, pool_id: str, now: Optional[float] = None) -> Optional[float]:
+        """TWAP of a pool over the window, the latest spot price if the window is 0. None without samples in it."""
+        now = now or time.time()
+        with self._lock:
+            samples = list(self.samples.get(pool_id, ()))
+        if not samples:
+            return None
+        if settings.osmosis_twap_window <= 0:
+            return samples[-1][1]
+        in_window = [(at, price) for at, price in samples if at >= now - settings.osmosis_twap_window]
+        if not in_window:
+            return None
+        return twap(in_window, now)
+
+    def stale_liquidity(self, pool_ids: List[str]) -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [pool_id for pool_id in pool_ids if pool_id not in self.liquidity
+                    or now - self.liquidity[pool_id][1] > settings.osmosis_pool_meta_ttl]
+
+    def combined_price(self, pool_ids: List[str]) -> Optional[float]:
+        """Liquidity weighted base asset per quote asset price over pool_ids."""
+        prices, weights = [], []
+        for pool_id in pool_ids:
+            price = self.pool_price(pool_id)
+            if price is None or price <= 0:
+                continue
+            prices.append(price)
+            weights.append(self.liquidity.get(pool_id, (None, 0))[0])
+            metrics.METRIC_OSMOSIS_POOL_PRICE.labels(pool_id).set(price)
+        if not prices:
+            return None
+        return weighted_average(prices, weights)
+
+    async def sample(self, pool_ids: List[str]) -> List[str]:
+        """Record a spot price sample of every pool, concurrently.
+
+        Returns the pools sampled, and those skipped for the osmolcd quota - priced from their samples so far,
+        while a pool that stopped answering isn't priced from its old samples. Skipped calls record nothing, so a
+        repeated spot price never passes for a fresh sample."""
+        spot_prices = await asyncio.gather(*(asyncio.to_thread(get_pool_spot_price, pool_id) for pool_id in pool_ids))
+        now = time.time()
+        sampled = []
+        for pool_id, price in zip(pool_ids, spot_prices):
+            if price is RATE_LIMITED:
+                sampled.append(pool_id)
+            elif price is not None and price > 0:
+                self.record(pool_id, price, now)
+                sampled.append(pool_id)
+        return sampled
+
+    async def refresh(self, pool_ids: List[str]) -> List[str]:
+        """Sample every pool's spot price, and fetch the liquidity of pools whose metadata expired, concurrently.
+
+        Returns the pools to price, as sample does."""
+        stale = self.stale_liquidity(pool_ids)
+        sampled, liquidities = await asyncio.gather(
+            self.sample(pool_ids),
+            asyncio.gather(*(asyncio.to_thread(get_pool_liquidity, pool_id) for pool_id in stale)),
+        )
+        now = time.time()
+        with self._lock:
+            for pool_id, liquidity in zip(stale, liquidities):
+                if liquidity is RATE_LIMITED:
+                    continue  # still stale, fetched by the next refresh with budget left
+                if liquidity is None:
+                    # keep the last known liquidity on error, retried once the TTL is up again
+                    liquidity = self.liquidity.get(pool_id, (None, 0))[0]
+                self.liquidity[pool_id] = (liquidity, now)
+        return sampled
+
+
+pricer = OsmosisPricer()
+
+
+async def get_osmosis_symphony_price():
+    pool_ids = settings.osmosis_pool_id_list
+    symbol = settings.osmosis_quote_asset_ticker
+    try:
+        (error_flag, result), sampled = await asyncio.gather(
+            asyncio.to_thread(get_fresh_band_dataset, [symbol]),
+            pricer.refresh(pool_ids),
+        )
+        if error_flag:
+            return True, []
+        if symbol not in result:
+            logger.error(f"No fresh Band price for {symbol}, can't price the base asset")
+            return True, []
+
+        quote_asset_per = pricer.combined_price(sampled)  # base asset per quote asset, i.e MLD/Osmo
+        if not quote_asset_per:
+            logger.error(f"No Osmosis price for pools {pool_ids}")
+            return True, []
+
+        quote_asset_price = result[symbol]["price"]
+        base_asset_dollar_price = float(quote_asset_price) / quote_asset_per  # ($/Osmo)*1/(MLD/Osmo)
+        return False, base_asset_dollar_price
+
+    except Exception as e:
+        logger.error(f"Unexpected error with Osmosis Symphony Price: {str(e)}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('osmolcd').inc()
+        return True, []
+
+
+register(PriceSource("osmosis", BASE, get_osmosis_symphony_price))
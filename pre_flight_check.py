@@ -1,3 +1,4 @@
+import importlib.util
 import logging
 import requests
 import time
@@ -5,27 +6,37 @@ import shutil
 import subprocess
 from typing import Tuple, Dict, Any, List
 
-from blockchain import get_oracle_params, get_current_misses, run_symphonyd_command
+from blockchain import get_oracle_params, get_misses_for_validators, run_symphonyd_command
 from exchange_apis import get_band_standard_dataset
-from vote_handler import wait_for_tx_indexed
-from config import *
+import grpc_client
+from http_client import lcd_get, pool as lcd_pool
+from tx_tracker import tracker as tx_tracker
+from config import settings, setup_logging
 
 logger = logging.getLogger(__name__)
 
 
 def check_account_balance() -> Tuple[bool, str]:
+    """Check if every signing account has sufficient balance for operations."""
+    for identity in settings.validators:
+        account_address = identity.feeder or identity.validator
+        if not account_address and identity.key:
+            logger.warning(f"Skipping balance check for {identity.valoper}: only a key name is configured")
+            continue
+        success, message = check_account_balance_for(account_address)
+        if not success:
+            return success, message
+    return True, "Account balance check passed"
+
+
+def check_account_balance_for(account_address: str) -> Tuple[bool, str]:
     """Check if the account has sufficient balance for operations."""
     try:
-        # Determine which account to check
-        account_address = feeder if feeder else validator
         if not account_address:
             return False, "No account address configured to check balance"
 
         # Query account balance
-        response = requests.get(
-            f"{lcd_address}/cosmos/bank/v1beta1/balances/{account_address}",
-            timeout=http_timeout
-        )
+        response = lcd_get(f"/cosmos/bank/v1beta1/balances/{account_address}")
         if not response.ok:
             return False, f"Failed to get account balance: {response.status_code}"
 
@@ -41,7 +52,7 @@ def check_account_balance() -> Tuple[bool, str]:
         if note_balance < 100000:
             return False, f"Account balance too low: {note_balance} note (minimum 100000 required)"
 
-        logger.info(f"Account balance: {note_balance} note")
+        logger.info(f"Account balance for {account_address}: {note_balance} note")
         return True, "Account balance check passed"
 
     except Exception as e:
@@ -52,13 +63,15 @@ def test_transaction_indexing() -> Tuple[bool, str]:
     """Test transaction indexing by sending a small self-transfer."""
     try:
         # Determine which account to use
-        from_address = feeder if feeder else validator
+        # indexing is a property of the node, so testing with the first validator's account is enough
+        identity = settings.validators[0]
+        from_address = identity.feeder or identity.validator
         if not from_address:
             return False, "No account address configured for test transaction"
 
         # Prepare test transaction using the same configuration as voting transactions
         command = [
-            symphonyd_path, "tx", "bank", "send",
+            settings.symphonyd_path, "tx", "bank", "send",
             from_address,  # sender
             from_address,  # receiver (self-transfer)
             "1note",  # amount
@@ -68,7 +81,7 @@ def test_transaction_indexing() -> Tuple[bool, str]:
         ]
 
         # Add the standard tx_config that includes chain-id, gas prices, etc.
-        command.extend(tx_config)
+        command.extend(settings.tx_config)
 
         # Execute test transaction using the same function as voting
         result = run_symphonyd_command(command)
@@ -86,23 +99,18 @@ def test_transaction_indexing() -> Tuple[bool, str]:
             return False, "No transaction hash returned from test transaction"
 
         # Wait for transaction indexing
-        indexed, index_time, response = wait_for_tx_indexed(tx_hash)
-        if not indexed:
+        tx_tracker.register(tx_hash, "test")
+        tx_result = tx_tracker.wait([tx_hash])[tx_hash]
+        if tx_result is None:
             return False, f"Test transaction {tx_hash} failed to index within timeout"
+        index_time = tx_result.resolved_at - tx_result.registered_at
 
         # Check transaction status
-        if response and "tx_response" in response:
-            code = response["tx_response"].get("code", 1)
-            if code != 0:
-                raw_log = response["tx_response"].get("raw_log", "No raw log available")
-                return False, f"Test transaction failed with code {code}. Raw log: {raw_log}"
-
-            # Log successful gas usage for reference
-            gas_used = response["tx_response"].get("gas_used", "unknown")
-            gas_wanted = response["tx_response"].get("gas_wanted", "unknown")
-            logger.info(f"Test transaction gas usage - Used: {gas_used}, Wanted: {gas_wanted}")
-        else:
-            return False, "Invalid transaction response format"
+        if tx_result.code != 0:
+            return False, f"Test transaction failed with code {tx_result.code}. Raw log: {tx_result.raw_log or 'No raw log available'}"
+
+        # Log successful gas usage for reference
+        logger.info(f"Test transaction gas usage - Used: {tx_result.gas_used}, Wanted: {tx_result.gas_wanted}")
 
         logger.info(f"Test transaction {tx_hash} successfully indexed in {index_time:.2f}s")
         return True, "Transaction indexing test passed"
@@ -114,13 +122,13 @@ def test_transaction_indexing() -> Tuple[bool, str]:
 def check_environment() -> Tuple[bool, str]:
     """Verify Symphony environment setup."""
     # Check if symphonyd exists in PATH
-    symphonyd_exists = shutil.which(symphonyd_path) is not None
+    symphonyd_exists = shutil.which(settings.symphonyd_path) is not None
     if not symphonyd_exists:
-        return False, f"symphonyd not found in PATH: {symphonyd_path}"
+        return False, f"symphonyd not found in PATH: {settings.symphonyd_path}"
 
     # Test symphonyd version command
     try:
-        result = subprocess.run([symphonyd_path, "version"],
+        result = subprocess.run([settings.symphonyd_path, "version"],
                                 capture_output=True,
                                 text=True,
                                 timeout=5)
@@ -137,11 +145,11 @@ def check_environment() -> Tuple[bool, str]:
 
     # Check required environment variables
     required_vars = {
-        'SYMPHONYD_PATH': symphonyd_path,
-        'CHAIN_ID': chain_id,
-        'SYMPHONY_LCD': lcd_address,
-        'MODULE_NAME': module_name,
-        'KEY_BACKEND': keyring_back_end,
+        'SYMPHONYD_PATH': settings.symphonyd_path,
+        'CHAIN_ID': settings.chain_id,
+        'SYMPHONY_LCD': settings.lcd_address,
+        'MODULE_NAME': settings.module_name,
+        'KEY_BACKEND': settings.keyring_back_end,
     }
 
     missing_vars = []
@@ -156,46 +164,73 @@ def check_environment() -> Tuple[bool, str]:
 
 
 def check_address_format() -> Tuple[bool, str]:
-    """Verify address formats for validator, validator account, and feeder."""
+    """Verify address formats for validator, validator account, and feeder of every configured validator."""
+    for identity in settings.validators:
+        # in multi validator mode the validator account is optional when a feeder signs
+        if identity.validator or not settings.multi_validator:
+            if identity.validator.startswith("symphonyvaloper1"):
+                return False, f"Invalid validator address format: {identity.validator}. Must start with 'symphony1'"
 
-    if validator.startswith("symphonyvaloper1"):
-        return False, f"Invalid validator address format: {validator}. Must start with 'symphony1'"
+            if not identity.validator.startswith("symphony1"):
+                return False, f"Invalid validator address format: {identity.validator}. Must start with 'symphony1'"
 
-    if not validator.startswith("symphony1"):
-        return False, f"Invalid validator address format: {validator}. Must start with 'symphony1'"
-    
-    if not valoper.startswith("symphonyvaloper1"):
-        return False, f"Invalid validator valoper address format: {valoper}. Must start with 'symphonyvaloper1'"
+        if not identity.valoper.startswith("symphonyvaloper1"):
+            return False, f"Invalid validator valoper address format: {identity.valoper}. Must start with 'symphonyvaloper1'"
 
-    if feeder and not feeder.startswith("symphony1"):
-        return False, f"Invalid feeder address format: {feeder}. Must start with 'symphony1'"
+        if identity.feeder and not identity.feeder.startswith("symphony1"):
+            return False, f"Invalid feeder address format: {identity.feeder}. Must start with 'symphony1'"
 
     return True, "Address format check passed"
 
 
 def check_lcd_health() -> Tuple[bool, str]:
-    """Check if LCD endpoint is responding and synced."""
+    """Check that the LCD endpoints are responding and synced, with the health probe the feeder fails over on."""
     try:
-        response = requests.get(f"{lcd_address}/cosmos/base/tendermint/v1beta1/syncing",
-                                timeout=http_timeout)
-        if not response.ok:
-            return False, f"LCD health check failed with status {response.status_code}"
-
-        sync_status = response.json()
-        if sync_status.get("syncing", True):
-            return False, "LCD node is still syncing"
+        healths = lcd_pool.probe_all()
+        healthy = lcd_pool.healthy()
+        for health in healths:
+            if health not in healthy:
+                reason = health.error or ("syncing" if health.syncing else f"lagging at height {health.height}")
+                logger.warning(f"LCD {health.url} is unhealthy: {reason}")
+        if not healthy:
+            return False, "No healthy LCD endpoint, see the warnings above"
+
+        best = lcd_pool.ranked()[0]
+        return True, f"LCD health check passed ({len(healthy)}/{len(healths)} healthy, using {best})"
+    except Exception as e:
+        return False, f"LCD health check failed: {str(e)}"
 
-        # Also check if we can get the latest block
-        block_response = requests.get(
-            f"{lcd_address}/cosmos/base/tendermint/v1beta1/blocks/latest",
-            timeout=http_timeout
-        )
-        if not block_response.ok:
-            return False, "Failed to fetch latest block"
 
-        return True, "LCD health check passed"
+def check_grpc() -> Tuple[bool, str]:
+    """Check GRPC_QUERIES and, when set, that the node answers the latest block query over gRPC."""
+    if not settings.grpc_query_list:
+        return True, "All chain queries use the LCD"
+    unknown = [query for query in settings.grpc_query_list if query not in grpc_client.QUERIES]
+    if unknown:
+        return False, f"Unknown GRPC_QUERIES {unknown}, expected any of {list(grpc_client.QUERIES)}"
+    if importlib.util.find_spec("grpc") is None:
+        return False, "GRPC_QUERIES is set but grpcio is not installed (pip install grpcio)"
+    err_flag, height, _ = grpc_client.get_latest_block()
+    if err_flag:
+        return False, f"gRPC query to {settings.grpc_address} failed"
+    return True, f"gRPC at {settings.grpc_address} (height {height}) serving {', '.join(settings.grpc_query_list)}"
+
+
+def check_rpc_broadcast() -> Tuple[bool, str]:
+    """Check BROADCAST_MODE and, when broadcasting over RPC, that the Tendermint RPC is reachable and synced."""
+    if settings.broadcast_mode not in ("cli", "sync", "async"):
+        return False, f"Invalid BROADCAST_MODE {settings.broadcast_mode}, expected cli, sync or async"
+    if settings.broadcast_mode == "cli":
+        return True, "Broadcasting with symphonyd"
+    try:
+        response = requests.get(f"{settings.rpc_http_address}/status", timeout=settings.http_timeout)
+        if not response.ok:
+            return False, f"RPC status check failed with status {response.status_code}"
+        if response.json()["result"]["sync_info"].get("catching_up", True):
+            return False, "RPC node is still catching up"
+        return True, f"RPC broadcast_tx_{settings.broadcast_mode} available"
     except Exception as e:
-        return False, f"LCD health check failed: {str(e)}"
+        return False, f"RPC status check failed: {str(e)}"
 
 
 def check_oracle_module() -> Tuple[bool, str]:
@@ -248,10 +283,13 @@ def check_oracle_module() -> Tuple[bool, str]:
                 logger.debug(f"  {param}: {result[param]}")
 
         # Check if we can get current misses
-        if validator:
+        if settings.validator or settings.multi_validator:
             try:
-                misses = get_current_misses()
+                misses = get_misses_for_validators([identity.valoper for identity in settings.validators])
                 logger.info(f"Current oracle misses: {misses}")
+                failed = [valoper for valoper, count in misses.items() if count is None]
+                if failed:
+                    return False, f"Failed to get current misses for {failed}"
             except Exception as e:
                 return False, f"Failed to get current misses: {str(e)}"
 
@@ -262,7 +300,7 @@ def check_oracle_module() -> Tuple[bool, str]:
 
 def check_band_fx_symbols() -> Tuple[bool, str]:
     """Verify each FX symbol can be retrieved from Band protocol individually."""
-    if "band" not in fx_api_option:
+    if "band" not in settings.fx_api_option:
         return True, "Band FX validation skipped - not using Band Protocol"
 
     all_symbols_valid = True
@@ -270,7 +308,7 @@ def check_band_fx_symbols() -> Tuple[bool, str]:
     error_details = []
 
     # Check each symbol individually
-    for symbol in set(fx_map.values()):
+    for symbol in set(settings.fx_map.values()):
         if symbol == "USD":  # Skip USD as it's the base currency
             continue
 
@@ -312,7 +350,7 @@ def check_band_fx_symbols() -> Tuple[bool, str]:
         error_msg += "or remove them from fx_map if they should not be included."
 
         # Map invalid symbols back to their denoms for additional context
-        affected_denoms = [denom for denom, symbol in fx_map.items() if symbol in invalid_symbols]
+        affected_denoms = [denom for denom, symbol in settings.fx_map.items() if symbol in invalid_symbols]
         if affected_denoms:
             error_msg += f"\n\nAffected denoms: {', '.join(affected_denoms)}"
 
@@ -323,23 +361,28 @@ def check_band_fx_symbols() -> Tuple[bool, str]:
 
 def check_validator_config() -> Tuple[bool, str]:
     """Verify validator/feeder configuration."""
-    if not validator:
-        return False, "Validator address not configured"
-    
-    if not valoper:
-        return False, "Validator valoper address not configured"
+    if settings.multi_validator:
+        for identity in settings.validators:
+            if not identity.from_account:
+                return False, f"No feeder, key or validator account configured to sign for {identity.valoper}"
+    else:
+        if not settings.validator:
+            return False, "Validator address not configured"
+
+        if not settings.valoper:
+            return False, "Validator valoper address not configured"
 
-    if not (feeder or validator):
-        return False, "Neither feeder nor validator account address configured"
+        if not (settings.feeder or settings.validator):
+            return False, "Neither feeder nor validator account address configured"
 
-    if keyring_back_end == "os" and not key_password:
+    if settings.keyring_back_end == "os" and not settings.key_password:
         return False, "Key password required for os backend"
 
     # Check tx configuration
     required_tx_flags = ["--chain-id", "--gas-prices", "--gas-adjustment", "--keyring-backend"]
     missing_flags = []
 
-    tx_config_str = " ".join(tx_config)
+    tx_config_str = " ".join(settings.tx_config)
     for flag in required_tx_flags:
         if flag not in tx_config_str:
             missing_flags.append(flag)
@@ -352,8 +395,8 @@ def check_validator_config() -> Tuple[bool, str]:
 
 def check_price_feeder_config() -> Tuple[bool, str]:
     """Verify price feeder configuration."""
-    if "band" in fx_api_option:
-        if not band_endpoint:
+    if "band" in settings.fx_api_option:
+        if not settings.band_endpoint:
             return False, "Band endpoint not configured"
 
         # Add Band symbol validation
@@ -361,14 +404,14 @@ def check_price_feeder_config() -> Tuple[bool, str]:
         if not band_check_success:
             return False, band_check_msg
 
-    if "alphavantage" in fx_api_option:
-        if not alphavantage_key:
+    if "alphavantage" in settings.fx_api_option:
+        if not settings.alphavantage_key:
             return False, "Alphavantage API key not configured"
 
     # Check if fx_map values match fx_symbol_list
-    required_symbols = {symbol for symbol in fx_map.values() if symbol != "USD"}
-    if required_symbols != set(fx_symbol_list):
-        return False, f"FX symbol list mismatch. Required symbols from fx_map: {required_symbols}, Current fx_symbol_list: {set(fx_symbol_list)}"
+    required_symbols = {symbol for symbol in settings.fx_map.values() if symbol != "USD"}
+    if required_symbols != set(settings.fx_symbol_list):
+        return False, f"FX symbol list mismatch. Required symbols from fx_map: {required_symbols}, Current fx_symbol_list: {set(settings.fx_symbol_list)}"
 
     return True, "Price feeder configuration check passed"
 
@@ -385,6 +428,8 @@ def run_preflight_checks() -> Dict[str, Any]:
         ("Environment", check_environment),
         ("Address Format", check_address_format),
         ("LCD Health", check_lcd_health),
+        ("RPC Broadcast", check_rpc_broadcast),
+        ("gRPC Queries", check_grpc),
         ("Oracle Module", check_oracle_module),
         ("Validator Config", check_validator_config),
         ("Price Feeder Config", check_price_feeder_config),  # This now includes Band symbol validation
@@ -426,6 +471,7 @@ def wait_for_ready(max_retries: int = 5, retry_delay: int = 10) -> bool:
 
 
 if __name__ == "__main__":
+    setup_logging()
     if not wait_for_ready():
         logger.critical("Failed preflight checks, exiting")
         exit(1)
\ No newline at end of file
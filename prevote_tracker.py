@@ -0,0 +1,72 @@
+"""
+Local record of our committed prevotes.
+
+process_votes needs the prevote hash currently on chain to decide whether last epoch's prevote can be revealed.
+After a prevote tx is confirmed, the hash and validator of its message and the epoch of the block it was
+included in (from the epoch start heights seen by get_current_epoch) are known, so the tracker answers that
+locally and the vote path can start broadcasting as soon as prices are ready. It only knows what this process
+confirmed: after a restart or failover, a failed or unconfirmed prevote, a block whose epoch isn't known, or a
+vote rejected despite a local match, there is no entry for the previous epoch and the hash is read from the LCD
+again.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PrevoteRecord:
+    hash: str
+    epoch: int  # epoch the prevote was confirmed in, it can be revealed in the next one
+
+
+class PrevoteTracker:
+    def __init__(self, epochs_kept: int = 8):
+        self.epochs_kept = epochs_kept
+        self._records: Dict[str, PrevoteRecord] = {}
+        self._epoch_starts: Dict[int, int] = {}  # epoch -> height of its first block
+        self._lock = threading.Lock()
+
+    def observe_epoch_start(self, epoch: int, start_height: int):
+        with self._lock:
+            self._epoch_starts[epoch] = start_height
+            for old in sorted(self._epoch_starts)[:-self.epochs_kept]:
+                del self._epoch_starts[old]
+
+    def epoch_at(self, height: int) -> Optional[int]:
+        """Epoch the block at height belongs to, None if the epoch starts around it haven't been seen."""
+        with self._lock:
+            starts = sorted(self._epoch_starts.items())
+        for index, (epoch, start_height) in enumerate(starts):
+            if start_height > height:
+                return None
+            if index + 1 == len(starts) or starts[index + 1][1] > height:
+                # the next epoch is unknown, or known to start after height - only trust a consecutive one
+                if index + 1 < len(starts) and starts[index + 1][0] != epoch + 1:
+                    return None
+                return epoch
+        return None
+
+    def record_confirmed(self, valoper: str, prevote_hash: str, epoch: int):
+        with self._lock:
+            self._records[valoper] = PrevoteRecord(prevote_hash, epoch)
+        logger.debug("Recorded prevote %s for %s in epoch %s", prevote_hash, valoper, epoch)
+
+    def invalidate(self, valoper: str):
+        with self._lock:
+            if self._records.pop(valoper, None) is not None:
+                logger.info("Prevote state for %s unknown, will check the chain", valoper)
+
+    def committed_hash(self, valoper: str, epoch: int) -> Optional[str]:
+        """Hash of the prevote to reveal in epoch, None if it has to be read from the chain."""
+        with self._lock:
+            record = self._records.get(valoper)
+        if record is None or record.epoch != epoch - 1:
+            return None
+        return record.hash
+
+
+tracker = PrevoteTracker()
@@ -1,34 +1,26 @@
-import concurrent.futures
 import logging
+import math
 import statistics
 
+import metrics
 from blockchain import get_oracle_params
-from config import *
-from exchange_apis import * #TODO- remove the *, dont be lazy
+from config import settings
+from price_sources import BASE, FX, fetch_sources
 from price_validation import validate_prices
+from source_scoring import scorer
 
 logger = logging.getLogger(__name__)
 
 
-def get_prices():
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        res_swap = executor.submit(get_swap_price)
-        res_fxs = []
-        for fx_key in fx_api_option.split(","):
-            if fx_key == "alphavantage":
-                res_fxs.append(executor.submit(get_alphavantage_fx_rate))
-            elif fx_key == "band":
-                res_fxs.append(executor.submit(get_fx_rate_from_band))
-        res_osmosis = executor.submit(get_osmosis_symphony_price)
-
-    # Add timeout protection to prevent hanging on external API calls
-    try:
-        swap_price_err_flag, swap_price = res_swap.result(timeout=15)
-        fx_err_flag, real_fx = combine_fx(res_fxs, timeout=15)
-        osmosis_err_flag, osmosis_symphony_price = res_osmosis.result(timeout=15)
-    except concurrent.futures.TimeoutError:
-        logger.error("Price fetching timed out after 15 seconds - skipping this epoch")
-        return None
+def get_prices(epoch=None):
+    if settings.price_feed_mode == "subscribe":
+        from price_publisher import get_subscribed_prices
+        return get_subscribed_prices(epoch)
+
+    results = fetch_sources()
+    fx_err_flag, real_fx = combine_fx([result for result in results.values() if result.source.kind == FX])
+    osmosis_err_flag, osmosis_symphony_price = combine_base(
+        [result for result in results.values() if result.source.kind == BASE])
 
     # Only proceed if we have the Osmosis Symphony price
     if not osmosis_err_flag and osmosis_symphony_price:
@@ -43,33 +35,33 @@ def get_prices():
             logger.error("No whitelisted assets found in oracle parameters")
             return None
 
-        logger.debug(f"Processing whitelisted assets: {[asset['name'] for asset in whitelist]}")
+        logger.debug("Processing whitelisted assets: %s", [asset['name'] for asset in whitelist])
 
         # Process each whitelisted asset
         for asset in whitelist:
             denom = asset["name"]
 
             # Handle base USD price
-            if denom == default_base_fx:
+            if denom == settings.default_base_fx:
                 market_price = 1 / float(osmosis_symphony_price)
-                logger.info(f"{denom} price: {market_price}")
+                logger.debug("%s price: %s", denom, market_price)
                 prices[denom] = market_price
-                METRIC_MARKET_PRICE.labels(denom).set(market_price)
+                metrics.METRIC_MARKET_PRICE.labels(denom).set(market_price)
                 continue
 
             # Skip if no FX mapping
-            if denom not in fx_map:
+            if denom not in settings.fx_map:
                 logger.warning(f"No FX mapping for {denom}, will be set to 0 in validation")
                 continue
 
             # Calculate price if we have valid FX rate
-            fx_symbol = fx_map[denom]
+            fx_symbol = settings.fx_map[denom]
             if fx_symbol in real_fx and real_fx[fx_symbol] and real_fx[fx_symbol] > 0:
                 try:
-                    market_price = 1 / (float(osmosis_symphony_price) * real_fx[fx_map[denom]])
+                    market_price = 1 / (float(osmosis_symphony_price) * real_fx[settings.fx_map[denom]])
                     prices[denom] = market_price
-                    METRIC_MARKET_PRICE.labels(denom).set(market_price)
-                    logger.info(f"Calculated price for {denom}: {market_price}")
+                    metrics.METRIC_MARKET_PRICE.labels(denom).set(market_price)
+                    logger.debug("Calculated price for %s: %s", denom, market_price)
                 except Exception as e:
                     logger.error(f"Error calculating price for {denom}: {e}")
             else:
@@ -92,47 +84,69 @@ def get_prices():
         return None
 
 
-def combine_fx(res_fxs, timeout=None):
-    """Combines FX results from multiple sources, handling missing or invalid rates gracefully."""
-    fx_combined = {fx: [] for fx in fx_map.values()}
+def combine_fx(fx_results):
+    """Combines FX results from multiple sources, handling missing or invalid rates gracefully.
+
+    Each rate is the median of the sources' rates weighted by their quality score."""
+    fx_combined = {fx: [] for fx in settings.fx_map.values()}
     all_success = False  # Changed from error flag to success flag
 
-    for res_fx in res_fxs:
-        try:
-            if timeout:
-                err_flag, fx = res_fx.result(timeout=timeout)
-            else:
-                err_flag, fx = res_fx.result()
-        except concurrent.futures.TimeoutError:
-            logger.error(f"FX API call timed out after {timeout} seconds")
-            continue  # Skip this source and try others
-        except Exception as e:
-            logger.error(f"Error getting FX result: {e}")
-            continue  # Skip this source and try others
-            
-        if not err_flag and fx:  # If this source succeeded
+    for fx_result in fx_results:
+        if not fx_result.err_flag and fx_result.data:  # If this source succeeded
             all_success = True  # Mark that we got at least one successful source
+            fx = fx_result.data
+            weight = scorer.weight(fx_result.source)
             for key in fx_combined:
                 if key in fx and fx[key] is not None and fx[key] > 0:  # Additional validation
-                    fx_combined[key].append(fx[key])
+                    fx_combined[key].append((fx[key], weight))
 
     result_fx = {}
     for key in fx_combined:
-        valid_rates = [rate for rate in fx_combined[key] if rate is not None and rate > 0]
+        valid_rates = [(rate, weight) for rate, weight in fx_combined[key] if rate is not None and rate > 0]
         if valid_rates:
-            result_fx[key] = statistics.median(valid_rates)
-            logger.debug(f"FX rate for {key}: {result_fx[key]} (from {len(valid_rates)} sources)")
+            result_fx[key] = weighted_median([rate for rate, _ in valid_rates], [weight for _, weight in valid_rates])
+            logger.debug("FX rate for %s: %s (from %d sources)", key, result_fx[key], len(valid_rates))
         else:
             logger.warning(f"No valid FX rates found for {key}")
             # Don't include invalid rates in the result
 
+    scorer.observe_consensus(fx_results, result_fx)
     # Return error flag (True if we got no successful sources) and the results
     return not all_success, result_fx
 
+
+def combine_base(base_results):
+    """Weighted average of the base asset USD price over the sources that returned one."""
+    valid = [(float(result.data), scorer.weight(result.source)) for result in base_results
+             if not result.err_flag and result.data and float(result.data) > 0]
+    if not valid:
+        return True, None
+    price = weighted_price([price for price, _ in valid], [weight for _, weight in valid])
+    scorer.observe_consensus(base_results, {"base": price})
+    return False, price
+
 def weighted_price(prices, weights):
+    if not sum(weights):
+        return statistics.fmean(prices)
     return sum(p * w for p, w in zip(prices, weights)) / sum(weights)
 
 
+def weighted_median(values, weights):
+    """Median of values where each counts for its weight, equal weights give statistics.median."""
+    if not sum(weights):
+        return statistics.median(values)
+    pairs = sorted(zip(values, weights))
+    half = sum(weights) / 2
+    cumulative = 0.0
+    for index, (value, weight) in enumerate(pairs):
+        cumulative += weight
+        if math.isclose(cumulative, half) and index + 1 < len(pairs):
+            return (value + pairs[index + 1][0]) / 2
+        if cumulative > half:
+            return value
+    return pairs[-1][0]
+
+
 def format_prices(prices) -> str:
     """Formats prices into the required string format, handling missing or zero prices."""
     if not prices:
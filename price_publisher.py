@@ -0,0 +1,256 @@
+#!/usr/bin/python3 -u
+# -*- coding: utf-8 -*-
+"""
+Shared price feed for voters that run in separate processes or containers.
+
+The publisher (PRICE_FEED_MODE=publish) runs get_prices once per epoch and pushes a versioned, timestamped
+snapshot to every subscriber over a unix domain socket as one JSON line per snapshot. Snapshots are sent
+outside the publisher lock with a SEND_TIMEOUT: a subscriber that falls behind (its socket buffer stays full)
+is disconnected rather than holding up the others, and gets the latest snapshot again when it reconnects.
+Subscribers (PRICE_FEED_MODE=subscribe) keep the latest snapshot in memory from a background thread, so
+get_prices becomes a read of that snapshot - no external API calls and identical prices for every voter.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import List, Mapping, Optional
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SCHEMA_VERSION = 1
+
+# seconds a snapshot may take to be written to one subscriber before it is disconnected
+SEND_TIMEOUT = 1.0
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    version: int  # publisher sequence number, increases with every snapshot
+    epoch: int
+    timestamp: float  # unix time the prices were fetched
+    prices: Mapping[str, float]  # read only denom -> price, as returned by get_prices
+
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+    def to_line(self) -> bytes:
+        return (json.dumps({
+            "schema": SNAPSHOT_SCHEMA_VERSION,
+            "version": self.version,
+            "epoch": self.epoch,
+            "timestamp": self.timestamp,
+            "prices": dict(self.prices),
+        }) + "\n").encode("utf-8")
+
+    @classmethod
+    def from_line(cls, line: bytes) -> "PriceSnapshot":
+        data = json.loads(line)
+        if data.get("schema") != SNAPSHOT_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported price snapshot schema {data.get('schema')}")
+        return cls(
+            version=int(data["version"]),
+            epoch=int(data["epoch"]),
+            timestamp=float(data["timestamp"]),
+            prices=MappingProxyType(data["prices"]),
+        )
+
+
+class _Client:
+    """A subscriber connection, its snapshots written in version order one at a time."""
+
+    def __init__(self, conn: socket.socket):
+        conn.settimeout(SEND_TIMEOUT)
+        self.conn = conn
+        self.version = 0  # last snapshot written
+        self.lock = threading.Lock()
+
+    def send(self, snapshot: PriceSnapshot) -> bool:
+        """Write snapshot unless a newer one was already written, False (and closed) if the subscriber is gone
+        or too slow."""
+        with self.lock:
+            if snapshot.version <= self.version:
+                return True
+            try:
+                self.conn.sendall(snapshot.to_line())
+            except OSError as e:  # socket.timeout included
+                logger.warning("Dropping price subscriber: %s", e)
+                self.conn.close()
+                return False
+            self.version = snapshot.version
+            return True
+
+
+class PricePublisher:
+    """Serves the latest PriceSnapshot to every connected subscriber over a unix domain socket."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._clients: List[_Client] = []
+        self._lock = threading.Lock()
+        self._latest: Optional[PriceSnapshot] = None
+        self._version = 0
+        self._server: Optional[socket.socket] = None
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen()
+        threading.Thread(target=self._accept_loop, name="price-publisher", daemon=True).start()
+        logger.info(f"Price publisher listening on {self.socket_path}")
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return  # server socket closed
+            client = _Client(client)
+            with self._lock:
+                self._clients.append(client)
+                latest = self._latest
+                subscribers = len(self._clients)
+            logger.info(f"Price subscriber connected ({subscribers} total)")
+            # late joiners get the current snapshot straight away
+            if latest is not None and not client.send(latest):
+                self._remove([client])
+
+    def _remove(self, clients: List[_Client]):
+        with self._lock:
+            self._clients = [client for client in self._clients if client not in clients]
+
+    def publish(self, epoch: int, prices: Mapping[str, float]) -> PriceSnapshot:
+        with self._lock:
+            self._version += 1
+            snapshot = PriceSnapshot(self._version, epoch, time.time(), MappingProxyType(dict(prices)))
+            self._latest = snapshot
+            clients = list(self._clients)
+        gone = [client for client in clients if not client.send(snapshot)]
+        self._remove(gone)
+        logger.info(f"Published price snapshot v{snapshot.version} for epoch {epoch} to "
+                    f"{len(clients) - len(gone)} subscribers")
+        return snapshot
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.conn.close()
+
+
+class PriceSubscriber:
+    """Keeps the latest snapshot from a PricePublisher, reconnecting in the background when needed."""
+
+    def __init__(self, socket_path: str, reconnect_delay: float = 1.0):
+        self.socket_path = socket_path
+        self.reconnect_delay = reconnect_delay
+        self._latest: Optional[PriceSnapshot] = None
+        self._updated = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="price-subscriber", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+                    conn.connect(self.socket_path)
+                    logger.info(f"Subscribed to price feed at {self.socket_path}")
+                    for line in conn.makefile("rb"):
+                        self._update(PriceSnapshot.from_line(line))
+                logger.warning("Price feed closed by publisher")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Price feed at {self.socket_path} unavailable: {e}")
+            time.sleep(self.reconnect_delay)
+
+    def _update(self, snapshot: PriceSnapshot):
+        with self._updated:
+            self._latest = snapshot
+            self._updated.notify_all()
+
+    def latest(self, min_epoch: Optional[int] = None, timeout: float = 0.0) -> Optional[PriceSnapshot]:
+        """Latest snapshot, waiting up to timeout for one from at least min_epoch. No copy is made."""
+        deadline = time.monotonic() + timeout
+        with self._updated:
+            while min_epoch is not None and (self._latest is None or self._latest.epoch < min_epoch):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._updated.wait(remaining)
+            return self._latest
+
+
+_subscriber: Optional[PriceSubscriber] = None
+_subscriber_lock = threading.Lock()
+
+
+def get_subscriber() -> PriceSubscriber:
+    global _subscriber
+    with _subscriber_lock:
+        if _subscriber is None:
+            _subscriber = PriceSubscriber(settings.price_feed_socket)
+            _subscriber.start()
+        return _subscriber
+
+
+def get_subscribed_prices(epoch: Optional[int] = None) -> Optional[Mapping[str, float]]:
+    """get_prices for subscribers - the latest published prices, or None if missing, stale or from an old epoch."""
+    snapshot = get_subscriber().latest(min_epoch=epoch, timeout=settings.price_feed_wait)
+    if snapshot is None:
+        logger.error("No price snapshot received from publisher")
+        return None
+
+    age = snapshot.age()
+    metrics.METRIC_PRICE_FEED_AGE.set(age)
+    if age > settings.price_feed_max_age:
+        logger.error(f"Price snapshot v{snapshot.version} is stale ({age:.1f}s old, max {settings.price_feed_max_age}s)")
+        return None
+    if epoch is not None and snapshot.epoch < epoch:
+        logger.error(f"Price snapshot v{snapshot.version} is for epoch {snapshot.epoch}, wanted {epoch}")
+        return None
+
+    logger.debug(f"Using price snapshot v{snapshot.version} from epoch {snapshot.epoch} ({age:.1f}s old)")
+    return snapshot.prices
+
+
+def run_publisher():
+    """Fetch prices once per epoch and publish them to all subscribed voters."""
+    from blockchain import get_current_epoch
+    from price_feeder import get_prices
+
+    publisher = PricePublisher(settings.price_feed_socket)
+    publisher.start()
+    last_published_epoch = 0
+    try:
+        while True:
+            err_flag, current_epoch = get_current_epoch("minute")
+            if not err_flag and current_epoch > last_published_epoch:
+                prices = get_prices()
+                if prices:
+                    snapshot = publisher.publish(current_epoch, prices)
+                    metrics.METRIC_PRICE_FEED_VERSION.set(snapshot.version)
+                    last_published_epoch = current_epoch
+            time.sleep(1)
+    finally:
+        publisher.close()
+
+
+if __name__ == "__main__":
+    from config import setup_logging
+    setup_logging()
+    metrics.start_metrics_server(settings.metrics_port)
+    run_publisher()
@@ -0,0 +1,155 @@
+"""
+Price source registry.
+
+Every price provider module (PROVIDERS) declares its sources with `register(PriceSource(...))` next to the
+fetch code: the kind of price it provides, its symbols, how often it needs fetching (cadence), how long
+a fetch may take (deadline), its weight in aggregation and an async fetch coroutine returning
+(err_flag, data). `fetch_sources()` runs every enabled source concurrently and returns their results for
+price_feeder to aggregate, so adding a venue doesn't touch the aggregation code.
+
+Kinds:
+    fx    {symbol: units per USD} - enabled when named in FX_API_OPTION
+    base  USD price of the base asset
+
+Each fan-out runs on an event loop and worker threads of its own, and returns once every source has answered or
+hit its deadline: blocking fetches still running at their deadline are abandoned with their threads rather than
+waited for. Latency, errors and the age of the data each source served are exported per source. A source with a cadence
+is only fetched again once its last good result is older than that, and serves the cached result meanwhile.
+Sources scored too poorly by source_scoring are left out of the fan-out.
+"""
+import asyncio
+import concurrent.futures
+import importlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import metrics
+import rate_limiter
+from config import settings
+from source_scoring import scorer
+
+logger = logging.getLogger(__name__)
+
+FX = "fx"
+BASE = "base"
+
+# modules registering price sources, imported on the first fetch
+PROVIDERS = ("exchange_apis", "osmosis_pricing")
+
+
+@dataclass(frozen=True)
+class PriceSource:
+    name: str
+    kind: str
+    fetch: Callable[[], Awaitable[Tuple[bool, Any]]]
+    symbols: Tuple[str, ...] = ()  # empty for the configured FX symbols
+    cadence: float = 0.0  # seconds a good result is reused for, 0 fetches every time
+    deadline: float = 15.0
+    weight: float = 1.0
+
+
+@dataclass(frozen=True)
+class SourceResult:
+    source: PriceSource
+    err_flag: bool
+    data: Any
+    fetched_at: float
+    latency: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+_registry: Dict[str, PriceSource] = {}
+_last_good: Dict[str, SourceResult] = {}
+
+
+def register(source: PriceSource) -> PriceSource:
+    if source.name in _registry:
+        logger.warning(f"Price source {source.name} registered twice, replacing it")
+    _registry[source.name] = source
+    return source
+
+
+def blocking(func: Callable[[], Tuple[bool, Any]]) -> Callable[[], Awaitable[Tuple[bool, Any]]]:
+    """Async fetch running a blocking (requests based) fetch function in a worker thread."""
+    async def fetch():
+        return await asyncio.to_thread(func)
+    fetch.__name__ = getattr(func, "__name__", "fetch")
+    return fetch
+
+
+def load_providers():
+    for module in PROVIDERS:
+        importlib.import_module(module)
+
+
+def enabled_sources(kinds: Optional[List[str]] = None) -> List[PriceSource]:
+    load_providers()
+    fx_options = [option.strip() for option in settings.fx_api_option.split(",")]
+    return [source for source in _registry.values()
+            if (kinds is None or source.kind in kinds) and (source.kind != FX or source.name in fx_options)]
+
+
+async def _run_source(source: PriceSource) -> SourceResult:
+    cached = _last_good.get(source.name)
+    if cached is not None and source.cadence and cached.age < source.cadence:
+        metrics.METRIC_SOURCE_AGE.labels(source.name).set(cached.age)
+        return cached
+
+    started = time.time()
+    # rate limited calls of the fetch may wait for their quota as long as they can still make the deadline
+    rate_limiter.deadline.set(time.monotonic() + source.deadline)
+    try:
+        err_flag, data = await asyncio.wait_for(source.fetch(), timeout=source.deadline)
+    except asyncio.TimeoutError:
+        logger.error(f"Price source {source.name} timed out after {source.deadline} seconds")
+        err_flag, data = True, None
+    except Exception as e:
+        logger.error(f"Price source {source.name} failed: {e}")
+        err_flag, data = True, None
+    latency = time.time() - started
+    metrics.METRIC_SOURCE_LATENCY.labels(source.name).observe(latency)
+    scorer.observe_fetch(source.name, err_flag, latency)
+
+    result = SourceResult(source, err_flag, data, started, latency)
+    if err_flag:
+        metrics.METRIC_SOURCE_ERRORS.labels(source.name).inc()
+    else:
+        _last_good[source.name] = result
+        metrics.METRIC_SOURCE_AGE.labels(source.name).set(0)
+    return result
+
+
+async def gather_sources(kinds: Optional[List[str]] = None) -> Dict[str, SourceResult]:
+    sources = scorer.select(enabled_sources(kinds))
+    results = await asyncio.gather(*(_run_source(source) for source in sources))
+    return {result.source.name: result for result in results}
+
+
+def _run_fan_out(kinds: Optional[List[str]]) -> Dict[str, SourceResult]:
+    # not asyncio.run, which waits for the default executor's threads - a blocking fetch past its deadline
+    # would hold the price fetch until it returns
+    loop = asyncio.new_event_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="price-source")
+    loop.set_default_executor(executor)
+    try:
+        return loop.run_until_complete(gather_sources(kinds))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def fetch_sources(kinds: Optional[List[str]] = None) -> Dict[str, SourceResult]:
+    """Fetch every enabled source concurrently, blocking until each has answered or hit its deadline."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return _run_fan_out(kinds)
+    # called from inside an event loop (i.e replay.py runs blocking calls inline), use a loop of our own
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_run_fan_out, kinds).result()
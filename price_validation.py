@@ -3,7 +3,7 @@ import requests
 from typing import Dict, List, Tuple
 
 from blockchain import get_oracle_params
-from config import METRIC_OUTBOUND_ERROR
+import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +26,7 @@ def get_valid_denoms() -> Tuple[bool, List[Dict[str, str]]]:
 
     except Exception as e:
         logger.error(f"Error getting whitelist: {str(e)}")
-        METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
         return True, []
 
 
@@ -54,7 +54,7 @@ def validate_prices(prices: Dict[str, float]) -> Dict[str, float]:
 
     adjusted_prices = {}
     valid_denoms = [asset["name"] for asset in whitelist]
-    logger.debug(f"Validating prices against whitelist: {valid_denoms}")
+    logger.debug("Validating prices against whitelist: %s", valid_denoms)
 
     # First, initialize all whitelisted denoms with zero prices
     for denom in valid_denoms:
@@ -65,20 +65,14 @@ def validate_prices(prices: Dict[str, float]) -> Dict[str, float]:
         if denom in valid_denoms:
             if price is not None and price > 0:
                 adjusted_prices[denom] = round(price, 12)  # Round to 12 decimal places
-                logger.info(f"Valid price for {denom}: {adjusted_prices[denom]}")
             else:
                 logger.warning(f"Invalid or zero price for {denom}, using 0")
                 adjusted_prices[denom] = 0
         else:
             logger.warning(f"Skipping {denom} as it's not in whitelist")
 
-    # Log final price state
-    logger.info("Final validated prices:")
-    for denom, price in adjusted_prices.items():
-        if price == 0:
-            logger.info(f"Zero price for {denom} (either missing or invalid)")
-        else:
-            logger.info(f"Price for {denom}: {price}")
+    # Log final price state, one record per epoch rather than one per denom
+    logger.info("Final validated prices: %s", adjusted_prices)
 
     # Verify we have at least one valid price
     valid_prices = {k: v for k, v in adjusted_prices.items() if v > 0}
@@ -0,0 +1,159 @@
+"""
+Per remote request quotas for the external price APIs.
+
+Every remote with a quota in RATE_LIMITS ("remote=requests/seconds", i.e alphavantage=5/60) gets a token bucket
+holding up to that many requests and refilling at that rate. Functions decorated with `rate_limited(remote)`
+take a token per call. Inside a price source fetch (see price_sources.py, which sets `deadline`) a call over the
+quota reserves the next token and waits for it, so a burst is spread over the quota period - as long as it waits
+no more than RATE_LIMIT_MAX_WAIT and its answer can still arrive (HTTP_TIMEOUT) before the source deadline.
+Otherwise the call isn't sent and returns the last good result of the same call instead (or the fallback, if
+there is none yet) - or RATE_LIMITED with cached=False, for callers that must tell a fresh result from a
+repeated one (TWAP samples). Callers fanning out one request per item
+(AlphaVantage's one request per symbol) order their calls by `limiter.age()` so the budget rotates through
+every item rather than always refreshing the same ones.
+
+The budget left and the calls served from cache are exported per remote.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# returned instead of a result by rate_limited(..., cached=False) functions for calls over the quota
+RATE_LIMITED = object()
+
+# time.monotonic() deadline of the price source fetch the current call is made for, None outside of one
+deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("rate_limit_deadline", default=None)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take the next token, in advance if need be: seconds until it is available, None if that's over max_wait.
+        Tokens reserved in advance are owed by the bucket, so concurrent callers queue behind each other."""
+        self._refill(time.monotonic())
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+
+def call_key(args: tuple, kwargs: dict) -> str:
+    return repr((args, sorted(kwargs.items())))
+
+
+class RateLimiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets: Dict[str, Optional[TokenBucket]] = {}
+        # (remote, call key) -> (last good result, when it was fetched)
+        self.cache: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+
+    def _bucket(self, remote: str) -> Optional[TokenBucket]:
+        if remote not in self.buckets:
+            quota = settings.rate_limit_quotas.get(remote)
+            self.buckets[remote] = TokenBucket(*quota) if quota else None
+        return self.buckets[remote]
+
+    def reserve(self, remote: str) -> Optional[float]:
+        """Take a request from the remote's budget: seconds to wait before sending it, None if it can't be sent in
+        time (see the module docstring). Remotes without a quota never wait."""
+        fetch_deadline = deadline.get()
+        max_wait = 0.0
+        if fetch_deadline is not None:
+            max_wait = min(settings.rate_limit_max_wait, fetch_deadline - time.monotonic() - settings.http_timeout)
+        with self._lock:
+            bucket = self._bucket(remote)
+            if bucket is None:
+                return 0.0
+            wait = bucket.reserve(max(max_wait, 0.0))
+            budget = max(bucket.tokens, 0.0) / bucket.capacity
+        metrics.METRIC_RATE_LIMIT_BUDGET.labels(remote).set(budget)
+        if wait is None:
+            metrics.METRIC_RATE_LIMITED.labels(remote).inc()
+        elif wait:
+            metrics.METRIC_RATE_LIMIT_WAIT.labels(remote).observe(wait)
+        return wait
+
+    def store(self, remote: str, key: str, value: Any):
+        with self._lock:
+            self.cache[(remote, key)] = (value, time.time())
+
+    def cached(self, remote: str, key: str, fallback: Any) -> Any:
+        with self._lock:
+            value, _ = self.cache.get((remote, key), (fallback, 0))
+        return value
+
+    def age(self, remote: str, key: str) -> float:
+        """Seconds since the call was last answered, infinite if it never was."""
+        with self._lock:
+            if (remote, key) not in self.cache:
+                return float("inf")
+            return time.time() - self.cache[(remote, key)][1]
+
+
+limiter = RateLimiter()
+
+
+def rate_limited(remote: str, fallback: Any = None, cached: bool = True):
+    """Decorator counting each call against the remote's quota, waiting for its turn or returning the cached result
+    when it is used up.
+
+    Results equal to fallback (the function's error return) aren't cached. With cached=False calls over the
+    quota return RATE_LIMITED instead."""
+    def over_quota(func, key: str):
+        if not cached:
+            logger.debug(f"{remote} quota used up, skipping {func.__name__}{key}")
+            return RATE_LIMITED
+        logger.debug(f"{remote} quota used up, serving the cached {func.__name__}{key}")
+        return limiter.cached(remote, key, fallback)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = call_key(args, kwargs)
+                wait = limiter.reserve(remote)
+                if wait is None:
+                    return over_quota(func, key)
+                if wait:
+                    await asyncio.sleep(wait)
+                result = await func(*args, **kwargs)
+                if cached and result != fallback:
+                    limiter.store(remote, key, result)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = call_key(args, kwargs)
+            wait = limiter.reserve(remote)
+            if wait is None:
+                return over_quota(func, key)
+            if wait:
+                time.sleep(wait)
+            result = func(*args, **kwargs)
+            if cached and result != fallback:
+                limiter.store(remote, key, result)
+            return result
+        return wrapper
+    return decorator
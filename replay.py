@@ -0,0 +1,473 @@
+#!/usr/bin/python3 -u
+# -*- coding: utf-8 -*-
+"""
+Record and replay of feeder runs.
+
+Recording (RECORD_FILE=path.jsonl.gz when running main.py) captures every HTTP response made through requests -
+LCD, Band, Osmosis - every gRPC query reply, and every oracle tx sent - symphonyd invocations, or RPC broadcasts
+with BROADCAST_MODE=sync / async, stored in the same command form - with its result and timing into a gzipped
+JSON lines file. The settings that decide which requests are made and where to (endpoints, broadcast mode, gRPC
+queries, ...) are recorded too and restored on replay, whatever the environment replay runs in.
+
+Replay feeds a recording back through the real Orchestrator, get_prices and process_votes on a virtual clock:
+sleeps and request latencies advance the clock instead of waiting, so hours of epochs replay in seconds.
+
+    python replay.py recording.jsonl.gz
+
+The report shows per-stage latency in virtual time and any decision divergences - vote/prevote txs that differ
+from the recording in type, exchange rates or sender.
+"""
+import argparse
+import asyncio
+import base64
+import bisect
+import gzip
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, parse_qsl, urlencode, urlunsplit
+
+import requests
+
+import blockchain
+import config
+import grpc_client
+import speculation
+import vote_handler
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# env var -> setting, recorded with the run and restored on replay: where requests go, and who votes how
+RECORDED_SETTINGS = {
+    "CHAIN_ID": "chain_id",
+    "MODULE_NAME": "module_name",
+    "SYMPHONY_LCD": "lcd_address",
+    "TENDERMINT_RPC": "rpc_node",
+    "BLOCK_SOURCE": "block_source",
+    "GRPC_QUERIES": "grpc_queries",
+    "GRPC_ADDRESS": "grpc_address",
+    "BROADCAST_MODE": "broadcast_mode",
+    "BAND_ENDPOINT": "band_endpoint",
+    "BAND_PRICE_PARAMS": "band_standard_price_params",
+    "OSMOSIS_LCD": "osmosis_lcd",
+    "OSMOSIS_POOL_ID": "osmosis_pool_id",
+    "OSMOSIS_POOL_IDS": "osmosis_pool_ids",
+    "OSMOSIS_BASE_ASSET": "osmosis_base_asset",
+    "OSMOSIS_QUOTE_ASSET": "osmosis_quote_asset",
+    "SPECULATIVE_LEAD": "speculative_lead",
+    "VALIDATOR_ADDRESS": "validator",
+    "VALIDATOR_VALOPER_ADDRESS": "valoper",
+    "FEEDER_ADDRESS": "feeder",
+}
+
+
+def recorded_settings() -> Dict[str, str]:
+    recorded = {var: str(getattr(settings, name)) for var, name in RECORDED_SETTINGS.items()}
+    recorded["VALIDATORS"] = ",".join(f"{identity.valoper}:{identity.feeder}:{identity.key}:{identity.validator}"
+                                      for identity in settings.validator_set)
+    return recorded
+
+
+class ReplayedRpcError(Exception):
+    """A recorded gRPC error - code() mirrors grpc.RpcError for grpc_client.is_not_found."""
+
+    def __init__(self, code: str, details: str):
+        super().__init__(details)
+        self._code = code
+
+    def code(self):
+        return SimpleNamespace(name=self._code)
+
+
+def oracle_tx_args(kind: str, salt: str, exchange_rates: str, from_address: str,
+                   validator: Optional[str] = None) -> List[str]:
+    """The symphonyd command of an oracle tx - RPC broadcasts are recorded and compared in this form too."""
+    return ([settings.symphonyd_path, "tx", "oracle", kind, salt, exchange_rates, "--from", from_address]
+            + ([validator] if validator else []))
+
+
+def grpc_key(method: str, request: bytes) -> str:
+    return f"{method} {base64.b64encode(request).decode()}"
+
+
+def request_key(method: str, url: str) -> str:
+    """Requests are matched on method and url with sorted query params - symbol order comes from a set."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method} {urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))}"
+
+
+class Recorder:
+    """Captures HTTP responses and symphonyd invocations to a compact gzipped JSON lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._start = 0.0
+        self._original_send = None
+        self._original_command = None
+        self._original_broadcast = None
+        self._original_grpc_call = None
+
+    def _write(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def start(self):
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self._start = time.monotonic()
+        self._write({"kind": "meta", "start_wall": time.time(), "chain_id": settings.chain_id,
+                     "validators": [identity.valoper for identity in settings.validators],
+                     "settings": recorded_settings()})
+
+        recorder = self
+        self._original_send = original_send = requests.Session.send
+        self._original_command = original_command = blockchain.run_symphonyd_command
+        self._original_broadcast = original_broadcast = blockchain.broadcast_oracle_tx
+        self._original_grpc_call = original_grpc_call = grpc_client.call
+
+        def send(session, request, **kwargs):
+            started = time.monotonic()
+            response = original_send(session, request, **kwargs)
+            recorder._write({"kind": "http", "t": round(started - recorder._start, 4), "method": request.method,
+                             "url": request.url, "status": response.status_code, "body": response.text,
+                             "elapsed": round(time.monotonic() - started, 4)})
+            return response
+
+        def run_symphonyd_command(command):
+            started = time.monotonic()
+            result = original_command(command)
+            recorder._write({"kind": "cmd", "t": round(started - recorder._start, 4), "args": command,
+                             "result": result, "elapsed": round(time.monotonic() - started, 4)})
+            return result
+
+        def broadcast_oracle_tx(kind, salt, exchange_rates, from_address, validator=None, presigned=None):
+            started = time.monotonic()
+            result = original_broadcast(kind, salt, exchange_rates, from_address, validator, presigned)
+            recorder._write({"kind": "cmd", "t": round(started - recorder._start, 4),
+                             "args": oracle_tx_args(kind, salt, exchange_rates, from_address, validator),
+                             "result": result, "elapsed": round(time.monotonic() - started, 4)})
+            return result
+
+        def grpc_call(method, request=b""):
+            started = time.monotonic()
+            record = {"kind": "grpc", "t": round(started - recorder._start, 4), "method": method,
+                      "request": base64.b64encode(request).decode()}
+            try:
+                reply = original_grpc_call(method, request)
+            except Exception as e:
+                code = e.code() if callable(getattr(e, "code", None)) else None
+                record.update(error=getattr(code, "name", "UNKNOWN"), details=str(e),
+                              elapsed=round(time.monotonic() - started, 4))
+                recorder._write(record)
+                raise
+            record.update(reply=base64.b64encode(reply).decode(), elapsed=round(time.monotonic() - started, 4))
+            recorder._write(record)
+            return reply
+
+        requests.Session.send = send
+        blockchain.run_symphonyd_command = run_symphonyd_command
+        blockchain.broadcast_oracle_tx = broadcast_oracle_tx
+        grpc_client.call = grpc_call
+        logger.info(f"Recording HTTP responses, gRPC replies and oracle txs to {self.path}")
+
+    def stop(self):
+        requests.Session.send = self._original_send
+        blockchain.run_symphonyd_command = self._original_command
+        blockchain.broadcast_oracle_tx = self._original_broadcast
+        grpc_client.call = self._original_grpc_call
+        self._file.close()
+
+
+def load_recording(path: str):
+    meta, http, grpc, commands = {}, defaultdict(list), defaultdict(list), []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["kind"] == "meta":
+                meta = meta or record
+            elif record["kind"] == "http":
+                http[request_key(record["method"], record["url"])].append(record)
+            elif record["kind"] == "grpc":
+                grpc[f"{record['method']} {record['request']}"].append(record)
+            elif record["kind"] == "cmd":
+                commands.append(record)
+    return meta, http, grpc, commands
+
+
+class VirtualClock:
+    def __init__(self, start_wall: float):
+        self.start_wall = start_wall
+        self._now = 0.0
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self.start_wall + self._now
+
+    def advance(self, seconds: float):
+        with self._lock:
+            self._now += max(seconds, 0.0)
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+
+class _VirtualSelector:
+    """Wraps the loop's selector: instead of blocking for timeout it advances the virtual clock."""
+
+    def __init__(self, selector, clock: VirtualClock):
+        self._selector = selector
+        self._clock = clock
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if not events:
+            if timeout is None:
+                raise RuntimeError("replay deadlocked - no timers or ready callbacks left")
+            self._clock.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self._clock = clock
+        self._selector = _VirtualSelector(self._selector, clock)
+
+    def time(self) -> float:
+        return self._clock.monotonic()
+
+
+class Replayer:
+    """Serves recorded responses by virtual time and compares the txs the feeder decides to send."""
+
+    def __init__(self, path: str):
+        self.meta, self.http, self.grpc, self.commands = load_recording(path)
+        self.clock = VirtualClock(self.meta.get("start_wall", time.time()))
+        self._http_times = {key: [record["t"] for record in records] for key, records in self.http.items()}
+        self._grpc_times = {key: [record["t"] for record in records] for key, records in self.grpc.items()}
+        self._command_queues = defaultdict(list)
+        self._salts = defaultdict(list)
+        for record in self.commands:
+            self._command_queues[tuple(record["args"][1:4])].append(record)
+            if record["args"][1:4] == ["tx", "oracle", "aggregate-prevote"]:
+                self._salts[self._from_account(record["args"])].append(record["args"][4])
+        self.stage_latency: Dict[str, List[float]] = defaultdict(list)
+        self.divergences: List[dict] = []
+        self.unrecorded: Dict[str, int] = defaultdict(int)
+        self.epochs = set()
+        self.end_time = max([r["t"] for records in self.http.values() for r in records] +
+                            [r["t"] for records in self.grpc.values() for r in records] +
+                            [r["t"] for r in self.commands] + [0.0])
+
+    @staticmethod
+    def _from_account(args: List[str]) -> Optional[str]:
+        return args[args.index("--from") + 1] if "--from" in args else None
+
+    def send(self, session, request, **kwargs):
+        key = request_key(request.method, request.url)
+        records = self.http.get(key)
+        if not records:
+            self.unrecorded[key] += 1
+            raise requests.ConnectionError(f"no recorded response for {key}")
+        # the latest response recorded at or before the virtual now, so polled endpoints progress with the clock
+        index = max(bisect.bisect_right(self._http_times[key], self.clock.monotonic()) - 1, 0)
+        record = records[index]
+        self.clock.advance(record["elapsed"])
+        response = requests.models.Response()
+        response.status_code = record["status"]
+        response._content = record["body"].encode("utf-8")
+        response._content_consumed = True  # the whole body is here, streamed reads iterate over it
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def grpc_call(self, method: str, request: bytes = b"") -> bytes:
+        key = grpc_key(method, request)
+        records = self.grpc.get(key)
+        if not records:
+            self.unrecorded[f"GRPC {method}"] += 1
+            raise ReplayedRpcError("UNAVAILABLE", f"no recorded reply for {key}")
+        record = records[max(bisect.bisect_right(self._grpc_times[key], self.clock.monotonic()) - 1, 0)]
+        self.clock.advance(record["elapsed"])
+        if "error" in record:
+            raise ReplayedRpcError(record["error"], record["details"])
+        return base64.b64decode(record["reply"])
+
+    def broadcast_oracle_tx(self, kind, salt, exchange_rates, from_address, validator=None, presigned=None) -> dict:
+        return self.run_symphonyd_command(oracle_tx_args(kind, salt, exchange_rates, from_address, validator))
+
+    def run_symphonyd_command(self, command: List[str]) -> dict:
+        queue = self._command_queues.get(tuple(command[1:4]))
+        if not queue:
+            self.divergences.append({"t": self.clock.monotonic(), "kind": "extra command", "replayed": command[1:6]})
+            return {"error": "no recorded command"}
+        record = queue.pop(0)
+        recorded = record["args"]
+        # the salt is matched by get_salt below, so compare everything that reflects a decision
+        for label, index in (("exchange rates", 5),):
+            if len(command) > index and len(recorded) > index and command[index] != recorded[index]:
+                self.divergences.append({"t": self.clock.monotonic(), "kind": f"{command[3]} {label}",
+                                         "recorded": recorded[index], "replayed": command[index]})
+        if self._from_account(command) != self._from_account(recorded):
+            self.divergences.append({"t": self.clock.monotonic(), "kind": f"{command[3]} sender",
+                                     "recorded": self._from_account(recorded), "replayed": self._from_account(command)})
+        self.clock.advance(record["elapsed"])
+        return record["result"]
+
+    def get_salt(self, string: str) -> str:
+        """Reuse the recorded prevote salts so replayed hashes match the recorded chain state."""
+        for identity in settings.validators:
+            if string.endswith(identity.valoper) and self._salts.get(identity.from_account):
+                return self._salts[identity.from_account].pop(0)
+        return self._original_get_salt(string)
+
+    def timed(self, stage: str, func):
+        def wrapper(*args, **kwargs):
+            started = self.clock.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stage_latency[stage].append(self.clock.monotonic() - started)
+        return wrapper
+
+    def run(self) -> dict:
+        import orchestrator
+
+        async def to_thread(func, *args, **kwargs):
+            return func(*args, **kwargs)
+
+        def process_votes(prices, vote_states, epoch, identities=None, prepared=None):
+            self.epochs.add(epoch)
+            return original["process_votes_for_validators"](prices, vote_states, epoch, identities, prepared)
+
+        original = {name: getattr(orchestrator, name) for name in (
+            "get_latest_block", "get_current_epoch", "get_prices", "process_votes_for_validators",
+            "get_misses_for_validators")}
+        def session_request(session, method, url, params=None, **kwargs):
+            # skips requests' per call session and proxy environment setup, which would dominate replay time
+            return self.send(session, requests.Request(method, url, params=params).prepare())
+
+        def api_request(method, url, **kwargs):
+            return session_request(None, method, url, **kwargs)
+
+        patches = [
+            (requests.Session, "request", session_request),
+            (requests.api, "request", api_request),
+            (blockchain, "run_symphonyd_command", self.run_symphonyd_command),
+            (blockchain, "broadcast_oracle_tx", self.broadcast_oracle_tx),
+            (grpc_client, "call", self.grpc_call),
+            # recorded txs are compared by content, pre-signing would only shell out to symphonyd
+            (speculation, "presign_oracle_tx", lambda *args, **kwargs: None),
+            (vote_handler, "get_salt", self.get_salt),
+            (time, "time", self.clock.time),
+            (time, "monotonic", self.clock.monotonic),
+            (time, "sleep", self.clock.sleep),
+            (asyncio, "to_thread", to_thread),
+            (orchestrator, "get_latest_block", self.timed("block", original["get_latest_block"])),
+            (orchestrator, "get_current_epoch", self.timed("epoch", original["get_current_epoch"])),
+            (orchestrator, "get_prices", self.timed("prices", original["get_prices"])),
+            (orchestrator, "process_votes_for_validators", self.timed("votes", process_votes)),
+            (orchestrator, "get_misses_for_validators", self.timed("misses", original["get_misses_for_validators"])),
+        ]
+        self._original_get_salt = vote_handler.get_salt
+        saved_env = dict(os.environ)
+        # the recorded run's endpoints and modes, so requests match the recording (older recordings have none)
+        os.environ.update(self.meta.get("settings", {}))
+        config.get_settings.cache_clear()
+        saved = [(target, name, getattr(target, name)) for target, name, _ in patches]
+        for target, name, replacement in patches:
+            setattr(target, name, replacement)
+
+        wall_start = time.perf_counter()
+        loop = VirtualTimeEventLoop(self.clock)
+        try:
+            loop.run_until_complete(self._run_orchestrator(orchestrator.Orchestrator()))
+        finally:
+            loop.close()
+            for target, name, value in saved:
+                setattr(target, name, value)
+            os.environ.clear()
+            os.environ.update(saved_env)
+            config.get_settings.cache_clear()
+        return self.report(time.perf_counter() - wall_start)
+
+    async def _run_orchestrator(self, orch):
+        task = asyncio.ensure_future(orch.run())
+        while self.clock.monotonic() < self.end_time and not task.done():
+            await asyncio.sleep(1)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def report(self, wall_seconds: float) -> dict:
+        stages = {}
+        for stage, samples in self.stage_latency.items():
+            ordered = sorted(samples)
+            stages[stage] = {
+                "count": len(ordered),
+                "p50": statistics.median(ordered),
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+            }
+        leftover = sum(len(queue) for queue in self._command_queues.values())
+        return {
+            "epochs": len(self.epochs),
+            "virtual_seconds": self.clock.monotonic(),
+            "wall_seconds": wall_seconds,
+            "epochs_per_minute": len(self.epochs) / wall_seconds * 60 if wall_seconds else 0.0,
+            "stages": stages,
+            "divergences": self.divergences + ([{"kind": "missing commands", "recorded": leftover}] if leftover else []),
+            "unrecorded_requests": dict(self.unrecorded),
+        }
+
+
+def print_report(report: dict):
+    print(f"Replayed {report['epochs']} epochs ({report['virtual_seconds']:.0f}s virtual) in "
+          f"{report['wall_seconds']:.2f}s - {report['epochs_per_minute']:.0f} epochs/minute")
+    print(f"{'stage':<10}{'count':>8}{'p50 s':>10}{'p95 s':>10}{'max s':>10}")
+    for stage, stats in sorted(report["stages"].items()):
+        print(f"{stage:<10}{stats['count']:>8}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['max']:>10.3f}")
+    if report["divergences"]:
+        print(f"{len(report['divergences'])} decision divergences:")
+        for divergence in report["divergences"]:
+            print(f"  {divergence}")
+    else:
+        print("No decision divergences")
+    for key, count in report["unrecorded_requests"].items():
+        print(f"  unrecorded request x{count}: {key}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--log-level", default="CRITICAL", help="feeder log level during replay")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    result = Replayer(args.recording).run()
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    raise SystemExit(1 if result["divergences"] else 0)
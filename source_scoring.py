@@ -0,0 +1,147 @@
+"""
+Price source quality scoring.
+
+Every fetch and every aggregation is scored per source over the last SOURCE_SCORE_WINDOW fetches:
+
+- error rate        fetches that failed or timed out
+- latency           p50 / p95 fetch latency, a p95 above SOURCE_SLOW_LATENCY scales the score down
+- stale rate        share of the expected symbols a source left out (i.e Band quotes dropped as stale)
+- deviation         median relative distance of the source's prices from the aggregated (consensus) price,
+                    only measured when several sources price the same thing
+
+The score (0 to 1) multiplies the source's configured weight in price_feeder's weighted median / average.
+A source scoring under SOURCE_MIN_SCORE is dropped from the fan-out, so a slow or wrong venue stops holding up
+every epoch boundary; it is probed again every SOURCE_PROBE_INTERVAL seconds and gets a fresh history when a
+probe succeeds. The last sources of a kind are never all dropped.
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# fetches needed before a source can be dropped
+MIN_SAMPLES = 5
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def result_values(data) -> Dict[str, float]:
+    """Prices of a source result by symbol - a base price is keyed by "base"."""
+    if isinstance(data, dict):
+        return {symbol: float(value) for symbol, value in data.items() if value}
+    return {"base": float(data)} if data else {}
+
+
+@dataclass
+class SourceStats:
+    size: int
+    latencies: deque = field(init=False)
+    errors: deque = field(init=False)
+    missing: deque = field(init=False)
+    deviations: deque = field(init=False)
+    dropped_at: Optional[float] = None
+
+    def __post_init__(self):
+        self.latencies = deque(maxlen=self.size)
+        self.errors = deque(maxlen=self.size)
+        self.missing = deque(maxlen=self.size)
+        self.deviations = deque(maxlen=self.size)
+
+    def score(self) -> float:
+        if not self.errors:
+            return 1.0
+        score = 1 - sum(self.errors) / len(self.errors)
+        if self.missing:
+            score *= 1 - statistics.fmean(self.missing)
+        p95 = percentile(list(self.latencies), 0.95)
+        if p95 > settings.source_slow_latency:
+            score *= settings.source_slow_latency / p95
+        if self.deviations:
+            deviation = statistics.median(self.deviations)
+            score /= 1 + (deviation / settings.source_deviation_tolerance) ** 2
+        return score
+
+
+class SourceScorer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats: Dict[str, SourceStats] = {}
+
+    def _stats(self, name: str) -> SourceStats:
+        if name not in self.stats:
+            self.stats[name] = SourceStats(settings.source_score_window)
+        return self.stats[name]
+
+    def observe_fetch(self, name: str, err_flag: bool, latency: float):
+        with self._lock:
+            stats = self._stats(name)
+            if stats.dropped_at is not None and not err_flag:
+                logger.info(f"Price source {name} answered its probe, back in the fan-out")
+                stats = self.stats[name] = SourceStats(settings.source_score_window)
+            stats.latencies.append(latency)
+            stats.errors.append(err_flag)
+        self._update(name)
+
+    def observe_consensus(self, results, consensus: Dict[str, float]):
+        """Score the sources aggregated into consensus by how far off they were and what they left out."""
+        priced = [(result.source.name, result_values(result.data)) for result in results if not result.err_flag]
+        with self._lock:
+            for name, values in priced:
+                stats = self._stats(name)
+                stats.missing.append(sum(symbol not in values for symbol in consensus) / len(consensus)
+                                     if consensus else 0.0)
+                deviations = [abs(values[symbol] / price - 1) for symbol, price in consensus.items()
+                              if symbol in values and price]
+                # a single source is the consensus
+                if deviations and len(priced) > 1:
+                    stats.deviations.append(statistics.median(deviations))
+                    metrics.METRIC_SOURCE_DEVIATION.labels(name).set(stats.deviations[-1])
+        for name, _ in priced:
+            self._update(name)
+
+    def _update(self, name: str):
+        with self._lock:
+            stats = self._stats(name)
+            score = stats.score()
+            if stats.dropped_at is None and len(stats.errors) >= MIN_SAMPLES and score < settings.source_min_score:
+                stats.dropped_at = time.time()
+                logger.warning(f"Price source {name} dropped from the fan-out, score {score:.2f}")
+            elif stats.dropped_at is not None:
+                # failed probe, wait another interval
+                stats.dropped_at = time.time()
+        metrics.METRIC_SOURCE_SCORE.labels(name).set(score)
+        metrics.METRIC_SOURCE_DROPPED.labels(name).set(0 if stats.dropped_at is None else 1)
+
+    def weight(self, source) -> float:
+        with self._lock:
+            stats = self.stats.get(source.name)
+            return source.weight * (stats.score() if stats else 1.0)
+
+    def select(self, sources: list) -> list:
+        """The sources to fetch - those not dropped, or whose probe is due."""
+        now = time.time()
+        with self._lock:
+            def active(source):
+                stats = self.stats.get(source.name)
+                return (stats is None or stats.dropped_at is None
+                        or now - stats.dropped_at >= settings.source_probe_interval)
+            selected = [source for source in sources if active(source)]
+        for kind in {source.kind for source in sources}:
+            if not any(source.kind == kind for source in selected):
+                # better a poor source than no price at all
+                selected += [source for source in sources if source.kind == kind]
+        return selected
+
+
+scorer = SourceScorer()
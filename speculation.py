@@ -0,0 +1,110 @@
+"""
+Speculative prevote preparation.
+
+SPECULATIVE_LEAD seconds before the predicted epoch boundary the orchestrator fetches prices and prepares the
+next epoch's prevote payload - formatted prices, and salt and hash per validator - and keeps re-fetching prices
+until the boundary, only rebuilding the payload if a price moved by more than SPECULATIVE_TOLERANCE. When the
+new epoch is seen the prepared payload is voted straight away instead of fetching prices after the boundary.
+
+With BROADCAST_MODE=sync / async each prevote is also signed ahead (tx_broadcast.presign_oracle_tx), at the
+sequence it gets at the boundary - after the vote revealing the last prevote, if there is one. Submitting it is
+then a broadcast of the prepared bytes; they are signed again if the account's sequence moved in the meantime.
+Only prevotes are signed ahead: a vote can't be simulated for gas before its reveal period starts. In CLI mode
+symphonyd signs and broadcasts in one call, so only the payload is prepared.
+
+Hits and misses are counted for the epochs speculation ran for.
+"""
+import dataclasses
+import logging
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+import metrics
+from config import settings
+from price_feeder import format_prices
+from tx_broadcast import SignedTx, presign_oracle_tx
+from vote_handler import get_tx_args, prepare_prevote
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class PreparedPrevotes:
+    epoch: int
+    prices: Mapping[str, float]
+    formatted: str
+    prevotes: Dict[str, Tuple[str, str, Optional[SignedTx]]]  # valoper -> (salt, hash, pre-signed prevote)
+    checked_at: float  # last time prices were confirmed within tolerance
+
+
+def prices_within_tolerance(old: Mapping[str, float], new: Mapping[str, float], tolerance: float) -> bool:
+    """True if both have the same denoms and no price moved by more than tolerance (relative)."""
+    if old.keys() != new.keys():
+        return False
+    return all(abs(new[denom] - price) <= tolerance * abs(price) for denom, price in old.items())
+
+
+def presign_prevote(formatted: str, salt: str, identity, reveals: bool) -> Optional[SignedTx]:
+    """The prevote signed at the sequence it gets at the boundary, None in CLI mode or on error.
+
+    reveals: a vote of the last prevote goes out first, taking the next sequence."""
+    if settings.broadcast_mode == "cli":
+        return None
+    return presign_oracle_tx("aggregate-prevote", *get_tx_args(identity, salt, formatted), offset=1 if reveals else 0)
+
+
+class Speculator:
+    def __init__(self):
+        self.prepared: Optional[PreparedPrevotes] = None
+        self.speculated_epoch: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def offer(self, epoch: int, prices: Mapping[str, float], identities, vote_states: Optional[Mapping] = None):
+        """Prepare the prevotes for epoch from prices, unless an equivalent payload is already prepared.
+
+        vote_states (valoper -> (last price, salt, hash)) tells which validators reveal a prevote at the boundary.
+        Blocking in RPC broadcast modes, prevotes are signed with symphonyd."""
+        self.speculated_epoch = epoch
+        vote_states = vote_states or {}
+        prepared = self.prepared
+        if prepared is not None and prepared.epoch == epoch:
+            if prices_within_tolerance(prepared.prices, prices, settings.speculative_tolerance):
+                self.prepared = dataclasses.replace(prepared, checked_at=time.time())
+                return
+            logger.debug(f"Prices moved past {settings.speculative_tolerance} since preparing epoch {epoch}, rebuilding")
+            metrics.METRIC_SPECULATION.labels('rebuild').inc()
+
+        formatted = format_prices(prices)
+        if not formatted:
+            return
+        prevotes = {}
+        for identity in identities:
+            salt, prevote_hash = prepare_prevote(formatted, identity)
+            reveals = bool(vote_states.get(identity.valoper, ("", "", ""))[2])
+            prevotes[identity.valoper] = (salt, prevote_hash, presign_prevote(formatted, salt, identity, reveals))
+        self.prepared = PreparedPrevotes(
+            epoch=epoch,
+            prices=dict(prices),
+            formatted=formatted,
+            prevotes=prevotes,
+            checked_at=time.time(),
+        )
+        logger.debug(f"Prepared prevotes for epoch {epoch}: {formatted}")
+
+    def take(self, epoch: int) -> Optional[PreparedPrevotes]:
+        """The prepared payload for epoch if it is still fresh, None if prices have to be fetched."""
+        prepared, self.prepared = self.prepared, None
+        if self.speculated_epoch != epoch:
+            # speculation didn't run for this epoch (no boundary prediction yet, standby, ...) - neither hit nor miss
+            return None
+        max_age = 2 * settings.speculative_lead
+        if prepared is None or prepared.epoch != epoch or time.time() - prepared.checked_at > max_age:
+            self.misses += 1
+            metrics.METRIC_SPECULATION.labels('miss').inc()
+            prepared = None
+        else:
+            self.hits += 1
+            metrics.METRIC_SPECULATION.labels('hit').inc()
+        metrics.METRIC_SPECULATION_HIT_RATE.set(self.hits / (self.hits + self.misses))
+        return prepared
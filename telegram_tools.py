@@ -1,10 +1,10 @@
 import requests
-from config import *
+from config import settings
 from alerts import telegram
 def get_chat_id():
-    TOKEN = telegram_token
+    TOKEN = settings.telegram_token
     url = f"https://api.telegram.org/bot{TOKEN}/getUpdates"
-    result=requests.get(url, timeout=alert_http_timeout).json()
+    result=requests.get(url, timeout=settings.alert_http_timeout).json()
     chat_id= result["result"][0]["message"]["chat"]["id"]
     print(chat_id)
 
@@ -13,6 +13,8 @@ def test_telegram():
     telegram(message)
 
 
-get_chat_id()
-test_telegram()
+if __name__ == "__main__":
+    get_chat_id()
+    test_telegram()
+
 
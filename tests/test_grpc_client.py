@@ -0,0 +1,24 @@
+import grpc
+
+import grpc_client
+import metrics
+
+
+class NotFound(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.NOT_FOUND
+
+
+def grpc_errors():
+    return metrics.METRIC_OUTBOUND_ERROR.labels('grpc')._value.get()
+
+
+def test_no_prevote_is_an_empty_result_not_an_error(monkeypatch):
+    def call(method, request=b""):
+        raise NotFound()
+
+    monkeypatch.setattr(grpc_client, "call", call)
+    errors = grpc_errors()
+
+    assert grpc_client.get_my_current_prevote_hash("symphonyvaloper1test") == []
+    assert grpc_errors() == errors
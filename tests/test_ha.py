@@ -0,0 +1,31 @@
+import time
+
+import ha
+import vote_handler
+from ha import FileLease
+
+
+def test_lease_lost_once_another_instance_takes_it_over(tmp_path):
+    path = str(tmp_path / "lease.json")
+    leader = FileLease(path, "a", ttl=10)
+    assert leader.try_acquire()
+    assert leader.verify()
+
+    # the standby takes over a lease it saw expire, i.e while the leader was stalled
+    ha._write_json_atomic(path, {"holder": "b", "term": leader.term + 1, "expires_at": time.time() + 10})
+
+    assert leader.held  # the leader's own view, until its next renewal
+    assert not leader.verify()
+
+
+def test_no_broadcast_after_the_lease_was_lost(tmp_path, monkeypatch):
+    path = str(tmp_path / "lease.json")
+    lease = FileLease(path, "a", ttl=10)
+    assert lease.try_acquire()
+    monkeypatch.setattr(ha, "current_lease", lease)
+    sent = []
+
+    assert vote_handler.broadcast(sent.append, "vote") is None
+    ha._write_json_atomic(path, {"holder": "b", "term": lease.term + 1, "expires_at": time.time() + 10})
+    assert vote_handler.broadcast(sent.append, "prevote") == {"error": "HA lease lost, not broadcasting"}
+    assert sent == ["vote"]
@@ -0,0 +1,25 @@
+import logging
+
+from log_pipeline import CorrelationFilter, SamplingFilter, log_context
+
+
+def emit(sampler, validator=None):
+    record = logging.LogRecord("vote_handler", logging.INFO, "vote_handler.py", 10, "%s confirmed success",
+                               ("vote",), None)
+    with log_context(validator=validator):
+        CorrelationFilter().filter(record)
+    return sampler.filter(record)
+
+
+def test_sampling_is_per_call_site():
+    sampler = SamplingFilter(burst=2, window=60)
+
+    assert [emit(sampler) for _ in range(3)] == [True, True, False]
+
+
+def test_one_validator_does_not_crowd_out_another():
+    sampler = SamplingFilter(burst=2, window=60)
+    for _ in range(3):
+        emit(sampler, "symphonyvaloper1a")
+
+    assert emit(sampler, "symphonyvaloper1b")
@@ -0,0 +1,32 @@
+import pytest
+
+import config
+from osmosis_pricing import OsmosisPricer
+
+
+@pytest.fixture(autouse=True)
+def twap_window(monkeypatch):
+    monkeypatch.setenv("OSMOSIS_TWAP_WINDOW", "60")
+    config.get_settings.cache_clear()
+    yield
+    config.get_settings.cache_clear()
+
+
+def test_samples_older_than_the_window_are_dropped():
+    pricer = OsmosisPricer()
+    pricer.record("1", 1.0, at=1000.0)
+    pricer.record("1", 2.0, at=1050.0)
+    pricer.record("1", 3.0, at=1070.0)
+
+    assert [price for _, price in pricer.samples["1"]] == [2.0, 3.0]
+    # 2.0 from 1050 to 1070, 3.0 from 1070 to 1080
+    assert pricer.pool_price("1", now=1080.0) == pytest.approx((2.0 * 20 + 3.0 * 10) / 30)
+
+
+def test_no_price_without_samples_in_the_window():
+    pricer = OsmosisPricer()
+    pricer.record("1", 1.0, at=1000.0)
+
+    assert pricer.pool_price("1", now=1030.0) == 1.0
+    assert pricer.pool_price("1", now=1061.0) is None
+    assert pricer.combined_price(["1"]) is None
@@ -0,0 +1,31 @@
+from prevote_tracker import PrevoteTracker
+
+
+def test_epoch_at_maps_heights_between_known_starts():
+    tracker = PrevoteTracker()
+    tracker.observe_epoch_start(4, 100)
+    tracker.observe_epoch_start(5, 112)
+
+    assert tracker.epoch_at(99) is None
+    assert tracker.epoch_at(100) == 4
+    assert tracker.epoch_at(111) == 4
+    assert tracker.epoch_at(112) == 5
+    assert tracker.epoch_at(130) == 5
+
+
+def test_epoch_at_unknown_across_a_gap():
+    tracker = PrevoteTracker()
+    tracker.observe_epoch_start(4, 100)
+    tracker.observe_epoch_start(6, 124)
+
+    # epoch 5 started somewhere in between
+    assert tracker.epoch_at(110) is None
+    assert tracker.epoch_at(124) == 6
+
+
+def test_committed_hash_only_for_the_previous_epoch():
+    tracker = PrevoteTracker()
+    tracker.record_confirmed("valoper", "abc", 4)
+
+    assert tracker.committed_hash("valoper", 5) == "abc"
+    assert tracker.committed_hash("valoper", 6) is None
@@ -0,0 +1,38 @@
+import socket
+import time
+
+import price_publisher
+from price_publisher import PricePublisher, PriceSubscriber
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_subscriber_falling_behind_is_dropped_without_holding_up_the_others(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_publisher, "SEND_TIMEOUT", 0.2)
+    path = str(tmp_path / "prices.sock")
+    publisher = PricePublisher(path)
+    publisher.start()
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        stalled.connect(path)  # never reads
+        subscriber = PriceSubscriber(path)
+        subscriber.start()
+        assert wait_for(lambda: len(publisher._clients) == 2)
+
+        # large enough snapshots to fill the stalled socket's buffer
+        prices = {f"denom{index}": float(index) for index in range(20000)}
+        for epoch in range(1, 8):
+            started = time.monotonic()
+            publisher.publish(epoch, prices)
+            assert time.monotonic() - started < 1.0
+
+        assert len(publisher._clients) == 1
+        assert wait_for(lambda: subscriber.latest() is not None and subscriber.latest().epoch == 7)
+    finally:
+        stalled.close()
+        publisher.close()
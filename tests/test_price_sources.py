@@ -0,0 +1,21 @@
+import time
+
+import price_sources
+from price_sources import FX, PriceSource, blocking
+
+
+def test_blocking_source_abandoned_at_its_deadline(monkeypatch):
+    def slow_fetch():
+        time.sleep(3)
+        return False, {"EUR": 0.9}
+
+    source = PriceSource("slow", FX, blocking(slow_fetch), deadline=0.5)
+    monkeypatch.setattr(price_sources, "enabled_sources", lambda kinds=None: [source])
+    monkeypatch.setattr(price_sources.scorer, "select", lambda sources: sources)
+
+    started = time.monotonic()
+    results = price_sources.fetch_sources()
+    elapsed = time.monotonic() - started
+
+    assert results["slow"].err_flag
+    assert elapsed < 1.5
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+import config
+import rate_limiter
+from rate_limiter import RATE_LIMITED, RateLimiter, rate_limited
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setenv("RATE_LIMITS", "paced=2/1")
+    config.get_settings.cache_clear()
+    limiter = RateLimiter()
+    monkeypatch.setattr(rate_limiter, "limiter", limiter)
+    yield limiter
+    config.get_settings.cache_clear()
+
+
+def test_calls_over_the_quota_wait_for_their_turn_within_the_deadline(limiter):
+    calls = []
+    fetch = rate_limited("paced", cached=False)(lambda: calls.append(time.monotonic()) or 1.0)
+
+    rate_limiter.deadline.set(time.monotonic() + config.settings.http_timeout + 1.5)
+    try:
+        results = [fetch() for _ in range(4)]
+    finally:
+        rate_limiter.deadline.set(None)
+
+    assert results == [1.0] * 4
+    # 2 requests a second: the last two are spread half a second apart
+    assert calls[3] - calls[1] == pytest.approx(1.0, abs=0.15)
+
+
+def test_calls_over_the_quota_skipped_when_they_cant_make_the_deadline(limiter):
+    fetch = rate_limited("paced", cached=False)(lambda: 1.0)
+
+    rate_limiter.deadline.set(time.monotonic() + config.settings.http_timeout + 0.2)
+    try:
+        results = [fetch() for _ in range(3)]
+    finally:
+        rate_limiter.deadline.set(None)
+
+    assert results == [1.0, 1.0, RATE_LIMITED]
+
+
+def test_calls_outside_a_price_fetch_never_wait(limiter):
+    fetch = rate_limited("paced", cached=False)(lambda: 1.0)
+
+    assert [fetch() for _ in range(3)] == [1.0, 1.0, RATE_LIMITED]
@@ -0,0 +1,26 @@
+import time
+
+import block_clock
+from tx_tracker import TxTracker, _PendingTx
+
+
+def pending(registered_at, broadcast_height=100):
+    return _PendingTx("vote", registered_at, registered_at + 30, broadcast_height)
+
+
+def test_not_dropped_right_after_broadcast(monkeypatch):
+    monkeypatch.setattr(block_clock.estimator, "height", 100)
+
+    assert not TxTracker._may_be_dropped(pending(time.time() - 0.3))
+
+
+def test_may_be_dropped_after_a_new_block(monkeypatch):
+    monkeypatch.setattr(block_clock.estimator, "height", 101)
+
+    assert TxTracker._may_be_dropped(pending(time.time() - 0.3))
+
+
+def test_may_be_dropped_after_the_minimum_age_without_blocks(monkeypatch):
+    monkeypatch.setattr(block_clock.estimator, "height", 100)
+
+    assert TxTracker._may_be_dropped(pending(time.time() - 60))
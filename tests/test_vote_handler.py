@@ -0,0 +1,80 @@
+import config
+import vote_handler
+from config import ValidatorIdentity
+
+IDENTITY = ValidatorIdentity(valoper="symphonyvaloper1test", validator="symphony1test")
+
+
+def test_vote_retried_without_reprevoting_after_the_prevote_landed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(vote_handler, "get_current_prevote_hash", lambda valoper, epoch: ("last", True))
+    monkeypatch.setattr(vote_handler, "recheck_hash_match", lambda *args: calls.append("recheck") or (False, False))
+    monkeypatch.setattr(vote_handler, "perform_vote_and_prevote",
+                        lambda *args: calls.append("both") or (True, False))
+    monkeypatch.setattr(vote_handler, "perform_vote_only", lambda *args: calls.append("vote") or False)
+    monkeypatch.setattr(vote_handler, "perform_prevote_only", lambda *args: calls.append("prevote") or False)
+
+    vote_handler.process_votes("1.0note", "0.9note", "salt", "last", 5, IDENTITY, ("salt2", "hash2", None))
+
+    assert calls == ["both", "vote"]
+
+
+def test_chain_rechecked_when_vote_and_prevote_both_failed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(vote_handler, "get_current_prevote_hash", lambda valoper, epoch: ("last", True))
+    monkeypatch.setattr(vote_handler, "recheck_hash_match", lambda *args: calls.append("recheck") or (False, False))
+    monkeypatch.setattr(vote_handler, "perform_vote_and_prevote",
+                        lambda *args: calls.append("both") or (True, True))
+    monkeypatch.setattr(vote_handler, "perform_prevote_only", lambda *args: calls.append("prevote") or False)
+
+    vote_handler.process_votes("1.0note", "0.9note", "salt", "last", 5, IDENTITY, ("salt2", "hash2", None))
+
+    assert calls == ["both", "recheck", "prevote"]
+
+
+def test_confirmed_prevote_recorded_in_the_epoch_of_its_block(monkeypatch):
+    from prevote_tracker import PrevoteTracker
+    from tx_tracker import parse_tx_response
+
+    tracker = PrevoteTracker()
+    tracker.observe_epoch_start(4, 100)
+    tracker.observe_epoch_start(5, 112)
+    monkeypatch.setattr(vote_handler, "prevote_tracker", tracker)
+    response = {"tx": {"body": {"messages": [{"@type": "/symphony.oracle.v1beta1.MsgAggregateExchangeRatePrevote",
+                                              "hash": "abc", "validator": IDENTITY.valoper}]}},
+                "tx_response": {"height": "111", "txhash": "TX", "code": 0}}
+
+    vote_handler.record_confirmed_prevote(parse_tx_response("TX", "pre_vote", 0.0, response))
+
+    assert tracker.committed_hash(IDENTITY.valoper, 5) == "abc"
+
+
+def test_single_validator_feeder_passes_the_validator_address(monkeypatch):
+    monkeypatch.setenv("VALIDATORS", "")
+    config.get_settings.cache_clear()
+    try:
+        identity = ValidatorIdentity(valoper="symphonyvaloper1test", feeder="symphony1feeder",
+                                     validator="symphony1test")
+        assert vote_handler.get_tx_args(identity, "salt", "1.0note")[3] == "symphony1test"
+    finally:
+        config.get_settings.cache_clear()
+
+
+def test_validator_set_feeder_passes_the_valoper(monkeypatch):
+    monkeypatch.setenv("VALIDATORS", "symphonyvaloper1a:symphony1feeder:key,symphonyvaloper1b:symphony1feeder:key")
+    config.get_settings.cache_clear()
+    try:
+        identity = config.settings.validators[0]
+        assert vote_handler.get_tx_args(identity, "salt", "1.0note")[3] == "symphonyvaloper1a"
+    finally:
+        config.get_settings.cache_clear()
+
+
+def test_validator_set_feeder_passes_the_entry_validator_account(monkeypatch):
+    monkeypatch.setenv("VALIDATORS", "symphonyvaloper1a:symphony1feeder:key:symphony1a")
+    config.get_settings.cache_clear()
+    try:
+        identity = config.settings.validators[0]
+        assert vote_handler.get_tx_args(identity, "salt", "1.0note")[3] == "symphony1a"
+    finally:
+        config.get_settings.cache_clear()
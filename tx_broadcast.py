@@ -0,0 +1,222 @@
+"""
+Direct Tendermint RPC broadcast of oracle txs.
+
+With BROADCAST_MODE=sync or async, oracle txs are not sent by `symphonyd tx ... --broadcast-mode sync`. Instead:
+
+    symphonyd tx oracle ... --generate-only   unsigned tx, with gas estimated by the node
+    symphonyd tx sign --offline               signed with a locally tracked account sequence
+    symphonyd tx encode                       protobuf bytes
+    POST broadcast_tx_sync / broadcast_tx_async to TENDERMINT_RPC over a persistent connection
+
+Each call returns as soon as the node has accepted the tx (sync) or received it (async), with the same
+{"txhash", "code", "raw_log"} shape as the CLI output plus the "sender" address. Because sequences are tracked
+locally, the vote and prevote can be broadcast back to back and confirmed together. Confirmation is left to the
+caller, which resets the sequence of a sender whose tx didn't make it.
+
+`presign_oracle_tx` signs a tx ahead of time (speculative prevotes, see speculation.py) at a sequence it doesn't
+reserve. broadcast_oracle_tx sends those bytes as they are if the tx is the same and its sequence is still the
+account's next one, and builds the tx afresh otherwise.
+"""
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import metrics
+from alerts import time_request
+from config import settings
+from fee_tuner import tuner as fee_tuner
+from http_client import lcd_get
+
+logger = logging.getLogger(__name__)
+
+_ADDRESS_PATTERN = re.compile(r"^[a-z]+1[02-9ac-hj-np-z]{38,}$")
+
+_session = requests.Session()
+_lock = threading.Lock()
+# from address -> (account_number, next sequence)
+_accounts: Dict[str, Tuple[int, int]] = {}
+
+
+class BroadcastError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class SignedTx:
+    """An oracle tx signed ahead of time, see presign_oracle_tx."""
+    kind: str
+    salt: str
+    exchange_rates: str
+    validator: Optional[str]
+    address: str
+    sequence: int
+    tx_bytes: str
+
+    def matches(self, kind: str, salt: str, exchange_rates: str, validator: Optional[str], address: str) -> bool:
+        return (self.kind, self.salt, self.exchange_rates, self.validator, self.address) == \
+            (kind, salt, exchange_rates, validator, address)
+
+
+def _run(command: List[str]) -> str:
+    result = subprocess.run(command, input=f"{settings.key_password}\n", capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise BroadcastError(f"{' '.join(command[:3])} failed: {result.stderr.strip()[:500]}")
+    return result.stdout.strip()
+
+
+def resolve_address(from_account: str) -> str:
+    """Account address of from_account, which may be a key name."""
+    if _ADDRESS_PATTERN.match(from_account):
+        return from_account
+    return _run([settings.symphonyd_path, "keys", "show", from_account, "-a",
+                 "--keyring-backend", settings.keyring_back_end])
+
+
+def fetch_account(address: str) -> Tuple[int, int]:
+    """(account_number, sequence) of address from the LCD."""
+    response = lcd_get(f"/cosmos/auth/v1beta1/accounts/{address}")
+    response.raise_for_status()
+    account = response.json()["account"]
+    # vesting / module accounts wrap the base account
+    account = account.get("base_account", account)
+    return int(account["account_number"]), int(account.get("sequence", 0))
+
+
+def next_sequence(address: str) -> Tuple[int, int]:
+    """Reserve the next sequence of address, fetching it from the chain the first time."""
+    with _lock:
+        if address not in _accounts:
+            _accounts[address] = fetch_account(address)
+        account_number, sequence = _accounts[address]
+        _accounts[address] = (account_number, sequence + 1)
+        return account_number, sequence
+
+
+def peek_sequence(address: str) -> Tuple[int, int]:
+    """(account_number, next sequence) of address, without reserving it."""
+    with _lock:
+        if address not in _accounts:
+            _accounts[address] = fetch_account(address)
+        return _accounts[address]
+
+
+def claim_sequence(address: str, sequence: int) -> bool:
+    """Reserve sequence if it is still the next sequence of address."""
+    with _lock:
+        if address not in _accounts or _accounts[address][1] != sequence:
+            return False
+        account_number, _ = _accounts[address]
+        _accounts[address] = (account_number, sequence + 1)
+        return True
+
+
+def reset_sequence(address: str):
+    """Forget the tracked sequence, i.e after a rejected or unconfirmed tx - it is re-read from the chain."""
+    with _lock:
+        _accounts.pop(address, None)
+
+
+def _tx_flags() -> List[str]:
+    flags = fee_tuner.tx_flags()
+    # broadcasting is done over RPC, the CLI only builds the tx
+    index = flags.index("--broadcast-mode")
+    del flags[index:index + 2]
+    return flags
+
+
+def build_signed_tx(kind: str, salt: str, exchange_rates: str, from_account: str,
+                    account_number: int, sequence: int, validator: Optional[str] = None) -> str:
+    """Base64 protobuf bytes of a signed aggregate-vote / aggregate-prevote tx."""
+    # the reserved sequence is passed to the generate step too, so --gas auto simulates the tx at that sequence
+    # rather than at the committed one while earlier txs of the account are still in the mempool
+    generate = [settings.symphonyd_path, "tx", "oracle", kind, salt, exchange_rates,
+                "--from", from_account, "--generate-only", "--output", "json",
+                "--account-number", str(account_number), "--sequence", str(sequence)] + _tx_flags()
+    if validator:
+        generate.append(validator)
+    with tempfile.TemporaryDirectory(prefix="oracle-tx-") as tmpdir:
+        unsigned_path = os.path.join(tmpdir, "unsigned.json")
+        signed_path = os.path.join(tmpdir, "signed.json")
+        with open(unsigned_path, "w") as f:
+            f.write(_run(generate))
+        signed = _run([settings.symphonyd_path, "tx", "sign", unsigned_path, "--from", from_account,
+                       "--chain-id", settings.chain_id, "--keyring-backend", settings.keyring_back_end,
+                       "--offline", "--account-number", str(account_number), "--sequence", str(sequence),
+                       "--output", "json"])
+        with open(signed_path, "w") as f:
+            f.write(signed)
+        return _run([settings.symphonyd_path, "tx", "encode", signed_path])
+
+
+@time_request('rpc')
+def broadcast_tx_bytes(tx_bytes: str, mode: Optional[str] = None) -> dict:
+    """Post base64 tx bytes to the RPC broadcast_tx_sync / broadcast_tx_async endpoint."""
+    mode = mode or settings.broadcast_mode
+    response = _session.post(settings.rpc_http_address, json={
+        "jsonrpc": "2.0", "id": 1, "method": f"broadcast_tx_{mode}", "params": {"tx": tx_bytes},
+    }, timeout=settings.http_timeout)
+    response.raise_for_status()
+    data = response.json()
+    if "error" in data:
+        raise BroadcastError(f"broadcast_tx_{mode} error: {data['error']}")
+    result = data["result"]
+    return {"txhash": result["hash"], "code": int(result.get("code", 0)), "raw_log": result.get("log", "")}
+
+
+def presign_oracle_tx(kind: str, salt: str, exchange_rates: str, from_address: str,
+                      validator: Optional[str] = None, offset: int = 0) -> Optional[SignedTx]:
+    """Sign an oracle tx to broadcast later, at offset txs after the next sequence of from_address.
+
+    The sequence isn't reserved: broadcast_oracle_tx only uses the bytes if it is the next one by then.
+    None if the tx couldn't be built."""
+    try:
+        address = resolve_address(from_address)
+        account_number, sequence = peek_sequence(address)
+        sequence += offset
+        tx_bytes = build_signed_tx(kind, salt, exchange_rates, from_address, account_number, sequence, validator)
+    except (BroadcastError, requests.RequestException, subprocess.TimeoutExpired, KeyError, ValueError) as e:
+        logger.warning(f"Failed to pre-sign {kind}: {e}")
+        return None
+    return SignedTx(kind, salt, exchange_rates, validator, address, sequence, tx_bytes)
+
+
+def broadcast_oracle_tx(kind: str, salt: str, exchange_rates: str, from_address: str,
+                        validator: Optional[str] = None, presigned: Optional[SignedTx] = None) -> dict:
+    """Build, sign and broadcast an oracle tx - the RPC equivalent of the symphonyd aggregate vote commands.
+
+    presigned is broadcast instead when it is this tx, signed at the account's next sequence."""
+    address = None
+    try:
+        address = resolve_address(from_address)
+        if (presigned is not None and presigned.matches(kind, salt, exchange_rates, validator, address)
+                and claim_sequence(address, presigned.sequence)):
+            sequence, tx_bytes = presigned.sequence, presigned.tx_bytes
+            metrics.METRIC_SPECULATION.labels('presigned').inc()
+        else:
+            if presigned is not None:
+                metrics.METRIC_SPECULATION.labels('resigned').inc()
+            account_number, sequence = next_sequence(address)
+            tx_bytes = build_signed_tx(kind, salt, exchange_rates, from_address, account_number, sequence, validator)
+        tx = broadcast_tx_bytes(tx_bytes)
+    except (BroadcastError, requests.RequestException, subprocess.TimeoutExpired, KeyError, ValueError) as e:
+        logger.error(f"Failed to broadcast {kind}: {e}")
+        metrics.METRIC_OUTBOUND_ERROR.labels('rpc').inc()
+        if address:
+            reset_sequence(address)
+        return {"error": str(e)}
+
+    if tx["code"] != 0:
+        logger.error(f"{kind} rejected by CheckTx with code {tx['code']}: {tx['raw_log']}")
+        # the sequence was not used (or was wrong) - re-read it before the next tx
+        reset_sequence(address)
+    logger.debug(f"Broadcast {kind} {tx['txhash']} at sequence {sequence} ({settings.broadcast_mode})")
+    tx["sender"] = address
+    return tx
+
@@ -0,0 +1,234 @@
+"""
+Confirmation of broadcast txs.
+
+Every broadcast tx hash is registered with the tracker and resolved exactly once, from its LCD tx query, into a
+TxResult (height, code, gas_used, raw_log, its prevote message if any). Whoever waits first polls all pending txs
+in one loop - one vote, a vote and prevote, or the txs of every validator in parallel - while the other waiters are
+woken as results come in. Polls are scheduled like the other chain waits: first at the estimated next block,
+then backing off from BLOCK_POLL_GUARD up to TX_WAIT without sleeping past a block. Results are kept for later consumers
+(tx checks, gas and fee learning, metrics), a tx that isn't indexed within BLOCK_WAIT_TIME + TX_RETRIES * TX_WAIT
+resolves to None. With MEMPOOL_WATCH, txs not indexed after a block was produced since their broadcast (or after
+MEMPOOL_DROP_MIN_AGE) are also checked against the RPC mempool (see mempool_watcher.py), and a dropped tx
+resolves straight away with DROPPED_CODE instead of waiting out that timeout.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import block_clock
+import grpc_client
+import metrics
+from config import settings
+from http_client import lcd_get
+from mempool_watcher import MempoolWatcher
+
+logger = logging.getLogger(__name__)
+
+# code of the result of a tx that left the mempool without being committed
+DROPPED_CODE = -1
+
+
+@dataclass(frozen=True)
+class TxResult:
+    txhash: str
+    kind: str
+    height: int
+    code: int
+    gas_used: int
+    gas_wanted: int
+    raw_log: str
+    registered_at: float
+    resolved_at: float
+    broadcast_height: Optional[int] = None  # latest height seen when the tx was broadcast
+    prevote_hash: Optional[str] = None  # hash and validator of the tx's aggregate prevote message, if it has one
+    prevote_validator: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.code == 0
+
+    @property
+    def dropped(self) -> bool:
+        return self.code == DROPPED_CODE
+
+    @property
+    def inclusion_delay(self) -> Optional[int]:
+        """Blocks from broadcast to inclusion, 1 being the next block."""
+        if self.broadcast_height is None or self.dropped:
+            return None
+        return self.height - self.broadcast_height
+
+
+@dataclass
+class _PendingTx:
+    kind: str
+    registered_at: float
+    deadline: float
+    broadcast_height: Optional[int] = None
+
+
+def parse_tx_response(txhash: str, kind: str, registered_at: float, response: dict,
+                      broadcast_height: Optional[int] = None) -> TxResult:
+    tx_response = response["tx_response"]
+    prevote = next((message for message in (response.get("tx") or {}).get("body", {}).get("messages", [])
+                    if message.get("@type", "").endswith(".MsgAggregateExchangeRatePrevote")), {})
+    return TxResult(
+        txhash=txhash,
+        kind=kind,
+        height=int(tx_response["height"]),
+        code=int(tx_response.get("code", 0)),
+        gas_used=int(tx_response.get("gas_used", 0)),
+        gas_wanted=int(tx_response.get("gas_wanted", 0)),
+        raw_log=tx_response.get("raw_log", ""),
+        registered_at=registered_at,
+        resolved_at=time.time(),
+        broadcast_height=broadcast_height,
+        prevote_hash=prevote.get("hash"),
+        prevote_validator=prevote.get("validator"),
+    )
+
+
+class TxTracker:
+    def __init__(self, cache_size: int = 256):
+        self.cache_size = cache_size
+        self._pending: Dict[str, _PendingTx] = {}
+        self._results: "OrderedDict[str, Optional[TxResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._resolved = threading.Condition(self._lock)
+        self._poller = threading.Lock()  # held by the thread polling for everyone
+        self._backoff = 0.0
+        self._first_poll = True
+        self._block_due = False  # a block may have been committed since the last registration
+        self.watcher = MempoolWatcher()
+
+    def register(self, txhash: str, kind: str = "tx", timeout: Optional[float] = None,
+                 broadcast_height: Optional[int] = None):
+        """Start tracking a broadcast tx."""
+        if timeout is None:
+            timeout = settings.max_block_confirm_wait_time + settings.tx_indexer_retries * settings.tx_indexer_wait
+        now = time.time()
+        with self._lock:
+            if txhash in self._pending or txhash in self._results:
+                return
+            self._pending[txhash] = _PendingTx(kind, now, now + timeout, broadcast_height)
+            # a new tx can't be in a block before the next one
+            self._backoff = settings.block_poll_guard
+            self._first_poll = True
+            self._block_due = False
+        logger.debug("Tracking %s %s", kind, txhash)
+
+    def result(self, txhash: str) -> Optional[TxResult]:
+        """Resolved result of txhash, None if it is pending, unknown or was never indexed."""
+        with self._lock:
+            return self._results.get(txhash)
+
+    def wait(self, txhashes: Iterable[str]) -> Dict[str, Optional[TxResult]]:
+        """Block until every tx in txhashes is resolved or timed out, and return their results."""
+        txhashes = list(txhashes)
+        while True:
+            with self._lock:
+                if not any(txhash in self._pending for txhash in txhashes):
+                    return {txhash: self._results.get(txhash) for txhash in txhashes}
+            if self._poller.acquire(blocking=False):
+                try:
+                    self._poll_round()
+                finally:
+                    self._poller.release()
+            else:
+                with self._resolved:
+                    self._resolved.wait(timeout=settings.tx_indexer_wait)
+
+    def _next_delay(self) -> float:
+        with self._lock:
+            deadline = min((pending.deadline for pending in self._pending.values()), default=time.time())
+            if self._first_poll:
+                self._first_poll = False
+                delay = block_clock.estimator.delay_until_next_block(default=settings.tx_indexer_wait)
+            else:
+                delay = min(self._backoff,
+                            block_clock.estimator.delay_until_next_block(default=settings.tx_indexer_wait))
+                self._backoff = min(self._backoff * 2, settings.tx_indexer_wait)
+        return max(0.0, min(delay, deadline - time.time()))
+
+    def _poll_round(self):
+        time.sleep(self._next_delay())
+        with self._lock:
+            pending = dict(self._pending)
+        block_due = {txhash: self._block_may_have_passed(tx) for txhash, tx in pending.items()}
+        if any(block_due.values()) and not self._block_due:
+            # index polling backs off from the block on, not from the mempool checks before it
+            self._block_due = True
+            self._backoff = settings.block_poll_guard
+        resolved = {}
+        for txhash, tx in pending.items():
+            result = self._fetch(txhash, tx) if block_due[txhash] else None
+            if result is not None:
+                resolved[txhash] = result
+            elif time.time() >= tx.deadline:
+                logger.error("%s %s not indexed after %.2fs", tx.kind, txhash, time.time() - tx.registered_at)
+                resolved[txhash] = None
+
+        if settings.mempool_watch:
+            # only txs whose indexer lookup just came back empty, after a block they could have been in
+            unresolved = [txhash for txhash, tx in pending.items()
+                          if txhash not in resolved and block_due[txhash] and self._may_be_dropped(tx)]
+            for txhash, reason in self.watcher.check(unresolved).items():
+                tx = pending[txhash]
+                logger.error("%s %s %s after %.2fs", tx.kind, txhash, reason, time.time() - tx.registered_at)
+                metrics.METRIC_TX_DROPPED.labels(tx.kind).inc()
+                resolved[txhash] = TxResult(txhash=txhash, kind=tx.kind, height=0, code=DROPPED_CODE, gas_used=0,
+                                            gas_wanted=0, raw_log=reason, registered_at=tx.registered_at,
+                                            resolved_at=time.time(), broadcast_height=tx.broadcast_height)
+
+        with self._resolved:
+            for txhash, result in resolved.items():
+                self._pending.pop(txhash, None)
+                self.watcher.forget(txhash)
+                self._results[txhash] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+            self._resolved.notify_all()
+
+        for result in resolved.values():
+            if result is not None and not result.dropped:
+                metrics.METRIC_TX_CONFIRM_TIME.labels(result.kind).observe(result.resolved_at - result.registered_at)
+                metrics.METRIC_TX_GAS_USED.labels(result.kind).set(result.gas_used)
+                logger.debug("%s %s resolved at %s with code %s after %.2fs", result.kind, result.txhash, result.height,
+                             result.code, result.resolved_at - result.registered_at)
+
+    @staticmethod
+    def _block_may_have_passed(tx: _PendingTx) -> bool:
+        """False while the tx can't be in a block yet - early rounds only check the mempool."""
+        estimator = block_clock.estimator
+        if tx.broadcast_height is None or estimator.height is None or estimator.height > tx.broadcast_height:
+            return True
+        next_block_at = estimator.next_block_at()
+        return next_block_at is None or time.time() >= next_block_at
+
+    @staticmethod
+    def _may_be_dropped(tx: _PendingTx) -> bool:
+        """True once a block was produced after the tx's broadcast, or MEMPOOL_DROP_MIN_AGE has passed."""
+        height = block_clock.estimator.height
+        if tx.broadcast_height is not None and height is not None and height > tx.broadcast_height:
+            return True
+        return time.time() - tx.registered_at >= settings.mempool_drop_min_age
+
+    def _fetch(self, txhash: str, tx: _PendingTx) -> Optional[TxResult]:
+        try:
+            if grpc_client.serves("tx"):
+                response = grpc_client.get_tx(txhash) or {}
+            else:
+                response = lcd_get(f"/cosmos/tx/v1beta1/txs/{txhash}").json()
+            if "tx_response" in response:
+                return parse_tx_response(txhash, tx.kind, tx.registered_at, response, tx.broadcast_height)
+            logger.debug("%s %s not indexed yet: %s", tx.kind, txhash, response)
+        except Exception as e:
+            logger.warning("Querying %s %s failed: %s", tx.kind, txhash, e)
+            metrics.METRIC_OUTBOUND_ERROR.labels('lcd').inc()
+        return None
+
+
+tracker = TxTracker()
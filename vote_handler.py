@@ -1,16 +1,26 @@
+import concurrent.futures
+import contextvars
+import functools
 import logging
 import time
 import hashlib
-import requests
+
+import block_clock
+import ha
+import metrics
 from hash_handler import get_aggregate_vote_hash
-from config import *
-from blockchain import get_my_current_prevote_hash, aggregate_exchange_rate_prevote, aggregate_exchange_rate_vote, \
-    get_tx_data, get_latest_block, wait_for_block
+from log_pipeline import log_context
+from config import settings
+from fee_tuner import tuner as fee_tuner
+from prevote_tracker import tracker as prevote_tracker
+from tx_broadcast import reset_sequence
+from tx_tracker import tracker as tx_tracker
+from blockchain import get_my_current_prevote_hash, aggregate_exchange_rate_prevote, aggregate_exchange_rate_vote
 
 logger = logging.getLogger(__name__)
 
 
-def process_votes(prices, last_price, last_salt, last_hash, epoch):
+def process_votes(prices, last_price, last_salt, last_hash, epoch, identity=None, prepared=None):
 
     """Process votes for a given epoch.
 
@@ -23,11 +33,16 @@ def process_votes(prices, last_price, last_salt, last_hash, epoch):
             last_salt (str): Salt used in the last pre_vote
             last_hash (str): Hash from the last pre_vote
             epoch (int): Current epoch number.
+            identity (ValidatorIdentity, optional): Validator to vote for, defaults to the configured validator.
+            prepared (tuple, optional): (salt, hash, pre-signed prevote or None) of the prevote, if prepared ahead of
+                the epoch boundary.
 
         Returns:
             tuple: (this_price, this_salt, this_hash)
         """
 
+    identity = identity or settings.validators[0]
+
     # set initial states
     this_price = ""
     this_hash = ""
@@ -38,35 +53,33 @@ def process_votes(prices, last_price, last_salt, last_hash, epoch):
 
     # set parameters for voting
     this_price = prices
-    this_salt = get_salt(str(time.time()))
-    # create hash to match what will be submitted in prevote
-    this_hash = get_aggregate_vote_hash(this_salt, this_price, valoper)
+    # salt and hash to match what will be submitted in prevote
+    this_salt, this_hash, presigned = prepared or (*prepare_prevote(this_price, identity), None)
 
-    logger.info(f"Start voting on epoch {epoch + 1}")
+    logger.info("Start voting on epoch %s for %s", epoch + 1, identity.valoper)
 
-    my_current_prevotes = get_my_current_prevote_hash()
+    my_current_prevotes, hash_is_local = get_current_prevote_hash(identity.valoper, epoch)
     hash_match_flag = check_hash_match(last_hash, my_current_prevotes)
 
     # determine which args will be needed
-    if feeder:
-        from_account = feeder
-    elif validator:
-        from_account = validator
-    else:
+    from_account = identity.from_account
+    if not from_account:
         logger.error("Configure feeder or validator_acc for submitting tx")
+        return this_price, this_salt, this_hash
 
-    while retry <= max_retry_per_epoch: #retry loop
+    while retry <= settings.max_retry_per_epoch: #retry loop
+        if ha.lease_lost():
+            logger.error("HA lease lost, not voting for %s", identity.valoper)
+            break
         if hash_match_flag and not voted and not prevoted:  # hash matches and neither vote nor pre vote - perform both
             logger.info("Broadcast votes/prevotes...")
             # get together the vote arguments
-            vote_args = (last_salt, last_price, from_account, validator) if feeder else (
-            last_salt, last_price, from_account)
-            prevote_args = (this_salt, this_price, from_account, validator) if feeder else (
-            this_salt, this_price, from_account)
+            vote_args = get_tx_args(identity, last_salt, last_price)
+            prevote_args = get_tx_args(identity, this_salt, this_price)
 
-            vote_err, pre_vote_err = perform_vote_and_prevote(vote_args, prevote_args)  # perform the votes
+            vote_err, pre_vote_err = perform_vote_and_prevote(vote_args, prevote_args, presigned)  # perform the votes
 
-            METRIC_VOTES.inc()  # increment this regardless of vote outcome
+            metrics.METRIC_VOTES.inc()  # increment this regardless of vote outcome
             if not vote_err and not pre_vote_err:  # if both votes succeed, no need to continue in loop
                 return this_price, this_salt, this_hash
 
@@ -78,29 +91,140 @@ def process_votes(prices, last_price, last_salt, last_hash, epoch):
                 prevoted = True  # this is so we don't redo prevote if only the vote fails
                 logger.error("Prevote succeeded, but vote failed")
 
+            if vote_err and pre_vote_err and hash_is_local:
+                # the chain may disagree with what we recorded - check the prevote there before retrying. Once this
+                # epoch's prevote is in, the chain holds that one, so it can't tell whether last_hash could be revealed
+                hash_match_flag, hash_is_local = recheck_hash_match(identity.valoper, last_hash)
+
         elif hash_match_flag and not voted: #if hash matches and not voted, vote
             logger.info("Broadcast votes only...")
-            vote_args = (last_salt, last_price, from_account, validator) if feeder else (
-                last_salt, last_price, from_account)
+            vote_args = get_tx_args(identity, last_salt, last_price)
             vote_err = perform_vote_only(vote_args)
             if not vote_err:
                 return this_price, this_salt, this_hash
+            if hash_is_local and not prevoted:
+                hash_match_flag, hash_is_local = recheck_hash_match(identity.valoper, last_hash)
 
-        else: #if either hash doesn't match last or not prevoted do prevotes only
+        elif not prevoted: #if either hash doesn't match last or not prevoted do prevotes only
             logger.info("Broadcast prevotes only...")
-            prevote_args = (this_salt, this_price, from_account, validator) if feeder else (
-                this_salt,this_price, from_account)
-            pre_vote_err = perform_prevote_only(prevote_args)
+            prevote_args = get_tx_args(identity, this_salt, this_price)
+            pre_vote_err = perform_prevote_only(prevote_args, presigned)
             if not pre_vote_err:
                 return this_price, this_salt, this_hash
 
+        else:  # prevoted, and last epoch's prevote can't be revealed - nothing left to do this epoch
+            return this_price, this_salt, this_hash
+
         # this is only reachable if there have been errors in either vote or prevote
         retry = retry + 1
-        if retry <= max_retry_per_epoch:
-            logger.error(f"retrying vote/prevote {retry} of {max_retry_per_epoch} ")
+        if retry <= settings.max_retry_per_epoch:
+            logger.error("retrying vote/prevote %s of %s ", retry, settings.max_retry_per_epoch)
     return this_price, this_salt, this_hash
 
 
+def process_votes_for_validators(prices, vote_states, epoch, identities=None, prepared=None):
+    """Process votes for every configured validator from one set of prices.
+
+        Prices are fetched once per epoch by the caller; salt, hash and the vote/prevote txs are
+        then built and submitted for each validator in parallel.
+
+        Args:
+            prices (str): Current prices to vote on.
+            vote_states (dict): valoper -> (last_price, last_salt, last_hash) from the previous epoch.
+            epoch (int): Current epoch number.
+            identities (tuple, optional): ValidatorIdentity list, defaults to settings.validators.
+            prepared (dict, optional): valoper -> (salt, hash, pre-signed prevote or None) of prevotes prepared ahead
+                of the epoch boundary.
+
+        Returns:
+            dict: valoper -> (this_price, this_salt, this_hash)
+        """
+    identities = identities or settings.validators
+    prepared = prepared or {}
+    if len(identities) == 1:
+        identity = identities[0]
+        last_price, last_salt, last_hash = vote_states.get(identity.valoper, ("", "", ""))
+        return {identity.valoper: process_votes(prices, last_price, last_salt, last_hash, epoch, identity,
+                                                prepared.get(identity.valoper))}
+
+    new_states = dict(vote_states)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(identities)) as executor:
+        # each worker runs in a copy of this context, so its records keep the epoch they belong to, and are tagged
+        # with their validator
+        futures = {
+            identity.valoper: executor.submit(contextvars.copy_context().run, process_validator_votes, prices,
+                                              *vote_states.get(identity.valoper, ("", "", "")),
+                                              epoch, identity, prepared.get(identity.valoper))
+            for identity in identities
+        }
+        for valoper, future in futures.items():
+            try:
+                new_states[valoper] = future.result()
+            except Exception as e:
+                logger.exception("Error processing votes for %s: %s", valoper, e)
+    return new_states
+
+
+def process_validator_votes(prices, last_price, last_salt, last_hash, epoch, identity, prepared=None):
+    """process_votes with the records it logs tagged (and sampled) per validator."""
+    with log_context(validator=identity.valoper):
+        return process_votes(prices, last_price, last_salt, last_hash, epoch, identity, prepared)
+
+
+def prepare_prevote(prices, identity):
+    """Salt and hash of a prevote of prices for identity.
+
+        Returns:
+            tuple: (salt, hash)
+        """
+    salt = get_salt(f"{time.time()}{identity.valoper}")
+    return salt, get_aggregate_vote_hash(salt, prices, identity.valoper)
+
+
+def get_current_prevote_hash(valoper, epoch):
+    """Hash of our prevote to reveal in epoch - from the prevote tracker if it knows it, otherwise from the LCD.
+
+        Returns:
+            tuple: (prevote_hash, is_local)
+        """
+    local_hash = prevote_tracker.committed_hash(valoper, epoch)
+    if local_hash is not None:
+        metrics.METRIC_PREVOTE_LOOKUPS.labels('local').inc()
+        return local_hash, True
+    metrics.METRIC_PREVOTE_LOOKUPS.labels('chain').inc()
+    return get_my_current_prevote_hash(valoper), False
+
+
+def recheck_hash_match(valoper, last_hash):
+    """Drop the tracked prevote of valoper and compare last_hash with the prevote on chain instead."""
+    prevote_tracker.invalidate(valoper)
+    metrics.METRIC_PREVOTE_LOOKUPS.labels('chain').inc()
+    return check_hash_match(last_hash, get_my_current_prevote_hash(valoper)), False
+
+
+def record_confirmed_prevote(result):
+    """Track the prevote committed by a confirmed tx, in the epoch of its block. Without the message or the epoch
+    the hash is read from the chain at the next vote instead."""
+    if result is None or not result.prevote_hash or not result.prevote_validator:
+        return
+    epoch = prevote_tracker.epoch_at(result.height)
+    if epoch is None:
+        prevote_tracker.invalidate(result.prevote_validator)
+        return
+    prevote_tracker.record_confirmed(result.prevote_validator, result.prevote_hash, epoch)
+
+
+def get_tx_args(identity, salt, price):
+    """Arguments for aggregate_exchange_rate_vote/prevote - the validator is only passed when voting via a feeder:
+    VALIDATOR_ADDRESS for the validator configured on its own, and for VALIDATORS entries their validator account,
+    or the valoper when the entry has none."""
+    if not identity.feeder:
+        return salt, price, identity.from_account
+    if settings.validator_set:
+        return salt, price, identity.from_account, identity.validator or identity.valoper
+    return salt, price, identity.from_account, identity.validator
+
+
 def execute_transaction(func, tx_type, *args):
     """Execute a transaction and handle errors.
 
@@ -115,12 +239,19 @@ def execute_transaction(func, tx_type, *args):
         Returns:
             Bool: The error_flag returned by handle_tx_return
         """
-    tx_return = func(*args)
+    tx_return = broadcast(func, *args)
     err = handle_tx_return(tx=tx_return, tx_type=tx_type)
     return err
 
 
-def perform_vote_and_prevote(vote_args, prevote_args):
+def broadcast(func, *args, **kwargs):
+    """func(*args, **kwargs) - unless the HA lease was lost since voting started, then nothing is sent."""
+    if ha.lease_lost():
+        return {"error": "HA lease lost, not broadcasting"}
+    return func(*args, **kwargs)
+
+
+def perform_vote_and_prevote(vote_args, prevote_args, presigned=None):
     """Perform both a vote and a prevote transaction.
 
         This function executes a vote transaction, and if it doesn't fail, executes a prevote transaction using the provided arguments.
@@ -129,27 +260,38 @@ def perform_vote_and_prevote(vote_args, prevote_args):
         Args:
             vote_args (tuple): Arguments for the vote transaction.
             prevote_args (tuple): Arguments for the prevote transaction.
+            presigned (SignedTx, optional): The prevote signed ahead of the epoch boundary.
 
         Returns:
             tuple: A tuple containing error flags from the vote and prevote transactions.
         """
-    vote_err = execute_transaction(aggregate_exchange_rate_vote, "vote", *vote_args)
-    pre_vote_err = execute_transaction(aggregate_exchange_rate_prevote, "pre_vote", *prevote_args)
+    if settings.broadcast_mode == "cli":
+        # symphonyd reads the account sequence from committed state, so the prevote has to wait for the vote's block
+        vote_err = execute_transaction(aggregate_exchange_rate_vote, "vote", *vote_args)
+        pre_vote_err = execute_transaction(aggregate_exchange_rate_prevote, "pre_vote", *prevote_args)
+        return vote_err, pre_vote_err
+
+    # sequences are tracked locally when broadcasting over RPC - send both back to back and confirm them together
+    vote_tx = broadcast(aggregate_exchange_rate_vote, *vote_args)
+    prevote_tx = broadcast(aggregate_exchange_rate_prevote, *prevote_args, presigned=presigned)
+    vote_err, pre_vote_err = confirm_transactions([(vote_tx, "vote"), (prevote_tx, "pre_vote")])
     return vote_err, pre_vote_err
 
 
-def perform_prevote_only(prevote_args):
+def perform_prevote_only(prevote_args, presigned=None):
     """Perform only a prevote transaction.
 
     This function executes a prevote transaction using the provided arguments.
 
     Args:
         prevote_args (tuple): Arguments for the prevote transaction.
+        presigned (SignedTx, optional): The prevote signed ahead of the epoch boundary.
 
     Returns:
         Bool: Error flag from pre_vote tx
     """
-    return execute_transaction(aggregate_exchange_rate_prevote, "pre_vote", *prevote_args)
+    return execute_transaction(functools.partial(aggregate_exchange_rate_prevote, presigned=presigned), "pre_vote",
+                               *prevote_args)
 
 
 def perform_vote_only(vote_args):
@@ -166,73 +308,62 @@ def perform_vote_only(vote_args):
     return execute_transaction(aggregate_exchange_rate_vote, "vote", *vote_args)
 
 
-def wait_for_tx_indexed(tx_hash, max_attempts=tx_indexer_retries, delay_between_attempts=tx_indexer_wait):
-    """
-    Wait for a transaction to be indexed by LCD.
-    Returns (success, response_time, final_response)
-
-    If tx_hash is None, immediately returns failure without waiting.
-    """
-    if tx_hash is None:
-        logger.warning("Transaction hash is None, skipping indexing wait")
-        return False, 0, None
-
-    logger.info(f"Waiting for tx {tx_hash} to be indexed...")
-    start_time = time.time()
-
-    for attempt in range(max_attempts):
-        try:
-            response = requests.get(
-                f"{lcd_address}/cosmos/tx/v1beta1/txs/{tx_hash}",
-                timeout=http_timeout
-            ).json()
-
-            if "tx_response" in response:
-                elapsed = time.time() - start_time
-                logger.debug(f"TX {tx_hash} indexed after {elapsed:.2f}s on attempt {attempt + 1}")
-                return True, elapsed, response
-
-            logger.debug(f"Attempt {attempt + 1}: TX not indexed yet. Response: {response}")
+def handle_tx_return(tx, tx_type):
+    """Handle the return of a transaction and check its status."""
+    return confirm_transactions([(tx, tx_type)])[0]
 
-        except Exception as e:
-            logger.error(f"Attempt {attempt + 1} failed: {str(e)}")
 
-        time.sleep(delay_between_attempts)
+def confirm_transactions(txs):
+    """Wait for broadcast txs to be confirmed together.
 
-    total_time = time.time() - start_time
-    logger.error(f"TX {tx_hash} not indexed after {total_time:.2f}s and {max_attempts} attempts")
-    return False, total_time, None
+        Txs rejected at broadcast fail straight away, the others are registered with the tx tracker, which polls
+        them all at once and resolves each one a single time.
 
-def handle_tx_return(tx, tx_type):
-    """Handle the return of a transaction and check its status."""
-    err_flag = False
-    tx_hash = tx.get("txhash")
+        Args:
+            txs (list): (tx, tx_type) pairs, tx being the broadcast result.
 
-    # First wait for block
-    if not wait_for_block():
-        logger.error(f"Failed waiting for block confirmation for tx: {tx_hash}")
+        Returns:
+            list: An error flag per tx, in order.
+        """
+    errors = [broadcast_failed(tx, tx_type) for tx, tx_type in txs]
+    pending = [tx["txhash"] for (tx, tx_type), err in zip(txs, errors) if not err]
+    for (tx, tx_type), err in zip(txs, errors):
+        if not err:
+            tx_tracker.register(tx["txhash"], tx_type, broadcast_height=block_clock.estimator.height)
+    for result in tx_tracker.wait(pending).values():
+        if result is not None and result.inclusion_delay is not None:
+            fee_tuner.observe_inclusion(result.inclusion_delay)
+
+    for index, (tx, tx_type) in enumerate(txs):
+        if not errors[index]:
+            with log_context(tx=tx["txhash"]):
+                check_error_flag, check_error_msg = check_tx(tx, tx_type)
+                if check_error_flag:
+                    logger.error("%s failed or failed to return data: %s", tx_type, check_error_msg)
+                    errors[index] = True
+                elif tx_type == "pre_vote":
+                    record_confirmed_prevote(tx_tracker.result(tx["txhash"]))
+        if errors[index] and tx.get("sender"):
+            # an RPC broadcast tx that didn't make it may leave the tracked sequence wrong
+            reset_sequence(tx["sender"])
+    return errors
+
+
+def broadcast_failed(tx, tx_type):
+    """True if the tx never made it into the mempool - no hash, or rejected by CheckTx."""
+    if tx.get("error") or not tx.get("txhash"):
+        logger.error("%s broadcast failed: %s", tx_type, tx.get('error', 'no txhash returned'))
         return True
-
-    # Then wait for indexing
-    indexed, index_time, response = wait_for_tx_indexed(tx_hash)
-    if not indexed:
-        logger.error(f"Transaction {tx_hash} failed to index within timeout")
+    if int(tx.get("code", 0)) != 0:
+        logger.error("%s %s rejected with code %s: %s", tx_type, tx['txhash'], tx['code'], tx.get('raw_log'))
         return True
-
-    logger.debug(f"Transaction {tx_hash} indexed in {index_time:.2f}s")
-
-    # Now check the transaction
-    vote_check_error_flag, vote_check_error_msg = check_tx(tx, tx_type)
-    if vote_check_error_flag:
-        logger.error(f"{tx_type} failed or failed to return data: {vote_check_error_msg}")
-        err_flag = True
-    return err_flag
+    return False
 
 
 def check_tx(tx, tx_type="tx"):
     """Check the status of a transaction.
 
-    This function retrieves the transaction data and verifies its status.
+    This function reads the result the tx tracker resolved for the transaction and verifies its status.
 
     Args:
         tx (dict): The transaction object returned from the blockchain.
@@ -249,20 +380,17 @@ def check_tx(tx, tx_type="tx"):
     """
     try:
         tx_hash = tx["txhash"]
-        tx_data = get_tx_data(tx_hash)
-        try:
-            tx_height = int(tx_data["tx_response"]["height"])
-            tx_code = int(tx_data["tx_response"]["code"])
-        except Exception as e:
-            logger.error(f"Error getting {tx_type} response from endpoint for {tx_hash}: {e}")
-            return True, f"Failed to parse transaction response: {e}"
-        if tx_code != 0 or tx_code is None:
-            logger.error(f"error in submitting {tx_type}, code returned non zero")
+        result = tx_tracker.result(tx_hash)
+        if result is None:
+            logger.error("No %s result for %s, it was not indexed in time", tx_type, tx_hash)
+            return True, f"{tx_type} {tx_hash} not indexed"
+        if result.code != 0:
+            logger.error("error in submitting %s, code returned non zero: %s %s", tx_type, result.code, result.raw_log)
             return True, f"{tx_type} error"
-        logger.info(f"{tx_type} at {tx_height} confirmed success")
+        logger.info("%s at %s confirmed success", tx_type, result.height)
         return False, None
     except Exception as e:
-        logger.error(f"Error while checking tx_hash for {tx_type}: {e}")
+        logger.error("Error while checking tx_hash for %s: %s", tx_type, e)
         return True, f" Exception:{e}"
 
 
@@ -276,7 +404,7 @@ def check_hash_match(last_hash, my_current_prevotes):
         return True
 
     else:
-        logger.info(f"Hash failed to match {last_hash} vs {my_current_prevotes} ")
+        logger.info("Hash failed to match %s vs %s ", last_hash, my_current_prevotes)
         return False
 
 